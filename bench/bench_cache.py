@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               bench_cache.py
+===============================================================================
+
+    Huella en la caché de páginas de cada uso de caché de LocalCopy
+
+    Para cada modo (normal, dontneed, direct) crea un fichero de origen,
+    lo saca de la caché, y mide la variación de Cached en /proc/meminfo
+    tras copiarlo. La medida es de todo el sistema: conviene ejecutarlo
+    en una máquina tranquila y repetirlo.
+
+    uso: python3 bench/bench_cache.py [--size MiB] [--dir DIR]
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from smblib.localcopy import LocalCopy  # noqa: E402
+
+
+def cached():
+    """
+    cached Caché de páginas del sistema
+
+    Returns:
+        int: bytes en caché según /proc/meminfo
+    """
+    with open('/proc/meminfo') as file:
+        for _line in file:
+            if _line.startswith('Cached:'):
+                return int(_line.split()[1]) * 1024
+    return 0
+
+
+def evict(path):
+    _fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fdatasync(_fd)
+        os.posix_fadvise(_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(_fd)
+
+
+def make_source(path, size):
+    _block = os.urandom(1 << 20)
+    with open(str(path), 'wb') as file:
+        for _ in range(size >> 20):
+            file.write(_block)
+    evict(path)
+
+
+def bench(mode, root, size):
+    _src = root / ("src-" + mode)
+    _dst = root / ("dst-" + mode)
+    make_source(_src, size)
+    os.sync()
+    _before = cached()
+    _start = time.perf_counter()
+    _copy = LocalCopy(cache=mode)
+    _method = _copy.copy_file(_src, _dst)
+    _copy.flush()
+    os.sync()
+    _seconds = time.perf_counter() - _start
+    _after = cached()
+    _src.unlink()
+    _dst.unlink()
+    return {
+        'mode': mode,
+        'method': _method,
+        'bytes': size,
+        'seconds': _seconds,
+        'mib_s': size / _seconds / (1 << 20),
+        'cached_delta_mib': (_after - _before) / (1 << 20)
+    }
+
+
+def main(argv):
+    _parser = argparse.ArgumentParser(description=__doc__.split('\n')[8])
+    _parser.add_argument('--size', type=int, default=512, help="MiB")
+    _parser.add_argument('--dir', default=None)
+    _args = _parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=_args.dir) as tmp:
+        _results = [
+            bench(mode, Path(tmp), _args.size << 20)
+            for mode in LocalCopy.Caches
+        ]
+    print(json.dumps(_results, indent=4))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
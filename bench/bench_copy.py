@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               bench_copy.py
+===============================================================================
+
+    Caudal del motor de copia local frente a rsync
+
+    Copia completa de dos árboles sintéticos, muchos ficheros pequeños y
+    pocos ficheros grandes, con LocalCopy y con rsync -a (si está
+    instalado). El destino está en el mismo sistema de ficheros que el
+    origen salvo que se indique otro directorio con --target.
+
+    uso: python3 bench/bench_copy.py [--small N] [--large N]
+                                     [--size MiB] [--target DIR]
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from smblib.journal import scan  # noqa: E402
+from smblib.localcopy import LocalCopy  # noqa: E402
+
+
+def make_small(root, nfiles, size=4096):
+    """
+    make_small Árbol de ficheros pequeños, 100 por directorio
+    """
+    for index in range(nfiles):
+        _dir = root / ("d%04d" % (index // 100))
+        _dir.mkdir(parents=True, exist_ok=True)
+        (_dir / ("f%06d" % index)).write_bytes(os.urandom(size))
+
+
+def make_large(root, nfiles, size):
+    root.mkdir(parents=True, exist_ok=True)
+    _block = os.urandom(1 << 20)
+    for index in range(nfiles):
+        with (root / ("big%02d" % index)).open('wb') as file:
+            for _ in range(size >> 20):
+                file.write(_block)
+
+
+def drop_target(target):
+    shutil.rmtree(str(target), ignore_errors=True)
+
+
+def time_local(source, target):
+    _copy = LocalCopy()
+    _start = time.perf_counter()
+    target.mkdir()
+    _paths = sorted(scan(source))
+    _result = _copy.copy(source, target, _paths)
+    os.sync()
+    _seconds = time.perf_counter() - _start
+    return _seconds, _result['bytes'], dict(_copy.used)
+
+
+def time_rsync(source, target):
+    _start = time.perf_counter()
+    subprocess.run(["rsync", "-aH", f"{source}/", f"{target}/"], check=True)
+    os.sync()
+    return time.perf_counter() - _start
+
+
+def bench(name, source, target):
+    _res = {'tree': name}
+    _seconds, _bytes, _methods = time_local(source, target)
+    _res.update(bytes=_bytes,
+                local_seconds=_seconds,
+                local_mib_s=_bytes / _seconds / (1 << 20),
+                methods=_methods)
+    drop_target(target)
+    if shutil.which("rsync") is not None:
+        _seconds = time_rsync(source, target)
+        _res.update(rsync_seconds=_seconds,
+                    rsync_mib_s=_bytes / _seconds / (1 << 20))
+        drop_target(target)
+    return _res
+
+
+def main(argv):
+    _parser = argparse.ArgumentParser(description=__doc__.split('\n')[8])
+    _parser.add_argument('--small', type=int, default=20000)
+    _parser.add_argument('--large', type=int, default=4)
+    _parser.add_argument('--size', type=int, default=256, help="MiB")
+    _parser.add_argument('--target', default=None)
+    _args = _parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _tmp = Path(tmp)
+        _target = Path(_args.target or tmp) / "target"
+        make_small(_tmp / "small", _args.small)
+        make_large(_tmp / "large", _args.large, _args.size << 20)
+
+        _results = [
+            bench("small", _tmp / "small", _target),
+            bench("large", _tmp / "large", _target)
+        ]
+    print(json.dumps(_results, indent=4))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
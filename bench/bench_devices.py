@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                              bench_devices.py
+===============================================================================
+
+    Coste de leer la capa de dispositivos
+
+    Para N discos compara la lectura de un árbol /sys de prueba
+    (SysBlockDevices sobre fakesysfs), con y sin base de datos de udev,
+    con la de un fichero JSON como el de lsblk (fakelsblk). Si lsblk está
+    instalado mide además su ejecución real, el coste de fork+exec y
+    análisis del JSON que evita SysBlockDevices.
+
+    uso: python3 bench/bench_devices.py [--disks 1 10 100] [--runs N]
+
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.fakelsblk import FakeBlockDevices, make_lsblk  # noqa: E402
+from bench.fakelsblk import make_uuid, make_wwn  # noqa: E402
+from bench.fakesysfs import make_sysfs  # noqa: E402
+from smblib.devices import Devices  # noqa: E402
+from smblib.sysblock import SysBlockDevices  # noqa: E402
+
+
+def _median_us(func, runs):
+    _times = []
+    for _ in range(runs):
+        _start = time.perf_counter()
+        func()
+        _times.append(time.perf_counter() - _start)
+    return statistics.median(_times) * 1e6
+
+
+def _lookups(source, ndisks):
+    """
+    _lookups Lectura y búsqueda de todos los discos y particiones
+    """
+    _devices = Devices(source)
+    for index in range(ndisks):
+        assert _devices.get_disk_wwn(make_wwn(index)) is not None
+        assert _devices.get_partition_uuid(make_uuid(index)) is not None
+
+
+def bench(root, ndisks, runs):
+    _sysfs = root / "sysfs"
+    _noudev = root / "noudev"
+    _lsblk = root / "lsblk.json"
+    make_sysfs(_sysfs, ndisks)
+    make_sysfs(_noudev, ndisks, udev=False)
+    make_lsblk(_lsblk, ndisks)
+    return {
+        'disks': ndisks,
+        'sysfs_us': _median_us(lambda: SysBlockDevices(_sysfs), runs),
+        'sysfs_noudev_us': _median_us(lambda: SysBlockDevices(_noudev), runs),
+        'json_us': _median_us(lambda: FakeBlockDevices(_lsblk), runs),
+        'sysfs_lookups_us': _median_us(
+            lambda: _lookups(lambda: SysBlockDevices(_sysfs), ndisks), runs),
+        'json_lookups_us': _median_us(
+            lambda: _lookups(lambda: FakeBlockDevices(_lsblk), ndisks), runs)
+    }
+
+
+def lsblk(runs):
+    """
+    lsblk Ejecución real de lsblk --json frente a SysBlockDevices("/")
+    """
+    if shutil.which("lsblk") is None:
+        return None
+
+    def _run():
+        _proc = subprocess.run(["lsblk", "--json", "-O"],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL,
+                               check=True)
+        json.loads(_proc.stdout)
+
+    return {
+        'lsblk_us': _median_us(_run, runs),
+        'sysfs_us': _median_us(SysBlockDevices, runs)
+    }
+
+
+def main(argv):
+    _parser = argparse.ArgumentParser(description=__doc__.split('\n')[8])
+    _parser.add_argument('--disks', type=int, nargs='+', default=[1, 10, 100])
+    _parser.add_argument('--runs', type=int, default=20)
+    _args = _parser.parse_args(argv)
+
+    _results = []
+    for _ndisks in _args.disks:
+        with tempfile.TemporaryDirectory() as tmp:
+            _results.append(bench(Path(tmp), _ndisks, _args.runs))
+    print(
+        json.dumps({
+            'fixture': _results,
+            'system': lsblk(_args.runs)
+        }, indent=4))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
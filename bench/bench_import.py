@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                              bench_import.py
+===============================================================================
+
+    Tiempo de arranque de la orden smbackup
+
+    Mide en procesos nuevos:
+
+        import      tiempo de importación de smblib.cli y de los módulos
+                    que cada orden carga (python -X importtime)
+        heavy       módulos pesados cargados por cada orden (blkmod,
+                    utiles.menu, concurrent.futures, ctypes...)
+        wall        tiempo total de "smbackup units list" y "status" con
+                    una configuración sintética de N unidades; status lee
+                    los dispositivos reales
+
+    uso: python3 bench/bench_import.py [--units N] [--runs N]
+
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_ROOT))
+
+from bench.bench_units import make_units  # noqa: E402
+from smblib.configdata import ConfigData  # noqa: E402
+
+# módulos cuya carga en una orden ligera indica una importación no perezosa
+Heavy = ("blkmod", "utiles.menu", "utiles.editdata", "concurrent.futures",
+         "ctypes", "smblib.inotify", "smblib.snapshot", "smblib.executor",
+         "subprocess")
+
+_PROBE = """
+import json, sys
+from smblib.cli import main
+main(sys.argv[1:])
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def _env():
+    _env = dict(os.environ)
+    _path = [str(_ROOT)]
+    if _env.get('PYTHONPATH'):
+        _path.append(_env['PYTHONPATH'])
+    _env['PYTHONPATH'] = os.pathsep.join(_path)
+    return _env
+
+
+def import_time(module):
+    """
+    import_time Tiempo de importación de un módulo en un proceso nuevo
+
+    Returns:
+        dict: total (segundos) y top, los diez módulos más costosos
+    """
+    _proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=_env(),
+        check=True)
+    _times = []
+    for _line in _proc.stderr.splitlines():
+        if not _line.startswith("import time:") or "|" not in _line:
+            continue
+        _fields = _line[len("import time:"):].split("|")
+        try:
+            _times.append((int(_fields[0]), int(_fields[1]),
+                           _fields[2].strip()))
+        except ValueError:
+            continue
+    _total = sum(x[0] for x in _times)
+    _top = sorted(_times, reverse=True)[:10]
+    return {
+        'total': _total / 1e6,
+        'top': [{
+            'module': x[2],
+            'self': x[0] / 1e6,
+            'cumulative': x[1] / 1e6
+        } for x in _top]
+    }
+
+
+def loaded(argv):
+    """
+    loaded Módulos pesados que carga una orden
+
+    Returns:
+        list: módulos de Heavy cargados
+    """
+    _proc = subprocess.run([sys.executable, "-c", _PROBE] + argv,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.PIPE,
+                           universal_newlines=True,
+                           env=_env(),
+                           check=True)
+    _modules = json.loads(_proc.stderr.strip().splitlines()[-1])
+    return sorted(
+        x for x in _modules
+        if any(x == y or x.startswith(y + ".") for y in Heavy))
+
+
+def wall(argv, runs):
+    """
+    wall Tiempo total de una orden, mediana de varias ejecuciones
+    """
+    _times = []
+    for _ in range(runs):
+        _start = time.perf_counter()
+        subprocess.run([sys.executable, str(_ROOT / "smbackup.py")] + argv,
+                       stdout=subprocess.DEVNULL,
+                       env=_env(),
+                       check=True)
+        _times.append(time.perf_counter() - _start)
+    return {'median': statistics.median(_times), 'min': min(_times)}
+
+
+def wall_python(runs):
+    _times = []
+    for _ in range(runs):
+        _start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        _times.append(time.perf_counter() - _start)
+    return {'median': statistics.median(_times), 'min': min(_times)}
+
+
+def main(argv):
+    _parser = argparse.ArgumentParser(description=__doc__.split('\n')[8])
+    _parser.add_argument('--units', type=int, default=100)
+    _parser.add_argument('--runs', type=int, default=10)
+    _args = _parser.parse_args(argv)
+
+    # línea base: el intérprete sin importar nada
+    _report = {
+        'python': wall_python(_args.runs),
+        'import': {
+            x: import_time(x)
+            for x in ("smblib.cli", "smblib.units", "smblib.executor")
+        },
+        'commands': {}
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        _root = Path(tmp)
+        _dirunits = _root / "units"
+        _dirunits.mkdir()
+        make_units(_dirunits, _args.units)
+        _conffile = _root / "smbconfig.json"
+        ConfigData({
+            'units_conf': str(_dirunits),
+            'units_mount': str(_root / "mnt")
+        }).save(_conffile)
+        for _command in (["units", "list"], ["status"]):
+            _argv = ["--config", str(_conffile)] + _command
+            _report['commands'][" ".join(_command)] = {
+                'wall': wall(_argv, _args.runs),
+                'heavy': loaded(_argv)
+            }
+    print(json.dumps(_report, indent=4))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               bench_units.py
+===============================================================================
+
+    Tiempo de carga y conexión de Units según el número de unidades
+
+    Compara una instantánea de dispositivos por unidad (comportamiento
+    anterior) con la instantánea compartida de Units. Usa la capa de
+    dispositivos simulada de fakelsblk.
+
+    uso: python3 bench/bench_units.py [n1 n2 ...]
+
+"""
+
+import json
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.fakelsblk import FakeBlockDevices, make_lsblk  # noqa: E402
+from bench.fakelsblk import make_uuid, make_wwn  # noqa: E402
+from smblib.configdata import ConfigData  # noqa: E402
+from smblib.devices import Devices  # noqa: E402
+from smblib.unit import Unit  # noqa: E402
+from smblib.units import Units  # noqa: E402
+
+
+def make_units(dirunits, nunits):
+    for index in range(nunits):
+        _data = {
+            "name": "unit%d" % index,
+            "description": "unidad de pruebas",
+            "wwn": make_wwn(index),
+            "uuid": make_uuid(index),
+            "uuidp": "",
+            "label": "UNIT%d" % index,
+            "crypt": False,
+            "dirbackups": "backups",
+            "meta": "meta"
+        }
+        with (dirunits / ("unit%d.json" % index)).open('w') as file:
+            json.dump(_data, file)
+
+
+def bench(nunits):
+    with tempfile.TemporaryDirectory() as tmp:
+        _tmp = Path(tmp)
+        _dirunits = _tmp / "units"
+        _dirunits.mkdir()
+        _lsblk = _tmp / "lsblk.json"
+        make_units(_dirunits, nunits)
+        make_lsblk(_lsblk, nunits)
+
+        _config = ConfigData({
+            'units_conf': str(_dirunits),
+            'units_mount': str(_tmp / "mnt")
+        })
+        _source = partial(FakeBlockDevices, _lsblk)
+
+        # una instantánea por unidad
+        _start = time.perf_counter()
+        for _file in _dirunits.glob("*.json"):
+            Unit(_file.stem, str(_dirunits), str(_tmp / "mnt"),
+                 devices=Devices(_source))
+        _perunit = time.perf_counter() - _start
+
+        # carga perezosa, sin tocar dispositivos
+        _start = time.perf_counter()
+        _units = Units(_config, Devices(_source))
+        _lazy = time.perf_counter() - _start
+
+        # instantánea compartida y conexión de todas
+        _start = time.perf_counter()
+        for _unit in _units.List:
+            _unit.attach()
+        _shared = _lazy + time.perf_counter() - _start
+
+        # Units salva al destruirse, antes de borrar el directorio
+        del _units
+
+        return {
+            'units': nunits,
+            'per_unit_scan': _perunit,
+            'lazy_load': _lazy,
+            'shared_scan': _shared
+        }
+
+
+def main(argv):
+    _sizes = [int(x) for x in argv] or [10, 30, 100, 300, 1000]
+    print("%8s %15s %12s %14s" %
+          ('unidades', 'scan/unidad', 'perezoso', 'compartido'))
+    for nunits in _sizes:
+        _res = bench(nunits)
+        print("%8d %14.4fs %11.4fs %13.4fs" %
+              (_res['units'], _res['per_unit_scan'], _res['lazy_load'],
+               _res['shared_scan']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               fakelsblk.py
+===============================================================================
+
+    Capa de dispositivos simulada para las pruebas de rendimiento
+
+    Genera un fichero con el formato de 'lsblk --json' y unas clases con la
+    interfaz de blkmod que lo leen. Montar no toca el sistema.
+
+"""
+
+import json
+import uuid as _uuid
+
+
+def make_wwn(index):
+    return "0x%016x" % (0x5000c50000000000 + index)
+
+
+def make_uuid(index):
+    return str(_uuid.UUID(int=index, version=4))
+
+
+def make_lsblk(pathfile, ndisks):
+    """
+    make_lsblk Genera el fichero de dispositivos
+
+    Un disco usb con una partición ext4 por cada índice
+
+    Args:
+        pathfile (Path): fichero a generar
+        ndisks (int): número de discos
+    """
+    _disks = []
+    for index in range(ndisks):
+        _name = "sd%d" % index
+        _disks.append({
+            "name": _name,
+            "path": "/dev/" + _name,
+            "type": "disk",
+            "tran": "usb",
+            "model": "FAKE DISK",
+            "size": "1T",
+            "wwn": make_wwn(index),
+            "children": [{
+                "name": _name + "1",
+                "path": "/dev/" + _name + "1",
+                "type": "part",
+                "fstype": "ext4",
+                "label": "UNIT%d" % index,
+                "uuid": make_uuid(index),
+                "mountpoint": None
+            }]
+        })
+    with open(str(pathfile), 'w') as file:
+        json.dump({"blockdevices": _disks}, file)
+
+
+class FakePart(object):
+    def __init__(self, data):
+        self.name = data["name"]
+        self.path = data["path"]
+        self.fstype = data.get("fstype")
+        self.label = data.get("label")
+        self.uuid = data.get("uuid")
+        self.mountpoint = data.get("mountpoint")
+        self.volume = None
+
+    def mount(self, mountpoint):
+        self.mountpoint = mountpoint
+        return True
+
+    def umount(self):
+        self.mountpoint = None
+        return True
+
+    def open_volume(self, name):
+        self.volume = FakePart({
+            "name": name,
+            "path": "/dev/mapper/" + name,
+            "uuid": None
+        })
+
+    def close_volume(self):
+        self.volume = None
+
+
+class FakeDisk(object):
+    def __init__(self, data):
+        self.name = data["name"]
+        self.path = data["path"]
+        self.tran = data.get("tran")
+        self.wwn = data.get("wwn")
+        self.partitions = [FakePart(x) for x in data.get("children", [])]
+
+    def get_partition_uuid(self, uuid):
+        for _part in self.partitions:
+            if _part.uuid == uuid:
+                return _part
+        return None
+
+
+class FakeBlockDevices(object):
+    """
+    FakeBlockDevices
+
+    Lee el fichero generado por make_lsblk en cada construcción,
+    como lo haría BlockDevices con la salida de lsblk
+    """
+    def __init__(self, pathfile):
+        self.__pathfile = str(pathfile)
+        self.update()
+
+    def update(self):
+        with open(self.__pathfile, 'r') as file:
+            _data = json.load(file)
+        self.ListDisks = [FakeDisk(x) for x in _data["blockdevices"]]
+
+    def get_disk_wwn(self, wwn):
+        for _disk in self.ListDisks:
+            if _disk.wwn == wwn:
+                return _disk
+        return None
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               fakesysfs.py
+===============================================================================
+
+    Árbol /sys, /dev/disk, /run/udev y /proc de prueba para
+    SysBlockDevices(root)
+
+    Genera los mismos discos que fakelsblk.make_lsblk: un disco usb con
+    una partición ext4 por índice, con el WWN, UUID y etiqueta de
+    bench_units.make_units. Opcionalmente algunas particiones son LUKS
+    con el volumen abierto, o están montadas.
+
+"""
+
+import os
+
+from bench.fakelsblk import make_uuid, make_wwn
+
+_MOUNTINFO = ("22 1 0:21 / / rw,relatime - overlay overlay rw\n"
+              "23 22 0:22 / /proc rw,relatime - proc proc rw\n"
+              "24 22 0:23 / /sys rw,relatime - sysfs sysfs rw\n")
+
+
+def disk_name(index):
+    """
+    disk_name Nombre de disco como los del núcleo: sda ... sdz, sdaa ...
+    """
+    _name = ""
+    index += 1
+    while index > 0:
+        index, _rest = divmod(index - 1, 26)
+        _name = chr(ord('a') + _rest) + _name
+    return "sd" + _name
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def _link(path, target):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.symlink(target, path)
+
+
+def _udev(root, majmin, props):
+    _write(os.path.join(root, "run/udev/data", "b" + majmin),
+           "".join(f"E:{x}={y}\n" for x, y in props.items()))
+
+
+def make_sysfs(root, ndisks, udev=True, crypt=(), mounted=None):
+    """
+    make_sysfs Genera el árbol de dispositivos
+
+    Args:
+        root (str|Path): directorio raíz, se crea
+        ndisks (int): número de discos
+        udev (bool): generar la base de datos de udev; sin ella
+            SysBlockDevices recurre a /dev/disk/by-*
+        crypt (tuple): índices con partición LUKS y volumen abierto
+            /dev/mapper/unit<índice>
+        mounted (dict): índice -> punto de montaje de su sistema de
+            ficheros
+    """
+    _root = str(root)
+    _sys = os.path.join(_root, "sys/block")
+    os.makedirs(_sys, exist_ok=True)
+    _mountinfo = [_MOUNTINFO]
+    _dm = 0
+    for index in range(ndisks):
+        _name = disk_name(index)
+        _major = 8 + index // 16
+        _minor = (index % 16) * 16
+        _disk = os.path.join(_sys, _name)
+        _wwn = make_wwn(index)
+        _write(os.path.join(_disk, "dev"), f"{_major}:{_minor}\n")
+        _write(os.path.join(_disk, "size"), "%d\n" % (1 << 31))  # 1 TiB
+        _write(os.path.join(_disk, "device/model"), "FAKE DISK       \n")
+        _write(os.path.join(_disk, "device/wwid"), "naa." + _wwn[2:] + "\n")
+        _link(os.path.join(_root, "dev/disk/by-id", "wwn-" + _wwn),
+              "../../" + _name)
+        _link(os.path.join(_root, "dev/disk/by-id", f"usb-FAKE_{index}-0:0"),
+              "../../" + _name)
+
+        _part = _name + "1"
+        _partdir = os.path.join(_disk, _part)
+        _partmm = f"{_major}:{_minor + 1}"
+        _write(os.path.join(_partdir, "partition"), "1\n")
+        _write(os.path.join(_partdir, "dev"), _partmm + "\n")
+        _write(os.path.join(_partdir, "size"), "%d\n" % ((1 << 31) - 2048))
+        os.makedirs(os.path.join(_partdir, "holders"), exist_ok=True)
+
+        _uuid = make_uuid(index)
+        _label = "UNIT%d" % index
+        _fsdev = "/dev/" + _part
+        _fsmm = _partmm
+        if index in crypt:
+            # partición LUKS con el UUID de la unidad en uuidp
+            _dmname = "dm-%d" % _dm
+            _dm += 1
+            _dmdir = os.path.join(_sys, _dmname)
+            _fsmm = f"253:{_dm - 1}"
+            _write(os.path.join(_dmdir, "dev"), _fsmm + "\n")
+            _write(os.path.join(_dmdir, "size"), "%d\n" % ((1 << 31) - 34816))
+            _write(os.path.join(_dmdir, "dm/name"), "unit%d\n" % index)
+            _link(os.path.join(_partdir, "holders", _dmname),
+                  "../../" + _dmname)
+            _link(os.path.join(_root, "dev/mapper", "unit%d" % index),
+                  "../" + _dmname)
+            _fsdev = "/dev/mapper/unit%d" % index
+            _link(os.path.join(_root, "dev/disk/by-uuid", _uuid),
+                  "../../" + _part)
+            if udev:
+                _udev(_root, _partmm, {
+                    'ID_FS_TYPE': "crypto_LUKS",
+                    'ID_FS_UUID': _uuid
+                })
+            _uuid = make_uuid(index + (1 << 32))
+            _partdev = _dmname
+        else:
+            _partdev = _part
+        _link(os.path.join(_root, "dev/disk/by-uuid", _uuid),
+              "../../" + _partdev)
+        _link(os.path.join(_root, "dev/disk/by-label", _label),
+              "../../" + _partdev)
+
+        if udev:
+            _udev(
+                _root, f"{_major}:{_minor}", {
+                    'ID_BUS': "usb",
+                    'ID_MODEL': "FAKE_DISK",
+                    'ID_WWN': _wwn,
+                    'ID_WWN_WITH_EXTENSION': _wwn
+                })
+            _udev(_root, _fsmm, {
+                'ID_FS_TYPE': "ext4",
+                'ID_FS_UUID': _uuid,
+                'ID_FS_LABEL': _label,
+                'ID_FS_LABEL_ENC': _label
+            })
+
+        if mounted and index in mounted:
+            _mountpoint = str(mounted[index]).replace(" ", "\\040")
+            _mountinfo.append(f"{100 + index} 22 {_fsmm} / {_mountpoint} "
+                              f"rw,relatime - ext4 {_fsdev} rw\n")
+
+    _write(os.path.join(_root, "proc/self/mountinfo"), "".join(_mountinfo))
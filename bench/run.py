@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                   run.py
+===============================================================================
+
+    Batería de pruebas de rendimiento de smbackup
+
+    Con 10, 100 y 1000 unidades sintéticas y la capa de dispositivos
+    simulada (fakelsblk) mide:
+
+        settings    lectura de la configuración (Settings)
+        units       carga perezosa de Units y conexión de todas
+        lookup      get_unit, get_units_wwn y get_unit_uuid
+        copies      find_copies, primera lectura y siguientes
+        copy        instantáneas completas e incrementales de un árbol de
+                    muchos ficheros pequeños y de uno de pocos grandes,
+                    con rsync (si está instalado) y con el motor local
+
+    Como root, y con mkfs.ext4 disponible, la copia se hace sobre un
+    sistema de ficheros ext4 en un fichero montado en bucle (loop); si no,
+    sobre el directorio temporal.
+
+    El resultado se escribe en JSON para comparar versiones:
+
+    uso: python3 bench/run.py [--units 10 100 1000] [--output fichero]
+                              [--small N] [--large N] [--size MiB]
+                              [--no-copy] [--no-loop]
+                              [--trace out.json] [--profile stacks.txt]
+
+    --trace escribe los spans de la ejecución en formato Chrome Trace
+    Event (Perfetto) y --profile las pilas muestreadas en formato
+    collapsed (flamegraph).
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.bench_copy import make_large, make_small  # noqa: E402
+from bench.bench_units import make_units  # noqa: E402
+from bench.fakelsblk import FakeBlockDevices, make_lsblk  # noqa: E402
+from bench.fakelsblk import make_uuid, make_wwn  # noqa: E402
+from smblib.configdata import ConfigData  # noqa: E402
+from smblib.devices import Devices  # noqa: E402
+from smblib.settings import Settings  # noqa: E402
+from smblib import timing, trace  # noqa: E402
+from smblib.snapshot import Snapshot  # noqa: E402
+from smblib.units import Units  # noqa: E402
+
+Lookups = 10000
+CopiesPerUnit = 20
+
+
+def timed(func, *args, **kwargs):
+    _start = time.perf_counter()
+    _result = func(*args, **kwargs)
+    return time.perf_counter() - _start, _result
+
+
+def write_config(pathfile, dirunits, dirmount):
+    _config = ConfigData({
+        'units_conf': str(dirunits),
+        'units_mount': str(dirmount)
+    })
+    _config.save(pathfile)
+
+
+def bench_registry(root, nunits):
+    """
+    bench_registry Configuración, unidades, búsquedas e índice de copias
+    """
+    _dirunits = root / "units"
+    _dirmount = root / "mnt"
+    _dirunits.mkdir()
+    _lsblk = root / "lsblk.json"
+    make_units(_dirunits, nunits)
+    make_lsblk(_lsblk, nunits)
+    _conffile = root / "smbconfig.json"
+    write_config(_conffile, _dirunits, _dirmount)
+
+    # Settings con el fichero de la prueba
+    _settings = type("BenchSettings", (Settings, ), {'ConfigFile': _conffile})
+    _res = {'units': nunits}
+    _res['settings_load'], _config = timed(_settings)
+
+    _devices = Devices(partial(FakeBlockDevices, _lsblk))
+    _res['units_load'], _units = timed(Units, _config, _devices)
+    _res['attach_all'], _ = timed(
+        lambda: [_unit.attach() for _unit in _units.List])
+
+    _rand = random.Random(nunits)
+    _names = [f"unit{_rand.randrange(nunits)}" for _ in range(Lookups)]
+    _wwns = [make_wwn(_rand.randrange(nunits)) for _ in range(Lookups)]
+    _uuids = [make_uuid(_rand.randrange(nunits)) for _ in range(Lookups)]
+    _res['get_unit_us'] = timed(
+        lambda: [_units.get_unit(x) for x in _names])[0] / Lookups * 1e6
+    _res['get_units_wwn_us'] = timed(
+        lambda: [_units.get_units_wwn(x) for x in _wwns])[0] / Lookups * 1e6
+    _res['get_unit_uuid_us'] = timed(
+        lambda: [_units.get_unit_uuid(x) for x in _uuids])[0] / Lookups * 1e6
+
+    # definiciones de copias en las diez primeras unidades
+    _sample = _units.List[:10]
+    for _unit in _sample:
+        _meta = Path(_unit.mountpoint) / _unit.meta
+        _meta.mkdir(parents=True)
+        for index in range(CopiesPerUnit):
+            with (_meta / f"copy{index}.json").open('w') as file:
+                json.dump({'name': f"copy{index}", 'source': "/srv"}, file)
+    _res['find_copies_first'] = timed(
+        lambda: [_unit.find_copies() for _unit in _sample])[0] / len(_sample)
+    _res['find_copies'] = timed(
+        lambda: [_unit.find_copies() for _unit in _sample])[0] / len(_sample)
+
+    # Units salva al destruirse, antes de borrar el directorio
+    del _units
+    return _res
+
+
+def loop_available():
+    return os.geteuid() == 0 and shutil.which("mkfs.ext4") is not None \
+        and shutil.which("mount") is not None
+
+
+@contextmanager
+def loopback(image, mountpoint, size):
+    """
+    loopback Sistema de ficheros ext4 en un fichero montado en bucle
+    """
+    with open(str(image), 'wb') as file:
+        file.truncate(size)
+    subprocess.run(["mkfs.ext4", "-q", "-F", str(image)], check=True)
+    mountpoint.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["mount", "-o", "loop", str(image), str(mountpoint)],
+                   check=True)
+    try:
+        yield mountpoint
+    finally:
+        subprocess.run(["umount", str(mountpoint)], check=False)
+
+
+def snapshot_pair(unit, name, source, engine):
+    """
+    snapshot_pair Instantánea completa e incremental sin cambios
+    """
+    _res = {}
+    for _kind in ("full", "incremental"):
+        _snap = Snapshot(unit, name, source, engine=engine, journal=True)
+        _seconds, _result = timed(_snap.run)
+        _res[_kind + "_seconds"] = _seconds
+        _res[_kind + "_status"] = _result['status']
+    return _res
+
+
+def bench_copy(root, args, use_loop):
+    """
+    bench_copy Caudal de copia extremo a extremo a una unidad
+    """
+    _dirunits = root / "units"
+    _dirmount = root / "mnt"
+    _dirunits.mkdir()
+    _lsblk = root / "lsblk.json"
+    make_units(_dirunits, 1)
+    make_lsblk(_lsblk, 1)
+    _config = ConfigData({
+        'units_conf': str(_dirunits),
+        'units_mount': str(_dirmount)
+    })
+
+    _trees = {
+        'small': (root / "small", args.small * 4096),
+        'large': (root / "large", args.large * (args.size << 20))
+    }
+    make_small(_trees['small'][0], args.small)
+    make_large(_trees['large'][0], args.large, args.size << 20)
+
+    _engines = ["local"]
+    if shutil.which("rsync") is not None:
+        _engines.insert(0, "rsync")
+
+    _results = []
+    _size = sum(x[1] for x in _trees.values()) * 3 + (256 << 20)
+    _mountpoint = _dirmount / "unit0"
+    with (loopback(root / "fs.img", _mountpoint, _size)
+          if use_loop else _noop(_mountpoint)):
+        _units = Units(_config, Devices(partial(FakeBlockDevices, _lsblk)))
+        _unit = _units.get_unit("unit0")
+        _unit.attach()
+        (_mountpoint / _unit.meta).mkdir(parents=True, exist_ok=True)
+        for _tree, (_source, _bytes) in _trees.items():
+            for _engine in _engines:
+                _res = {'tree': _tree, 'engine': _engine, 'bytes': _bytes}
+                _res.update(
+                    snapshot_pair(_unit, f"{_tree}-{_engine}", _source,
+                                  _engine))
+                _res['full_mib_s'] = _bytes / _res['full_seconds'] / (1 << 20)
+                _results.append(_res)
+        del _units
+    return _results
+
+
+@contextmanager
+def _noop(mountpoint):
+    mountpoint.mkdir(parents=True, exist_ok=True)
+    yield mountpoint
+
+
+def revision():
+    _proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                           cwd=str(Path(__file__).resolve().parent),
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.DEVNULL,
+                           universal_newlines=True)
+    return _proc.stdout.strip() or None
+
+
+def main(argv):
+    _parser = argparse.ArgumentParser(description=__doc__.split('\n')[8])
+    _parser.add_argument('--units', type=int, nargs='+', default=[10, 100,
+                                                                   1000])
+    _parser.add_argument('--output', default=None)
+    _parser.add_argument('--small', type=int, default=5000)
+    _parser.add_argument('--large', type=int, default=2)
+    _parser.add_argument('--size', type=int, default=128, help="MiB")
+    _parser.add_argument('--no-copy', action='store_true')
+    _parser.add_argument('--no-loop', action='store_true')
+    _parser.add_argument('--trace', default=None)
+    _parser.add_argument('--profile', default=None)
+    _args = _parser.parse_args(argv)
+
+    if _args.trace is not None:
+        timing.enable()
+    _sampler = None
+    if _args.profile is not None:
+        _sampler = trace.Sampler()
+        _sampler.start()
+
+    _use_loop = loop_available() and not _args.no_loop
+    _report = {
+        'revision': revision(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'loopback': _use_loop,
+        'registry': [],
+        'copy': []
+    }
+    for _nunits in _args.units:
+        with tempfile.TemporaryDirectory() as tmp:
+            _report['registry'].append(bench_registry(Path(tmp), _nunits))
+    if not _args.no_copy:
+        with tempfile.TemporaryDirectory() as tmp:
+            _report['copy'] = bench_copy(Path(tmp), _args, _use_loop)
+
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler.write(_args.profile)
+    if _args.trace is not None:
+        trace.chrome_trace(_args.trace)
+
+    _json = json.dumps(_report, indent=4)
+    if _args.output is None:
+        print(_json)
+    else:
+        with open(_args.output, 'w') as file:
+            file.write(_json + "\n")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
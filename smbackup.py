@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                smbackup.py
+===============================================================================
+
+    Punto de entrada no interactivo de smbackup, ver smblib/cli.py
+
+"""
+
+import sys
+
+from smblib.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                catalog.py
+===============================================================================
+
+    definición de la clase Catalog
+
+    Catálogo opcional en SQLite que guarda en un único fichero los datos
+    de unidades (UnitData) y de configuración (ConfigData), como
+    alternativa a un fichero JSON por unidad.
+
+    El fichero trabaja en modo WAL: los lectores no se bloquean mientras
+    un proceso escribe y cada escritura es una transacción.
+
+"""
+
+import json
+import logging
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from smblib.fileutil import AtomicBatch
+from smblib.settings import Settings
+from smblib.unitdata import UnitData
+
+_log = logging.getLogger(__name__)
+
+class Catalog(object):
+    """
+    Catalog
+
+    Catálogo SQLite de unidades y configuración
+    """
+
+    FileName = "smbcatalog.db"
+
+    __schema = """
+        CREATE TABLE IF NOT EXISTS units (
+            name        TEXT PRIMARY KEY,
+            description TEXT,
+            wwn         TEXT,
+            uuid        TEXT,
+            uuidp       TEXT,
+            label       TEXT,
+            crypt       INTEGER,
+            dirbackups  TEXT,
+            meta        TEXT
+        );
+        CREATE INDEX IF NOT EXISTS units_wwn ON units (wwn);
+        CREATE INDEX IF NOT EXISTS units_uuid ON units (uuid);
+        CREATE INDEX IF NOT EXISTS units_uuidp ON units (uuidp);
+        CREATE INDEX IF NOT EXISTS units_label ON units (label);
+        CREATE TABLE IF NOT EXISTS config (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    # columnas por las que se puede buscar con find_units
+    __indexed = ("wwn", "uuid", "uuidp", "label")
+
+    # columnas guardadas como JSON
+    __json = ("limits", )
+
+    def __init__(self, pathfile=None):
+        """
+        __init__ Constructor
+
+        Abre, o crea, el catálogo
+
+        Args:
+            pathfile (str|Path): fichero del catálogo, por defecto
+                Settings.ConfigDir / FileName
+        """
+        super().__init__()
+
+        if pathfile is None:
+            pathfile = Settings.ConfigDir / self.FileName
+        self.__pathfile = Path(pathfile)
+
+        # autocommit, las transacciones se abren explícitamente
+        self.__db = sqlite3.connect(str(self.__pathfile),
+                                    timeout=30,
+                                    isolation_level=None)
+        self.__db.row_factory = sqlite3.Row
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.executescript(self.__schema)
+        self.__add_columns()
+
+        self.__depth = 0  # anidamiento de transacciones
+
+    def __add_columns(self):
+        """
+        __add_columns Añade a la tabla units los datos nuevos de UnitData
+
+        Los catálogos creados con versiones anteriores no tienen las
+        columnas de los datos opcionales añadidos después
+        """
+        _columns = {
+            row['name']
+            for row in self.__db.execute("PRAGMA table_info(units)")
+        }
+        for key in UnitData._keys:
+            if key not in _columns:
+                self.__db.execute(f"ALTER TABLE units ADD COLUMN {key}")
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        close Cierra el catálogo
+        """
+        _db = getattr(self, '_Catalog__db', None)
+        if _db is not None:
+            _db.close()
+            self.__db = None
+
+    @contextmanager
+    def transaction(self):
+        """
+        transaction Transacción
+
+        Agrupa las operaciones del bloque en una única transacción.
+        Si el bloque lanza una excepción se deshacen todas.
+        Las transacciones anidadas se integran en la exterior.
+        """
+        if self.__depth > 0:
+            self.__depth += 1
+            try:
+                yield self
+            finally:
+                self.__depth -= 1
+            return
+
+        # IMMEDIATE toma el bloqueo de escritura al empezar
+        self.__db.execute("BEGIN IMMEDIATE")
+        self.__depth = 1
+        try:
+            yield self
+        except BaseException:
+            self.__db.execute("ROLLBACK")
+            raise
+        else:
+            self.__db.execute("COMMIT")
+        finally:
+            self.__depth = 0
+
+    @staticmethod
+    def __to_unit(row):
+        _data = dict(row)
+        if _data['crypt'] is not None:
+            _data['crypt'] = bool(_data['crypt'])
+        for key in Catalog.__json:
+            if _data.get(key) is not None:
+                _data[key] = json.loads(_data[key])
+        # los datos se validaron al guardarlos
+        return UnitData.from_dict(_data)
+
+    def units(self):
+        """
+        units Unidades del catálogo
+
+        Returns:
+            list: [UnitData, ...] ordenadas por nombre
+        """
+        _rows = self.__db.execute("SELECT * FROM units ORDER BY name")
+        return [self.__to_unit(row) for row in _rows]
+
+    def get_unit(self, name):
+        """
+        get_unit Unidad por nombre
+
+        Args:
+            name (str): nombre de la unidad
+
+        Returns:
+            UnitData: datos de la unidad, None si no existe
+        """
+        _row = self.__db.execute("SELECT * FROM units WHERE name = ?",
+                                 (name, )).fetchone()
+        if _row is None:
+            return None
+        return self.__to_unit(_row)
+
+    def unit_exists(self, name):
+        _row = self.__db.execute("SELECT 1 FROM units WHERE name = ?",
+                                 (name, )).fetchone()
+        return _row is not None
+
+    def find_units(self, key, value):
+        """
+        find_units Búsqueda indexada
+
+        Args:
+            key (str): wwn, uuid, uuidp o label
+            value (str): valor buscado
+
+        Raises:
+            NameError: si key no es una columna indexada
+
+        Returns:
+            list: [UnitData, ...]
+        """
+        if key not in self.__indexed:
+            raise NameError
+        _rows = self.__db.execute(
+            f"SELECT * FROM units WHERE {key} = ? ORDER BY name", (value, ))
+        return [self.__to_unit(row) for row in _rows]
+
+    def save_unit(self, data, oldname=None):
+        """
+        save_unit Guarda una unidad
+
+        Args:
+            data (UnitData): datos de la unidad
+            oldname (str): nombre anterior si la unidad se ha renombrado
+        """
+        _data = data.to_dict()
+        for key in self.__json:
+            if _data[key] is not None:
+                _data[key] = json.dumps(_data[key], sort_keys=True)
+        _values = list(_data.values())
+        _columns = ", ".join(_data.keys())
+        _marks = ", ".join("?" * len(_values))
+        with self.transaction():
+            if oldname is not None and oldname != data.name:
+                self.__db.execute("DELETE FROM units WHERE name = ?",
+                                  (oldname, ))
+            self.__db.execute(
+                f"INSERT OR REPLACE INTO units ({_columns}) "
+                f"VALUES ({_marks})", _values)
+
+    def del_unit(self, name):
+        """
+        del_unit Borra una unidad
+
+        Args:
+            name (str): nombre de la unidad
+
+        Returns:
+            bool: True si existía
+        """
+        with self.transaction():
+            _cursor = self.__db.execute("DELETE FROM units WHERE name = ?",
+                                        (name, ))
+        return _cursor.rowcount > 0
+
+    def config(self):
+        """
+        config Configuración guardada
+
+        Devuelve un diccionario apto para construir ConfigData:
+        ConfigData(catalog.config())
+
+        Returns:
+            dict: clave -> valor
+        """
+        _rows = self.__db.execute("SELECT key, value FROM config")
+        return {_row['key']: _row['value'] for _row in _rows}
+
+    def save_config(self, config):
+        """
+        save_config Guarda la configuración
+
+        Args:
+            config (ConfigData): configuración a guardar
+        """
+        _values = []
+        for key in config.keys():
+            _value = config[key]
+            _values.append((key, None if _value is None else str(_value)))
+        with self.transaction():
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                _values)
+
+    def import_json(self, dirunits, fileconf=None):
+        """
+        import_json Importa la estructura JSON
+
+        Carga en una sola transacción las unidades del directorio
+        de configuración y, si se indica, el fichero de configuración.
+        Los ficheros de unidad incompletos (UnitData.finised) o no
+        válidos se omiten con un aviso
+
+        Args:
+            dirunits (str|Path): directorio con <unidad>.json
+            fileconf (str|Path): fichero de configuración general
+
+        Returns:
+            int: número de unidades importadas
+        """
+        _count = 0
+        with self.transaction():
+            for _file in sorted(Path(dirunits).glob("*.json")):
+                try:
+                    with _file.open('r') as funidad:
+                        _data = UnitData(json.load(funidad))
+                except (KeyError, ValueError) as e:
+                    _log.warning("Fichero de unidad %s no válido: %s",
+                                 _file.name, e)
+                    continue
+                if not _data.finised:
+                    _log.warning("Fichero de unidad %s incompleto",
+                                 _file.name)
+                    continue
+                self.save_unit(_data)
+                _count += 1
+
+            if fileconf is not None:
+                with Path(fileconf).open('r') as file:
+                    _data = json.load(file)
+                self.__db.executemany(
+                    "INSERT OR REPLACE INTO config (key, value) "
+                    "VALUES (?, ?)", [(key, None if value is None else
+                                       str(value))
+                                      for key, value in _data.items()])
+        return _count
+
+    def export_json(self, dirunits, fileconf=None):
+        """
+        export_json Exporta a la estructura JSON
+
+        Escribe un <unidad>.json por unidad y, si se indica,
+        el fichero de configuración general. Todos los ficheros se
+        escriben de forma atómica en un mismo lote: un fallo a mitad
+        no deja ninguno truncado
+
+        Args:
+            dirunits (str|Path): directorio destino de las unidades
+            fileconf (str|Path): fichero de configuración general
+
+        Returns:
+            int: número de unidades exportadas
+        """
+        _dir = Path(dirunits)
+        _dir.mkdir(parents=True, exist_ok=True)
+        _units = self.units()
+        _batch = AtomicBatch()
+        try:
+            for _unit in _units:
+                _batch.add(_dir / (_unit.name + '.json'),
+                           json.dumps(_unit.to_dict(), indent=4))
+            if fileconf is not None:
+                _batch.add(
+                    fileconf,
+                    json.dumps(self.config(), indent=4, ensure_ascii=False))
+        except BaseException:
+            _batch.rollback()
+            raise
+        _batch.commit()
+
+        return len(_units)
+
+    @property
+    def data_version(self):
+        """
+        data_version
+
+        Cambia cada vez que otra conexión modifica el catálogo
+
+        Returns:
+            int: versión de los datos
+        """
+        return self.__db.execute("PRAGMA data_version").fetchone()[0]
+
+    @property
+    def PathFile(self):
+        return self.__pathfile
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                changes.py
+===============================================================================
+
+    definición de las clases ChangeLog y ChangeTracker
+
+    ChangeTracker vigila con inotify los árboles de origen de las copias y
+    anota las rutas modificadas en un registro en disco (ChangeLog), que
+    sobrevive a los reinicios. Cada consumidor de un origen, una copia en
+    una unidad, tiene su propio registro: la siguiente copia toma el suyo
+    y solo examina esas rutas, sin recorrer el árbol. Un origen copiado a
+    dos unidades no pierde en la segunda lo que ya tomó la primera.
+
+    Cuando no se puede garantizar que el registro está completo (al
+    arrancar el vigilante, por desbordamiento de la cola de eventos o por
+    falta de vigilancias) se marca para examen completo y la copia recorre
+    el árbol entero. Lo mismo si el vigilante no está en marcha: mientras
+    vigila mantiene un bloqueo sobre <origen>/live, y la primera vez que
+    un consumidor toma su registro, que hasta entonces no existía.
+
+    Por cada origen un directorio <ConfigDir>/changes/<origen>, con
+    <origen> y <consumidor> resúmenes de la ruta y del nombre:
+
+        <consumidor>.reg    consumidor registrado, recibe las anotaciones
+        <consumidor>.dirty  rutas relativas separadas por NUL, precedidas
+                            de 'R' si hay que examinar el subárbol
+                            completo o de 'F' si basta la propia ruta
+        <consumidor>.full   marca de examen completo
+
+"""
+
+import fcntl
+import hashlib
+import os
+import select
+import threading
+import time
+from pathlib import Path
+
+from smblib import inotify
+from smblib.settings import Settings
+
+
+class ChangeLog(object):
+    """
+    ChangeLog
+
+    Registro en disco de las rutas modificadas de un origen
+
+    Cada consumidor del origen (una copia en una unidad) lleva su propio
+    registro: una misma ruta anotada llega a todos, y lo que toma y
+    confirma uno no se pierde para los demás
+    """
+
+    DirName = "changes"
+
+    def __init__(self, source, dirchanges=None, consumer=None):
+        """
+        __init__ Constructor
+
+        Args:
+            source (str|Path): directorio de origen
+            dirchanges (str|Path): directorio de los registros, por
+                defecto <ConfigDir>/changes
+            consumer (str): consumidor, normalmente "<unidad>/<copia>";
+                necesario para take, commit y rollback. Sin él (el
+                vigilante) las anotaciones van a todos los consumidores
+        """
+        super().__init__()
+
+        self.__source = Path(source).resolve()
+        if dirchanges is None:
+            dirchanges = Settings.ConfigDir / self.DirName
+        self.__dir = Path(dirchanges) / self.__key(str(self.__source))
+        self.__live = self.__dir / "live"
+        self.__consumer = consumer
+        self.__dirty = self.__full = self.__registered = None
+        if consumer is not None:
+            _key = self.__key(consumer)
+            self.__dirty = self.__dir / (_key + ".dirty")
+            self.__full = self.__dir / (_key + ".full")
+            self.__registered = self.__dir / (_key + ".reg")
+        self.__hold = None  # descriptor del bloqueo del vigilante
+        # (registro tomado, marca tomada, examen completo)
+        self.__taken = None
+
+    @staticmethod
+    def __key(text):
+        return hashlib.sha1(os.fsencode(text)).hexdigest()[:16]
+
+    def __consumers(self):
+        """
+        __consumers Claves de los consumidores registrados del origen
+        """
+        try:
+            _names = os.listdir(str(self.__dir))
+        except FileNotFoundError:
+            return []
+        return [x[:-4] for x in _names if x.endswith(".reg")]
+
+    @staticmethod
+    def __append(pathfile, data):
+        # se abre en cada anotación: take() puede haber retirado el fichero
+        while True:
+            with pathfile.open('ab') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    _current = os.stat(str(pathfile)).st_ino
+                except FileNotFoundError:
+                    _current = None
+                if _current == os.fstat(file.fileno()).st_ino:
+                    file.write(data)
+                    return
+
+    def add(self, paths):
+        """
+        add Anota rutas modificadas en el registro de cada consumidor
+
+        Args:
+            paths (iterable): [(ruta relativa, recursiva), ...]
+        """
+        _data = b''.join((b'R' if recursive else b'F') + os.fsencode(path) +
+                         b'\0' for path, recursive in paths)
+        if not _data:
+            return
+        for _key in self.__consumers():
+            self.__append(self.__dir / (_key + ".dirty"), _data)
+
+    def mark_full(self):
+        """
+        mark_full El registro no está completo, examen completo
+
+        Los consumidores aún no registrados ya harán un examen completo
+        """
+        for _key in self.__consumers():
+            (self.__dir / (_key + ".full")).touch()
+
+    def hold(self):
+        """
+        hold El vigilante declara que está anotando los cambios
+
+        Raises:
+            BlockingIOError: si ya lo vigila otro proceso
+        """
+        if self.__hold is not None:
+            return
+        self.__dir.mkdir(parents=True, exist_ok=True)
+        _fd = os.open(str(self.__live), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(_fd)
+            raise
+        self.__hold = _fd
+
+    def unhold(self):
+        if self.__hold is not None:
+            os.close(self.__hold)
+            self.__hold = None
+
+    @property
+    def tracked(self):
+        """
+        tracked Informa si un vigilante está anotando los cambios
+
+        Returns:
+            bool: True si hay un vigilante en marcha
+        """
+        if self.__hold is not None:
+            return True
+        try:
+            _fd = os.open(str(self.__live), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        finally:
+            os.close(_fd)
+        return False
+
+    def __check_consumer(self):
+        if self.__consumer is None:
+            raise ValueError("registro de cambios sin consumidor")
+
+    def take(self):
+        """
+        take Toma las rutas anotadas para una copia
+
+        El registro del consumidor se aparta para que las nuevas
+        anotaciones vayan a uno nuevo. Tras la copia se confirma con
+        commit() o se devuelve con rollback(). La primera vez registra al
+        consumidor: a partir de entonces recibe las anotaciones, y esa
+        copia hace un examen completo
+
+        Returns:
+            dict: {ruta relativa: recursiva}, None si hay que hacer un
+            examen completo
+
+        Raises:
+            ValueError: si no se ha indicado el consumidor
+        """
+        self.__check_consumer()
+        if self.__taken is not None:
+            raise RuntimeError("registro ya tomado")
+        # sin vigilante el registro no recoge todo
+        _tracked = self.tracked
+        _registered = self.__registered.exists()
+        if not _registered:
+            self.__dir.mkdir(parents=True, exist_ok=True)
+            self.__registered.touch()
+        _suffix = f".{os.getpid()}.taken"
+        _dirty = self.__dirty.with_name(self.__dirty.name + _suffix)
+        _full = self.__full.with_name(self.__full.name + _suffix)
+        try:
+            os.rename(str(self.__full), str(_full))
+        except FileNotFoundError:
+            pass
+        try:
+            with self.__dirty.open('rb') as file:
+                # espera a que termine una anotación en curso
+                fcntl.flock(file, fcntl.LOCK_EX)
+                os.rename(str(self.__dirty), str(_dirty))
+        except FileNotFoundError:
+            pass
+        _whole = not (_tracked and _registered) or _full.exists()
+        self.__taken = (_dirty, _full, _whole)
+        if _whole:
+            return None
+        _paths = {}
+        try:
+            with _dirty.open('rb') as file:
+                _data = file.read()
+        except FileNotFoundError:
+            return _paths
+        for _record in _data.split(b'\0'):
+            if _record:
+                _path = os.fsdecode(_record[1:])
+                _paths[_path] = _paths.get(_path, False) \
+                    or _record[:1] == b'R'
+        return _paths
+
+    def commit(self):
+        """
+        commit La copia ha terminado bien, descarta lo tomado
+        """
+        if self.__taken is None:
+            return
+        for _file in self.__taken[:2]:
+            if _file.exists():
+                _file.unlink()
+        self.__taken = None
+
+    def rollback(self):
+        """
+        rollback La copia ha fallado, devuelve lo tomado al registro
+        """
+        if self.__taken is None:
+            return
+        _dirty, _full, _whole = self.__taken
+        if _whole:
+            # el examen completo sigue pendiente
+            self.__full.touch()
+            if _full.exists():
+                _full.unlink()
+        elif _full.exists():
+            os.replace(str(_full), str(self.__full))
+        if _dirty.exists():
+            with _dirty.open('rb') as file:
+                _data = file.read()
+            self.__append(self.__dirty, _data)
+            _dirty.unlink()
+        self.__taken = None
+
+    def forget(self):
+        """
+        forget Da de baja al consumidor y borra su registro
+
+        Para copias que ya no existen: su registro dejaría de tomarse y
+        crecería sin límite
+        """
+        self.__check_consumer()
+        for _file in (self.__registered, self.__dirty, self.__full):
+            try:
+                _file.unlink()
+            except FileNotFoundError:
+                pass
+
+    @property
+    def Source(self):
+        return self.__source
+
+    @property
+    def Consumer(self):
+        return self.__consumer
+
+    @property
+    def PathFile(self):
+        return self.__dirty
+
+
+class ChangeTracker(object):
+    """
+    ChangeTracker
+
+    Vigilante inotify de los árboles de origen
+    """
+
+    Mask = (inotify.IN_MODIFY | inotify.IN_ATTRIB | inotify.IN_CLOSE_WRITE
+            | inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM
+            | inotify.IN_MOVED_TO | inotify.IN_DELETE_SELF
+            | inotify.IN_MOVE_SELF | inotify.IN_ONLYDIR
+            | inotify.IN_DONT_FOLLOW)
+
+    def __init__(self, sources, dirchanges=None, flush=1.0):
+        """
+        __init__ Constructor
+
+        Args:
+            sources (list): directorios de origen a vigilar
+            dirchanges (str|Path): directorio de los registros
+            flush (float): segundos entre escrituras del registro
+
+        Raises:
+            OSError: si el sistema no dispone de inotify
+        """
+        super().__init__()
+
+        if not inotify.available():
+            raise OSError("inotify no disponible")
+        self.__logs = [ChangeLog(x, dirchanges) for x in sources]
+        self.__flush = flush
+
+        self.__inotify = None
+        self.__watches = {}  # wd -> (registro, ruta relativa del directorio)
+        self.__pending = {}  # registro -> {ruta: recursiva}
+        self.__thread = None
+        self.__stop = None
+
+    @classmethod
+    def for_units(cls, units, dirchanges=None, flush=1.0):
+        """
+        for_units Vigilante de los orígenes de las copias de unas unidades
+
+        Solo se consultan las unidades ya conectadas, sin montar ninguna
+
+        Args:
+            units (Units): colección de unidades
+
+        Returns:
+            ChangeTracker: vigilante
+        """
+        _sources = []
+        for _unit in units.List:
+            if not (_unit.attached and _unit.connected):
+                continue
+            for _copy in _unit.copies() or []:
+                if _copy['source'] and _copy['source'] not in _sources:
+                    _sources.append(_copy['source'])
+        return cls(_sources, dirchanges, flush)
+
+    def start(self):
+        """
+        start Arranca la vigilancia en un hilo
+        """
+        if self.__thread is not None:
+            return
+        self.__setup()
+        self.__stop = os.pipe()
+        self.__thread = threading.Thread(target=self.__loop,
+                                         name="change-tracker",
+                                         daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        stop Detiene la vigilancia y vuelca lo pendiente
+        """
+        if self.__thread is None:
+            return
+        os.write(self.__stop[1], b'x')
+        self.__thread.join()
+        for _fd in self.__stop:
+            os.close(_fd)
+        self.__thread = None
+        self.__stop = None
+
+    def run(self):
+        """
+        run Vigila en primer plano hasta una interrupción
+        """
+        self.start()
+        try:
+            self.__thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __setup(self):
+        self.__inotify = inotify.Inotify()
+        self.__watches = {}
+        self.__pending = {x: {} for x in self.__logs}
+        for _log in self.__logs:
+            _log.hold()
+            # lo ocurrido mientras no se vigilaba se desconoce
+            _log.mark_full()
+            self.__add_tree(_log, _log.Source, '')
+
+    def __add_tree(self, log, path, rel):
+        """
+        __add_tree Vigila un directorio y sus subdirectorios
+
+        Returns:
+            bool: False si no se ha podido vigilar todo
+        """
+        _stack = [(str(path), rel)]
+        while _stack:
+            _path, _rel = _stack.pop()
+            try:
+                _wd = self.__inotify.add_watch(_path, self.Mask)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # ENOSPC: sin vigilancias disponibles
+                log.mark_full()
+                return False
+            self.__watches[_wd] = (log, _rel)
+            try:
+                with os.scandir(_path) as _iter:
+                    for _entry in _iter:
+                        if _entry.is_dir(follow_symlinks=False):
+                            _stack.append((_entry.path,
+                                           _rel + _entry.name + '/'))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+        return True
+
+    def __loop(self):
+        _next = time.monotonic() + self.__flush
+        try:
+            while True:
+                _timeout = max(0, _next - time.monotonic())
+                _ready = select.select([self.__inotify, self.__stop[0]], [],
+                                       [], _timeout)[0]
+                if self.__stop[0] in _ready:
+                    break
+                if self.__inotify in _ready:
+                    self.__handle(self.__inotify.read())
+                if time.monotonic() >= _next:
+                    self.__write()
+                    _next = time.monotonic() + self.__flush
+        finally:
+            self.__write()
+            self.__inotify.close()
+            for _log in self.__logs:
+                _log.unhold()
+
+    def __handle(self, events):
+        for _wd, _mask, _cookie, _name in events:
+            if _mask & inotify.IN_Q_OVERFLOW:
+                for _log in self.__logs:
+                    _log.mark_full()
+                continue
+            _watch = self.__watches.get(_wd)
+            if _watch is None:
+                continue
+            if _mask & inotify.IN_IGNORED:
+                del self.__watches[_wd]
+                continue
+            _log, _rel = _watch
+            _pending = self.__pending[_log]
+            if not _name:
+                # evento sobre el propio directorio
+                if _rel:
+                    _pending.setdefault(_rel.rstrip('/'), False)
+                continue
+            _path = _rel + _name
+            if _mask & inotify.IN_ISDIR \
+                    and _mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                # un directorio nuevo llega con contenido sin eventos
+                _pending[_path] = True
+                self.__add_tree(_log, _log.Source / _path, _path + '/')
+            else:
+                _pending.setdefault(_path, False)
+
+    def __write(self):
+        for _log, _pending in self.__pending.items():
+            if _pending:
+                _log.add(_pending.items())
+                _pending.clear()
+
+    @property
+    def Logs(self):
+        return list(self.__logs)
+
+    @property
+    def running(self):
+        return self.__thread is not None
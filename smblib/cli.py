@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                   cli.py
+===============================================================================
+
+    Órdenes no interactivas de smbackup, para cron y sondas de
+    monitorización
+
+    uso: smbackup [--config fichero] [--catalog fichero] <orden>
+
+        units list              unidades configuradas, sin acceder a los
+                                dispositivos
+        units show NOMBRE       datos de una unidad; con --copies la
+                                conecta y lista sus copias
+        run [UNIDAD ...]        instantáneas de las copias de las unidades
+                                conectadas, por defecto de todas
+        status                  discos presentes, montajes y estado de las
+                                copias, sin montar nada
+        watch [ORIGEN ...]      vigila los orígenes y anota sus cambios;
+                                run --journal solo examina lo anotado
+        catalog import|export   pasa las unidades de los ficheros JSON
+                                al catálogo SQLite o al revés
+
+    Con --catalog, o la clave catalog de la configuración, las unidades
+    se leen y guardan en el catálogo SQLite en lugar de en ficheros JSON.
+
+    Cada orden importa solo lo que necesita: units list no carga blkmod,
+    ni la interfaz de menús, ni el motor de copias.
+
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _config(args):
+    """
+    _config Configuración indicada en la línea de órdenes o la compartida
+    """
+    if args.config is None:
+        from smblib.settings import Settings
+        return Settings.shared()
+    from smblib.configdata import ConfigData
+    return ConfigData(Path(args.config))
+
+
+def _catalog(args, config):
+    """
+    _catalog Catálogo indicado en la línea de órdenes o en la configuración
+    """
+    _pathfile = args.catalog or config.catalog
+    if _pathfile is None:
+        return None
+    from smblib.catalog import Catalog
+    return Catalog(_pathfile)
+
+
+def _units(args, config, devices=None):
+    from smblib.units import Units
+    return Units(config, devices, _catalog(args, config))
+
+
+def _print_json(data):
+    print(json.dumps(data, indent=4, ensure_ascii=False, default=str))
+
+
+def _print_table(rows, keys):
+    _widths = [
+        max([len(x)] + [len(str(row.get(x) or "-")) for row in rows])
+        for x in keys
+    ]
+    print("  ".join(x.upper().ljust(w) for x, w in zip(keys, _widths)))
+    for _row in rows:
+        print("  ".join(
+            str(_row.get(x) or "-").ljust(w) for x, w in zip(keys, _widths)))
+
+
+def cmd_units_list(args):
+    _units_list = _units(args, _config(args)).List
+    _rows = [{
+        'name': x.name,
+        'label': x.label,
+        'wwn': x.wwn,
+        'uuid': x.uuidp if x.crypt else x.uuid,
+        'crypt': "sí" if x.crypt else "no",
+        'description': x.description
+    } for x in sorted(_units_list, key=lambda x: x.name)]
+    if args.json:
+        _print_json(_rows)
+    else:
+        _print_table(_rows,
+                     ('name', 'label', 'wwn', 'uuid', 'crypt', 'description'))
+    return 0
+
+
+def cmd_units_show(args):
+    _unit = _units(args, _config(args)).get_unit(args.name)
+    if _unit is None:
+        print(f"Unidad desconocida: {args.name}", file=sys.stderr)
+        return 1
+    _data = {
+        x: y
+        for x, y in _unit.to_dict().items() if y not in (None, "")
+    }
+    if args.copies:
+        _data['connected'] = _unit.connected
+        _data['mountpoint'] = _unit.mountpoint
+        _data['copies'] = _unit.copies()
+    if args.json:
+        _print_json(_data)
+    else:
+        for _key, _value in _data.items():
+            if _key == 'copies':
+                continue
+            print(f"{_key:12} {_value}")
+        for _copy in _data.get('copies') or []:
+            print(f"copia        {_copy['name']}: {_copy.get('status', '-')}"
+                  f" {_copy.get('last_run', '-')}")
+    return 0
+
+
+def _changes(args, unit, name):
+    """
+    _changes Registro de cambios de una copia, si se usa el diario
+
+    Sin vigilante (smbackup watch) el registro pide un examen completo
+    y la copia se comporta como con el diario solo
+    """
+    if not args.journal:
+        return None
+    _entry = unit.CopyIndex.get(name)
+    if _entry is None or not _entry.get('source'):
+        return None
+    from smblib.changes import ChangeLog
+    return ChangeLog(_entry['source'], consumer=f"{unit.name}/{name}")
+
+
+def cmd_run(args):
+    from smblib import timing
+    if args.trace is not None:
+        timing.enable()
+    _sampler = None
+    if args.profile is not None:
+        from smblib.trace import Sampler
+        _sampler = Sampler()
+        _sampler.start()
+
+    from smblib.executor import Executor
+    from smblib.mountpool import MountPool
+
+    _config_data = _config(args)
+    _units_all = _units(args, _config_data)
+    if args.units:
+        _selected = []
+        for _name in args.units:
+            _unit = _units_all.get_unit(_name)
+            if _unit is None:
+                print(f"Unidad desconocida: {_name}", file=sys.stderr)
+                return 1
+            _selected.append(_unit)
+    else:
+        # localización y montaje en paralelo de todas las presentes
+        _units_all.attach_all()
+        _selected = _units_all.List
+
+    _idle = _config_data.units_idle
+    if _idle is None:
+        _idle = MountPool.DefaultIdle
+    _pool = MountPool(_idle)
+    _metrics = None
+    if _config_data.metrics_dir is not None:
+        from smblib.metrics import Metrics
+        _metrics = Metrics(_units_all, _config_data.metrics_dir)
+    _executor = Executor(max_jobs=args.jobs,
+                         adaptive=args.adaptive,
+                         metrics=_metrics)
+
+    _absent = []
+    for _unit in _selected:
+        if _pool.acquire(_unit) is None:
+            _absent.append(_unit.name)
+            continue
+        # el índice de copias se lee con la unidad montada
+        try:
+            _copies = [(x, _changes(args, _unit, x))
+                       for x in _unit.CopyIndex.names()
+                       if not args.copy or x in args.copy]
+        finally:
+            _pool.release(_unit)
+        for _name, _changelog in _copies:
+            _executor.submit_snapshot(_unit,
+                                      _name,
+                                      pool=_pool,
+                                      engine=args.engine,
+                                      journal=args.journal,
+                                      changes=_changelog)
+    _executor.wait()
+    # desmonta las unidades montadas por esta ejecución
+    for _name, _error in _pool.close().items():
+        print(f"Error al desconectar {_name}: {_error}", file=sys.stderr)
+    if _metrics is not None:
+        _metrics.write()
+
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler.write(args.profile)
+    if args.trace is not None:
+        from smblib.trace import chrome_trace
+        chrome_trace(args.trace)
+
+    _stats = _executor.stats()
+    _stats['absent'] = _absent
+    _failed = [
+        x for x in _executor.Jobs if x.state == 'error' or (
+            isinstance(x.result, dict) and x.result.get('status') == 'error')
+    ]
+    if args.json:
+        _print_json(_stats)
+    else:
+        for _job in _executor.Jobs:
+            _status = _job.state
+            if isinstance(_job.result, dict):
+                _status = _job.result.get('status', _status)
+            _mib = _job.throughput
+            _mib = "-" if _mib is None else f"{_mib / (1 << 20):.1f} MiB/s"
+            print(f"{_job.name:30} {_status:8} {_job.seconds or 0:8.1f}s "
+                  f"{_mib:>14} {_job.error or ''}")
+        for _name in _absent:
+            print(f"{_name:30} ausente")
+    return 1 if _failed else 0
+
+
+def cmd_watch(args):
+    from smblib.changes import ChangeTracker
+
+    if args.sources:
+        _tracker = ChangeTracker(args.sources)
+    else:
+        # orígenes de las copias de todas las unidades presentes
+        _units_all = _units(args, _config(args))
+        _units_all.attach_all()
+        _tracker = ChangeTracker.for_units(_units_all)
+    if not _tracker.Logs:
+        print("Sin orígenes que vigilar", file=sys.stderr)
+        return 1
+    for _log in _tracker.Logs:
+        print(f"vigilando {_log.Source}")
+    _tracker.run()
+    return 0
+
+
+def cmd_status(args):
+    from smblib.copyindex import CopyIndex
+    from smblib.devices import Devices
+
+    _config_data = _config(args)
+    _devices = Devices(backend=_config_data.devices)
+    _rows = []
+    _units_list = _units(args, _config_data, _devices).List
+    for _unit in sorted(_units_list, key=lambda x: x.name):
+        _row = {
+            'name': _unit.name,
+            'present': _devices.get_disk_wwn(_unit.wwn) is not None,
+            'mountpoint': None,
+            'copies': None
+        }
+        _part = _devices.get_partition_uuid(
+            _unit.uuidp if _unit.crypt else _unit.uuid)
+        _fs = _part
+        if _part is not None and _unit.crypt:
+            _fs = getattr(_part, 'volume', None)
+        if _fs is not None and _fs.mountpoint is not None:
+            # solo se leen las unidades ya montadas
+            _row['mountpoint'] = str(_fs.mountpoint)
+            try:
+                _row['copies'] = CopyIndex(
+                    Path(_fs.mountpoint) / _unit.meta).copies()
+            except OSError:
+                pass
+        _rows.append(_row)
+
+    if args.json:
+        _print_json(_rows)
+        return 0
+    for _row in _rows:
+        _state = "montada" if _row['mountpoint'] else (
+            "presente" if _row['present'] else "ausente")
+        print(f"{_row['name']:20} {_state:9} {_row['mountpoint'] or ''}")
+        for _copy in _row['copies'] or []:
+            print(f"    {_copy['name']:24} {_copy.get('status', '-'):8}"
+                  f" última correcta: {_copy.get('last_success', '-')}")
+    return 0
+
+
+def cmd_catalog(args):
+    from smblib.catalog import Catalog
+
+    _config_data = _config(args)
+    # sin catálogo configurado, el de Settings.ConfigDir
+    _db = _catalog(args, _config_data) or Catalog()
+    if args.catalog_command == 'import':
+        _count = _db.import_json(_config_data.units_conf)
+        print(f"{_count} unidades importadas en {_db.PathFile}")
+    else:
+        _count = _db.export_json(_config_data.units_conf)
+        print(f"{_count} unidades exportadas a {_config_data.units_conf}")
+    return 0
+
+
+def parser():
+    """
+    parser Analizador de la línea de órdenes
+
+    Returns:
+        argparse.ArgumentParser: analizador
+    """
+    _parser = argparse.ArgumentParser(
+        prog="smbackup", description="Copias de seguridad smbackup")
+    _parser.add_argument('--config',
+                         default=None,
+                         help="fichero de configuración")
+    _parser.add_argument('--catalog',
+                         default=None,
+                         help="catálogo SQLite de unidades; por defecto el "
+                         "de la configuración, si lo hay")
+    _commands = _parser.add_subparsers(dest='command', metavar='orden')
+    _commands.required = True
+
+    _units_parser = _commands.add_parser('units', help="unidades")
+    _units_commands = _units_parser.add_subparsers(dest='units_command',
+                                                   metavar='orden')
+    _units_commands.required = True
+    _list = _units_commands.add_parser('list', help="lista las unidades")
+    _list.add_argument('--json', action='store_true')
+    _list.set_defaults(func=cmd_units_list)
+    _show = _units_commands.add_parser('show', help="datos de una unidad")
+    _show.add_argument('name')
+    _show.add_argument('--copies',
+                       action='store_true',
+                       help="conecta la unidad y lista sus copias")
+    _show.add_argument('--json', action='store_true')
+    _show.set_defaults(func=cmd_units_show)
+
+    _run = _commands.add_parser('run', help="ejecuta las copias")
+    _run.add_argument('units', nargs='*', metavar='unidad')
+    _run.add_argument('--copy',
+                      action='append',
+                      default=[],
+                      help="solo esta copia, se puede repetir")
+    _run.add_argument('--engine', choices=("rsync", "local"), default="rsync")
+    _run.add_argument('--journal', action='store_true')
+    _run.add_argument('--jobs', type=int, default=2)
+    _run.add_argument('--adaptive', action='store_true')
+    _run.add_argument('--trace',
+                      default=None,
+                      help="fichero Chrome Trace Event de la ejecución")
+    _run.add_argument('--profile',
+                      default=None,
+                      help="fichero de pilas muestreadas (collapsed)")
+    _run.add_argument('--json', action='store_true')
+    _run.set_defaults(func=cmd_run)
+
+    _watch = _commands.add_parser(
+        'watch', help="anota los cambios de los orígenes para run --journal")
+    _watch.add_argument('sources',
+                        nargs='*',
+                        metavar='origen',
+                        help="por defecto los de las copias de las unidades")
+    _watch.set_defaults(func=cmd_watch)
+
+    _catalog_parser = _commands.add_parser(
+        'catalog', help="importa o exporta el catálogo de unidades")
+    _catalog_parser.add_argument('catalog_command',
+                                 choices=("import", "export"),
+                                 metavar='import|export')
+    _catalog_parser.set_defaults(func=cmd_catalog)
+
+    _status = _commands.add_parser('status',
+                                   help="estado de unidades y copias")
+    _status.add_argument('--json', action='store_true')
+    _status.set_defaults(func=cmd_status)
+    return _parser
+
+
+def main(argv=None):
+    _args = parser().parse_args(argv)
+    return _args.func(_args)
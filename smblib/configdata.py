@@ -16,39 +16,137 @@ from pathlib import Path
 from shutil import copy2
 import json
 from datetime import datetime
-from utiles.strutil import data_line
+from smblib import timing
+from smblib.fileutil import atomic_write
+from smblib.record import Field, Ignore, Record
 
 
-class ConfigData():
+def _to_path(value):
+    if isinstance(value, str):
+        return Path(value)
+    if isinstance(value, Path):
+        return value
+    raise ValueError
+
+
+def _check_units_conf(record, value):
+    _path = _to_path(value)
+    if _path.root != '/':
+        _path = record.file_conf.parent.joinpath(_path)
+
+    if not _path.exists():
+        _path.mkdir(parents=True, exist_ok=True)
+    return _path
+
+
+def _check_installation(record, value):
+    _path = _to_path(value)
+    if _path.root != '/':
+        _path = Path('/opt').joinpath(_path)
+
+    if not _path.exists():
+        _path.mkdir(parents=True)
+    return _path
+
+
+def _check_libraries(record, value):
+    _path = _to_path(value)
+    if _path.root != '/':
+        _path = Path(record.installation).joinpath(_path)
+
+    if not _path.exists():
+        _path.mkdir(parents=True)
+    return _path
+
+
+def _check_seconds(record, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise Ignore
+
+
+def _check_metrics_dir(record, value):
+    _path = _to_path(value)
+    if _path.root != '/':
+        _path = Path('/var/lib/node_exporter').joinpath(_path)
+    return _path
+
+
+def _check_devices(record, value):
+    if value not in ("sysfs", "lsblk"):
+        raise Ignore
+    return value
+
+
+def _check_catalog(record, value):
+    _path = _to_path(value)
+    if _path.root != '/':
+        if record.file_conf is None:
+            raise Ignore
+        _path = record.file_conf.parent.joinpath(_path)
+    return _path
+
+
+def _check_units_mount(record, value):
+    _path = _to_path(value)
+    if _path.root != '/':
+        _path = Path('/mnt').joinpath(_path)
+    return _path
+
+
+class ConfigData(Record):
     """
     ConfigData
 
     Clase para el mantenimiento  de los datos
     y acceso al fichero de configuración de 'smbackup'
     """
+
+    __slots__ = ("__fileexists", "__fileconf", "__modtime", "__stamp")
+
+    Fields = (
+        Field("version", mark_null=True),
+        Field("uuid", mark_null=True),
+        Field("vendor", mark_null=True),
+        Field("model", mark_null=True),
+        Field("distro", mark_null=True),
+        Field("display", mark_null=True),
+        Field("email", mark_null=True),
+        Field("units_conf", _check_units_conf),
+        Field("installation", _check_installation),
+        Field("libraries", _check_libraries),
+        Field("units_mount", _check_units_mount),
+        # segundos sin uso antes de desmontar una unidad
+        Field("units_idle", _check_seconds, required=False),
+        # directorio textfile de node_exporter para las métricas
+        Field("metrics_dir", _check_metrics_dir, required=False),
+        # lectura de dispositivos: sysfs o lsblk, por defecto sysfs
+        Field("devices", _check_devices, required=False),
+        # catálogo SQLite de unidades en lugar de un JSON por unidad
+        Field("catalog", _check_catalog, required=False),
+    )
+
     def __init__(self, data=None):
+        super().__init__()
 
         self.__fileexists = False
         self.__fileconf = None
         self.__modtime = None
-
-        for key in self.keys():
-            self[key] = None
+        self.__stamp = None  # (mtime_ns, size) del fichero leído
 
         if isinstance(data, dict) or isinstance(data, ConfigData):
             for item in data.keys():
                 self[item] = data[item]
         elif isinstance(data, Path):
             self.load(data)
-        elif data is None:
-            for item in self.keys():
-                self[item] = None
-        else:
+        elif data is not None:
             raise ValueError("parametro inválido en ConfigData")
 
-        self.__changed = False
+        self.clean()
 
     def __str__(self):
+        from utiles.strutil import data_line
         _str = ""
         # _str += h1(self.display)
         # _str += h2(f"Versión: {self.version} - {self.m_time}")
@@ -58,24 +156,9 @@ class ConfigData():
         return _str
 
     def __del__(self):
-        if self.__changed:
+        if self.changed:
             raise NameError("Quedan modificaciones sin salvar")
 
-    def keys(self):
-        return [
-            "version", "uuid", "vendor", "model", "distro", "display", "email",
-            "units_conf", "installation", "libraries", "units_mount"
-        ]
-
-    def __getitem__(self, item):
-        return self.__getattribute__(item)
-
-    def __setitem__(self, item, value):
-        if item in self.keys():
-            self.__setattr__(item, value)
-        else:
-            raise NameError
-
     def load(self, pathfile):
         if isinstance(pathfile, str):
             _path = Path(pathfile)
@@ -87,16 +170,41 @@ class ConfigData():
         if _path.exists():
             self.__fileexists = True
             self.__fileconf = _path
-            self.__modtime = _path.stat().st_mtime
+            self.__set_stamp(_path.stat())
         else:
             raise RuntimeError("El fichero de configuración no existe")
 
-        with _path.open('r') as file:
-            _data = json.load(file)
-            for item in _data.keys():
-                self[item] = _data[item]
+        with timing.span("config.load", file=str(_path)):
+            with _path.open('r') as file:
+                _data = json.load(file)
+                for item in _data.keys():
+                    self[item] = _data[item]
+
+    def reload(self):
+        """
+        reload Vuelve a leer el fichero
+
+        Descarta las modificaciones no salvadas
+        """
+        if self.__fileconf is None:
+            return
+        self.load(self.__fileconf)
+        self.clean()
+
+    def __set_stamp(self, stat):
+        self.__modtime = stat.st_mtime
+        self.__stamp = (stat.st_mtime_ns, stat.st_size)
 
     def save(self, pathfile):
+        """
+        save Salva los datos
+
+        Sobre el propio fichero solo escribe si hay cambios. La escritura
+        es atómica y deja una copia del anterior en <fichero>~
+
+        Args:
+            pathfile (str|Path): fichero destino
+        """
         if isinstance(pathfile, str):
             _path = Path(pathfile)
         else:
@@ -106,20 +214,26 @@ class ConfigData():
             raise ValueError
 
         if str(self.__fileconf) == str(_path):
+            if not self.changed and _path.exists():
+                # nada que salvar
+                return
             if self.file_exists:
                 _backfile = str(self.file_conf) + '~'
                 copy2(str(self.file_conf), str(_backfile))
 
         _data = {}
-        for item in self.keys():
-            _data[item] = str(self[item])
-        with _path.open('w') as file:
-            json.dump(_data, file, indent=4, ensure_ascii=False)
+        for _field in self.Fields:
+            # los datos opcionales sin valor no se escriben
+            if not _field.required and self[_field.name] is None:
+                continue
+            _data[_field.name] = str(self[_field.name])
+        atomic_write(_path, json.dumps(_data, indent=4, ensure_ascii=False))
 
         self.__fileconf = _path
-        self.__modtime = self.__fileconf.stat().st_mtime
+        self.__fileexists = True
+        self.__set_stamp(self.__fileconf.stat())
 
-        self.__changed = False
+        self.clean()
 
     @property
     def file_conf(self):
@@ -137,168 +251,23 @@ class ConfigData():
 
     @property
     def changed(self):
-        return self.__changed
-
-    @property
-    def version(self):
-        return self.__version
-
-    @property
-    def uuid(self):
-        return self.__uuid
-
-    @property
-    def vendor(self):
-        return self.__vendor
-
-    @property
-    def model(self):
-        return self.__model
-
-    @property
-    def distro(self):
-        return self.__distro
-
-    @property
-    def display(self):
-        return self.__display
-
-    @property
-    def email(self):
-        return self.__email
-
-    @property
-    def units_conf(self):
-        return self.__units_conf
-
-    @property
-    def installation(self):
-        return self.__installation
+        return self.modified
 
     @property
-    def libraries(self):
-        return self.__libraries
-
-    @property
-    def units_mount(self):
-        return self.__units_mount
-
-    @version.setter
-    def version(self, value):
-        self.__version = value
-        self.__changed = True
-
-    @uuid.setter
-    def uuid(self, value):
-        self.__uuid = value
-        self.__changed = True
-
-    @vendor.setter
-    def vendor(self, value):
-        self.__vendor = value
-        self.__changed = True
-
-    @model.setter
-    def model(self, value):
-        self.__model = value
-        self.__changed = True
-
-    @distro.setter
-    def distro(self, value):
-        self.__distro = value
-        self.__changed = True
-
-    @display.setter
-    def display(self, value):
-        self.__display = value
-        self.__changed = True
-
-    @email.setter
-    def email(self, value):
-        self.__email = value
-        self.__changed = True
-
-    @units_conf.setter
-    def units_conf(self, value):
-        if isinstance(value, str):
-            _path = Path(value)
-        elif isinstance(value, Path):
-            _path = value
-        elif value is None:
-            self.__units_conf = None
-            return
-        else:
-            raise ValueError
-
-        if _path.root == '/':
-            self.__units_conf = _path
-        else:
-            self.__units_conf = self.__fileconf.parent.joinpath(_path)
-
-        if not self.__units_conf.exists():
-            self.__units_conf.mkdir(parents=True, exist_ok=True)
-
-        self.__changed = True
-
-    @installation.setter
-    def installation(self, value):
-        if isinstance(value, str):
-            _path = Path(value)
-        elif isinstance(value, Path):
-            _path = value
-        elif value is None:
-            self.__installation = None
-            return
-        else:
-            raise ValueError
-
-        if _path.root == '/':
-            self.__installation = _path
-        else:
-            self.__installation = Path('/opt').joinpath(_path)
-
-        if not self.__installation.exists():
-            self.__installation.mkdir(parents=True)
-
-        self.__changed = True
-
-    @libraries.setter
-    def libraries(self, value):
-        if isinstance(value, str):
-            _path = Path(value)
-        elif isinstance(value, Path):
-            _path = value
-        elif value is None:
-            self.__libraries = None
-            return
-        else:
-            raise ValueError
-
-        if _path.root == '/':
-            self.__libraries = _path
-        else:
-            self.__libraries = Path(self.__installation).joinpath(_path)
-
-        if not self.__libraries.exists():
-            self.__libraries.mkdir(parents=True)
-
-        self.__changed = True
-
-    @units_mount.setter
-    def units_mount(self, value):
-        if isinstance(value, str):
-            _path = Path(value)
-        elif isinstance(value, Path):
-            _path = value
-        elif value is None:
-            self.__units_mount = None
-            return
-        else:
-            raise ValueError
-
-        if _path.root == '/':
-            self.__units_mount = _path
-        else:
-            self.__units_mount = Path('/mnt').joinpath(_path)
-
-        self.__changed = True
+    def stale(self):
+        """
+        stale
+
+        Informa si el fichero ha cambiado en disco desde que se leyó
+        o se salvó
+
+        Returns:
+            bool: True si el fichero ha cambiado
+        """
+        if self.__fileconf is None:
+            return False
+        try:
+            _stat = self.__fileconf.stat()
+        except FileNotFoundError:
+            return True
+        return (_stat.st_mtime_ns, _stat.st_size) != self.__stamp
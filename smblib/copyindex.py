@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               copyindex.py
+===============================================================================
+
+    definición de la clase CopyIndex
+
+    Índice de las copias de una unidad, guardado en su directorio Meta
+    junto a las definiciones <copia>.json. Un único fichero resume cada
+    copia: nombre, origen, última ejecución, tamaño y estado.
+
+    El índice se mantiene al día con add, update y remove. Tras escribirlo
+    se fija la fecha de modificación del directorio Meta al sello guardado
+    en el índice; si alguien añade o borra una definición por su cuenta la
+    fecha cambia y el índice se reconstruye en memoria en la siguiente
+    lectura, y se guarda con la siguiente escritura. Leer el índice
+    nunca escribe en la unidad.
+
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from smblib.fileutil import atomic_write
+
+
+class CopyIndex(object):
+    """
+    CopyIndex
+
+    Índice de copias de una unidad
+    """
+
+    FileName = "copies.idx"
+
+    # datos de cada copia
+    Keys = ("name", "source", "last_run", "size", "status")
+
+    def __init__(self, metadir):
+        """
+        __init__ Constructor
+
+        Args:
+            metadir (str|Path): directorio Meta de la unidad montada
+        """
+        super().__init__()
+
+        self.__metadir = Path(metadir)
+        self.__pathfile = self.__metadir / self.FileName
+        self.__copies = None  # nombre -> datos, se lee en el primer uso
+        self.__stamp = None  # sello del índice en memoria
+
+    def __load(self):
+        """
+        __load Lee el índice si ha cambiado
+
+        Basta con consultar la fecha del directorio Meta: si coincide con
+        el sello del índice en memoria no hay nada que leer. Si el índice
+        no está al día se reconstruye solo en memoria: las lecturas no
+        escriben en la unidad, que puede estar montada de solo lectura
+        """
+        try:
+            _stamp = self.__metadir.stat().st_mtime_ns
+        except FileNotFoundError:
+            # unidad sin directorio Meta, sin copias
+            self.__copies = {}
+            self.__stamp = None
+            return
+        if self.__copies is not None and _stamp == self.__stamp:
+            return
+
+        _data = self.__read()
+        if _data is None or _data.get('stamp') != _stamp:
+            self.__copies = self.__scan(_data)
+        else:
+            self.__copies = _data['copies']
+        self.__stamp = _stamp
+
+    def __read(self):
+        try:
+            with self.__pathfile.open('r') as file:
+                _data = json.load(file)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(_data, dict):
+            return None
+        return _data
+
+    def __save(self):
+        _stamp = int(time.time() * 1e9)
+        atomic_write(
+            self.__pathfile,
+            json.dumps({
+                'stamp': _stamp,
+                'copies': self.__copies
+            }, indent=4))
+        # sello del índice como fecha del directorio
+        _stat = self.__metadir.stat()
+        os.utime(str(self.__metadir), ns=(_stat.st_atime_ns, _stamp))
+        self.__stamp = _stamp
+
+    def __scan(self, data):
+        """
+        __scan Copias según las definiciones <copia>.json del directorio Meta
+
+        Conserva los datos de ejecución de las copias ya indexadas
+
+        Args:
+            data (dict): índice guardado, None si no hay
+
+        Returns:
+            dict: nombre -> datos
+        """
+        if data is not None:
+            _old = data.get('copies') or {}
+        else:
+            _old = self.__copies or {}
+
+        _copies = {}
+        for _file in sorted(self.__metadir.glob('*.json')):
+            try:
+                with _file.open('r') as fcopy:
+                    _def = json.load(fcopy)
+            except (IOError, ValueError):
+                continue
+            _name = _file.stem
+            _entry = dict.fromkeys(self.Keys)
+            _entry.update(_old.get(_name, {}))
+            _entry['name'] = _name
+            if isinstance(_def, dict) and 'source' in _def:
+                _entry['source'] = _def['source']
+            _copies[_name] = _entry
+        return _copies
+
+    def rebuild(self):
+        """
+        rebuild Reconstruye y guarda el índice
+
+        Lee todas las definiciones <copia>.json del directorio Meta.
+        Conserva los datos de ejecución de las copias ya indexadas
+        """
+        self.__copies = self.__scan(self.__read())
+        self.__save()
+
+    def add(self, name, source, definition=None):
+        """
+        add Añade, o redefine, una copia
+
+        Escribe su definición <name>.json y la anota en el índice
+
+        Args:
+            name (str): nombre de la copia
+            source (str): origen de la copia
+            definition (dict): datos adicionales de la definición
+        """
+        self.__metadir.mkdir(parents=True, exist_ok=True)
+        self.__load()
+        _def = dict(definition or {})
+        _def['name'] = name
+        _def['source'] = str(source)
+        atomic_write(self.__metadir / (name + '.json'),
+                     json.dumps(_def, indent=4))
+
+        _entry = self.__copies.get(name, dict.fromkeys(self.Keys))
+        _entry['name'] = name
+        _entry['source'] = str(source)
+        self.__copies[name] = _entry
+        self.__save()
+
+    def update(self, name, **data):
+        """
+        update Actualiza los datos de una copia indexada
+
+        Args:
+            name (str): nombre de la copia
+            **data: last_run, size, status u otros datos de ejecución
+
+        Raises:
+            KeyError: si la copia no está indexada
+        """
+        self.__load()
+        self.__copies[name].update(data)
+        self.__save()
+
+    def remove(self, name):
+        """
+        remove Borra una copia y su definición
+
+        Args:
+            name (str): nombre de la copia
+
+        Returns:
+            bool: True si existía
+        """
+        self.__load()
+        if name not in self.__copies:
+            return False
+        _file = self.__metadir / (name + '.json')
+        if _file.exists():
+            _file.unlink()
+        del self.__copies[name]
+        self.__save()
+        return True
+
+    def definition(self, name):
+        """
+        definition Definición de una copia
+
+        Args:
+            name (str): nombre de la copia
+
+        Returns:
+            dict: contenido de <name>.json, None si no existe
+        """
+        try:
+            with (self.__metadir / (name + '.json')).open('r') as file:
+                _def = json.load(file)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(_def, dict):
+            return None
+        return _def
+
+    def get(self, name):
+        """
+        get Datos de una copia
+
+        Args:
+            name (str): nombre de la copia
+
+        Returns:
+            dict: datos, None si no existe
+        """
+        self.__load()
+        _entry = self.__copies.get(name)
+        if _entry is None:
+            return None
+        return dict(_entry)
+
+    def names(self):
+        self.__load()
+        return list(self.__copies)
+
+    def copies(self):
+        """
+        copies Datos de todas las copias
+
+        Returns:
+            list: [dict, ...]
+        """
+        self.__load()
+        return [dict(x) for x in self.__copies.values()]
+
+    def __len__(self):
+        self.__load()
+        return len(self.__copies)
+
+    @property
+    def MetaDir(self):
+        return self.__metadir
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                devices.py
+===============================================================================
+
+    definición de la clase Devices
+
+    Instantánea única de los dispositivos de bloque compartida por todas
+    las unidades. Se lee una sola vez, en el primer uso, y se indexa por
+    WWN de disco y UUID de partición.
+
+    Los dispositivos se leen de /sys, udev y mountinfo (SysBlockDevices)
+    o con lsblk (blkmod.BlockDevices), ver Backends.
+
+"""
+
+from threading import Lock
+from smblib import timing
+
+
+class Devices(object):
+    """
+    Devices
+
+    Instantánea de los dispositivos de bloque con índices
+    WWN -> disco y UUID -> partición
+    """
+
+    Backends = ("sysfs", "lsblk")
+
+    def __init__(self, source=None, backend=None):
+        """
+        __init__ Constructor
+
+        No accede a los dispositivos, la lectura se demora
+        hasta la primera consulta
+
+        Args:
+            source (callable): fábrica de objetos con la interfaz de
+                BlockDevices; si se indica no se usa backend
+            backend (str): sysfs o lsblk; por defecto sysfs si /sys/block
+                es legible
+
+        Raises:
+            ValueError: si backend no es uno de Backends
+        """
+        super().__init__()
+
+        if backend is not None and backend not in self.Backends:
+            raise ValueError(f"Capa de dispositivos desconocida: {backend}")
+        # la fábrica por defecto se importa en la primera lectura: blkmod
+        # no se carga si no se accede a los dispositivos
+        self.__source = source
+        self.__backend = backend
+
+        self.__lock = Lock()
+        self.__devices = None
+        self.__disks = {}  # wwn -> disco
+        self.__parts = {}  # uuid -> partición
+
+    def __scan(self):
+        """
+        __scan Lee los dispositivos
+
+        Enumera la capa de bloques una única vez y construye los índices
+        """
+        with self.__lock:
+            if self.__devices is not None:
+                return
+
+            if self.__source is None:
+                self.__source = self.__default_source()
+
+            with timing.span("devices.scan") as _span:
+                _devices = self.__source()
+                _disks = {}
+                _parts = {}
+                for _disk in _devices.ListDisks:
+                    if _disk.wwn is not None:
+                        _disks[_disk.wwn.lower()] = _disk
+                    for _part in _disk.partitions:
+                        if _part.uuid is not None:
+                            _parts[_part.uuid.lower()] = _part
+                _span.set(disks=len(_disks), partitions=len(_parts))
+
+            self.__disks = _disks
+            self.__parts = _parts
+            self.__devices = _devices
+
+    def __default_source(self):
+        from smblib import sysblock
+        if self.__backend == "sysfs" or (self.__backend is None
+                                         and sysblock.available()):
+            return sysblock.SysBlockDevices
+        from blkmod.blockdevices import BlockDevices
+        return BlockDevices
+
+    def update(self):
+        """
+        update Actualiza
+
+        Descarta la instantánea, se volverá a leer en la próxima consulta
+        """
+        with self.__lock:
+            self.__devices = None
+            self.__disks = {}
+            self.__parts = {}
+
+    def get_disk_wwn(self, wwn):
+        """
+        get_disk_wwn Disco por WWN
+
+        Args:
+            wwn (str): WWN del disco
+
+        Returns:
+            Disco: el disco si está conectado, si no None
+        """
+        if wwn is None:
+            return None
+        self.__scan()
+        return self.__disks.get(wwn.lower())
+
+    def get_partition_uuid(self, uuid):
+        """
+        get_partition_uuid Partición por UUID
+
+        Args:
+            uuid (str): UUID de la partición
+
+        Returns:
+            Partición: la partición si está conectada, si no None
+        """
+        if uuid is None:
+            return None
+        self.__scan()
+        return self.__parts.get(uuid.lower())
+
+    @property
+    def scanned(self):
+        """
+        scanned
+
+        Informa si ya se han leído los dispositivos
+
+        Returns:
+            bool: True si leídos
+        """
+        return self.__devices is not None
+
+    @property
+    def ListDisks(self):
+        self.__scan()
+        return self.__devices.ListDisks
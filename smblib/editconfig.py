@@ -33,7 +33,7 @@ class EditConfig():
 
         Realiza la presentación y controla el menú
         """
-        self.__LocalConf = Settings()
+        self.__LocalConf = Settings.shared()
 
         options = [{
             'item':
@@ -179,7 +179,7 @@ class EditConfig():
                     self.__LocalConf.units_mount.mkdir(parents=True)
                 except PermissionError:
                     input("No está autorizado para esta operación")
-                    self.__LocalConf = Settings()
+                    self.__LocalConf.reload()
 
         return
 
@@ -39,7 +39,7 @@ class EditUnits():
 
         clear()
 
-        self.__hConfig = Settings
+        self.__hConfig = Settings.shared()
         self.__myUnits = Units()
 
         opciones = [  # opciones menú
@@ -618,10 +618,11 @@ class EditUnits():
         """
         clear()
         print(h2('Lista de unidades'))
-        lista = self.__myUnits.get_list_names()
+        lista = []
         labels = []
-        for nameUnit in lista:
-            labels.append(self.__myUnits.get_unit(nameUnit).Label)
+        for unit in self.__myUnits.List:
+            lista.append(unit.name)
+            labels.append(str(unit.label))
         print("%s %s" % ('Nombre', 'LABEL'.rjust(60 - len('Nombre '))))
         print(f"{'-'*60}{color.MARRON}")
         if len(lista) == 0:
@@ -705,4 +706,6 @@ class EditUnits():
 
     def __update(self):
         self.__myDevs.update()
-        self.__myUnits = Units()
+        # refresh() no vuelve a leer los dispositivos por sí solo
+        self.__myUnits.Devices.update()
+        self.__myUnits.refresh()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                executor.py
+===============================================================================
+
+    definición de las clases Job y Executor
+
+    Ejecución concurrente de trabajos de copia con una cola por disco
+    físico (WWN de la unidad destino). Los trabajos sobre el mismo disco
+    se ejecutan en serie para no provocar saltos del cabezal; los de
+    discos distintos en paralelo. Un límite global acota los trabajos
+    simultáneos para no saturar la lectura del origen.
+
+    Opcionalmente (adaptive) los límites de caudal de los trabajos en
+    marcha (Throttle) se ajustan según la carga del sistema, y al
+    terminar cada trabajo se actualiza el fichero de métricas (Metrics).
+
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from smblib import timing
+from smblib.snapshot import Snapshot
+
+
+class Job(object):
+    """
+    Job
+
+    Trabajo de copia destinado a un disco
+    """
+    def __init__(self, name, wwn, func, *args, **kwargs):
+        """
+        __init__ Constructor
+
+        Args:
+            name (str): nombre del trabajo
+            wwn (str): WWN del disco destino, clave de su cola
+            func (callable): trabajo; si devuelve un dict con 'bytes'
+                se calcula el caudal
+            *args, **kwargs: argumentos de func
+        """
+        super().__init__()
+
+        self.name = name
+        self.wwn = wwn
+        self.func = func
+        self.__args = args
+        self.__kwargs = kwargs
+
+        self.throttle = None  # límites ajustables durante la ejecución
+        self.state = 'pending'  # pending, running, done, error
+        self.result = None
+        self.error = None
+        self.submitted = None
+        self.started = None
+        self.finished = None
+
+    def run(self):
+        self.state = 'running'
+        self.started = time.monotonic()
+        with timing.span("job", job=self.name, disk=self.wwn) as _span:
+            try:
+                self.result = self.func(*self.__args, **self.__kwargs)
+                self.state = 'done'
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self.state = 'error'
+            finally:
+                self.finished = time.monotonic()
+            _span.set(state=self.state)
+
+    @property
+    def waited(self):
+        """
+        waited Segundos en cola
+        """
+        if self.started is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def seconds(self):
+        """
+        seconds Segundos de ejecución
+        """
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @property
+    def throughput(self):
+        """
+        throughput Caudal
+
+        Returns:
+            float: bytes por segundo, None si se desconoce
+        """
+        if not isinstance(self.result, dict) or not self.seconds:
+            return None
+        _bytes = self.result.get('bytes')
+        if _bytes is None:
+            return None
+        return _bytes / self.seconds
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'wwn': self.wwn,
+            'state': self.state,
+            'waited': self.waited,
+            'seconds': self.seconds,
+            'throughput': self.throughput,
+            'error': self.error
+        }
+
+
+class Executor(object):
+    """
+    Executor
+
+    Ejecutor con una cola y un hilo por disco destino
+    """
+    # carga por CPU por encima de la que se reducen los límites y por
+    # debajo de la que se recuperan
+    HighLoad = 1.0
+    LowLoad = 0.5
+    MinFactor = 0.1
+
+    def __init__(self, max_jobs=2, adaptive=False, interval=10,
+                 metrics=None):
+        """
+        __init__ Constructor
+
+        Args:
+            max_jobs (int): máximo de trabajos simultáneos en total,
+                limita la presión de lectura sobre el origen
+            adaptive (bool): ajustar los límites de caudal de los
+                trabajos en marcha según la carga del sistema
+            interval (float): segundos entre ajustes
+            metrics (Metrics): métricas a actualizar al terminar cada
+                trabajo
+        """
+        super().__init__()
+
+        self.__adaptive = adaptive
+        self.__interval = interval
+        self.__factor = 1.0
+        self.__monitor = None
+        self.__metrics = metrics
+
+        self.__slots = threading.BoundedSemaphore(max_jobs)
+        self.__lock = threading.Condition()
+        self.__queues = {}  # wwn -> deque de trabajos pendientes
+        self.__workers = {}  # wwn -> hilo
+        self.__jobs = []
+        self.__start = None
+        self.__end = None
+
+    def submit(self, job):
+        """
+        submit Encola un trabajo en la cola de su disco
+
+        Args:
+            job (Job): trabajo
+
+        Returns:
+            Job: el mismo trabajo
+        """
+        with self.__lock:
+            if self.__start is None:
+                self.__start = time.monotonic()
+            self.__end = None
+            job.submitted = time.monotonic()
+            self.__jobs.append(job)
+            self.__queues.setdefault(job.wwn, deque()).append(job)
+            if job.wwn not in self.__workers:
+                _worker = threading.Thread(target=self.__work,
+                                           args=(job.wwn, ),
+                                           name=f"disk-{job.wwn}",
+                                           daemon=True)
+                self.__workers[job.wwn] = _worker
+                _worker.start()
+            if self.__adaptive and self.__monitor is None:
+                self.__monitor = threading.Thread(target=self.__adapt,
+                                                  name="executor-adapt",
+                                                  daemon=True)
+                self.__monitor.start()
+        return job
+
+    def submit_snapshot(self, unit, name, pool=None, **kwargs):
+        """
+        submit_snapshot Encola una instantánea de una copia de una unidad
+
+        Args:
+            unit (Unit): unidad destino
+            name (str): nombre de la copia
+            pool (MountPool): si se indica la unidad se toma prestada
+                durante el trabajo
+            **kwargs: argumentos adicionales de Snapshot
+
+        Returns:
+            Job: el trabajo
+        """
+        _job = Job(f"{unit.name}/{name}", unit.wwn, None)
+
+        def _run():
+            if pool is None:
+                return self.__snapshot(_job, unit, name, **kwargs)
+            with pool.lease(unit):
+                return self.__snapshot(_job, unit, name, **kwargs)
+
+        _job.func = _run
+        return self.submit(_job)
+
+    @staticmethod
+    def __snapshot(job, unit, name, **kwargs):
+        _snap = Snapshot(unit, name, **kwargs)
+        job.throttle = _snap.Throttle
+        return _snap.run()
+
+    def __adapt(self):
+        """
+        __adapt Ajusta los límites de los trabajos en marcha a la carga
+
+        Con carga alta los reduce a la mitad, hasta MinFactor; con carga
+        baja los recupera poco a poco hasta los configurados
+        """
+        while True:
+            with self.__lock:
+                if self.__lock.wait_for(lambda: len(self.__workers) == 0,
+                                        self.__interval):
+                    self.__monitor = None
+                    return
+                _running = [
+                    x for x in self.__jobs if x.state == 'running'
+                    and x.throttle is not None and x.throttle.adjustable
+                ]
+            _load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            if _load > self.HighLoad:
+                self.__factor = max(self.MinFactor, self.__factor / 2)
+            elif _load < self.LowLoad:
+                self.__factor = min(1.0, self.__factor * 1.5)
+            for _job in _running:
+                _job.throttle.adjust(self.__factor)
+
+    def __work(self, wwn):
+        while True:
+            with self.__lock:
+                _queue = self.__queues[wwn]
+                if len(_queue) == 0:
+                    del self.__workers[wwn]
+                    if len(self.__workers) == 0:
+                        self.__end = time.monotonic()
+                    self.__lock.notify_all()
+                    return
+                _job = _queue.popleft()
+
+            with self.__slots:
+                _job.run()
+            if self.__metrics is not None:
+                try:
+                    self.__metrics.write()
+                except OSError:
+                    # las métricas no deben detener las copias
+                    pass
+
+    def wait(self, timeout=None):
+        """
+        wait Espera a que terminen todos los trabajos
+
+        Args:
+            timeout (float): segundos máximos de espera
+
+        Returns:
+            bool: True si han terminado todos
+        """
+        with self.__lock:
+            return self.__lock.wait_for(lambda: len(self.__workers) == 0,
+                                        timeout)
+
+    def queue_depth(self):
+        """
+        queue_depth Trabajos pendientes por disco
+
+        Returns:
+            dict: wwn -> número de trabajos en cola
+        """
+        with self.__lock:
+            return {wwn: len(queue) for wwn, queue in self.__queues.items()}
+
+    def stats(self):
+        """
+        stats Estadísticas de la ejecución
+
+        Returns:
+            dict: wall (segundos desde el primer trabajo hasta el fin del
+            último), queues (pendientes por disco) y jobs (por trabajo:
+            espera, duración y caudal)
+        """
+        with self.__lock:
+            _jobs = list(self.__jobs)
+            if self.__start is None:
+                _wall = None
+            elif self.__end is None:
+                _wall = time.monotonic() - self.__start
+            else:
+                _wall = self.__end - self.__start
+        return {
+            'wall': _wall,
+            'factor': self.__factor,
+            'queues': self.queue_depth(),
+            'jobs': [job.stats() for job in _jobs]
+        }
+
+    @property
+    def Jobs(self):
+        return list(self.__jobs)
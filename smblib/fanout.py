@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                 fanout.py
+===============================================================================
+
+    definición de la clase FanOut
+
+    Copia de un origen en varias unidades a la vez leyéndolo una sola vez.
+    El origen se recorre una vez; cada unidad calcula lo que le falta
+    respecto a su propia instantánea anterior (con su diario o comparando
+    tamaño y fecha con ella) y cada fichero que necesita alguna unidad se
+    lee una vez y se entrega a un hilo escritor por unidad.
+
+    Cada unidad obtiene una instantánea normal de Snapshot: su directorio
+    con fecha, su enlace 'latest', su diario y su entrada en el índice de
+    copias. El fallo de una unidad no afecta a las demás.
+
+    Cada escritor respeta el uso de caché (UnitData.cache, "direct" se
+    trata como "dontneed") y los límites (Snapshot.Throttle) de su unidad:
+    nice e ionice se aplican a su hilo y el caudal se limita al escribir.
+    Como el origen se lee una vez para todas, la cola acotada de cada
+    escritor hace que la lectura vaya al ritmo de la unidad más lenta.
+
+"""
+
+import logging
+import os
+import queue
+import stat
+import threading
+import time
+
+from smblib.journal import compare, scan
+from smblib.localcopy import LocalCopy, set_meta
+from smblib.snapshot import Snapshot
+from smblib.throttle import Pace
+
+_log = logging.getLogger(__name__)
+
+
+class _Target(object):
+    """
+    _Target
+
+    Instantánea en curso de una unidad y su hilo escritor
+    """
+    def __init__(self, snapshot, depth):
+        self.snapshot = snapshot
+        self.when, self.work, self.final = snapshot.begin()
+        self.changed = []
+        self.removed = []
+        self.needs = set()
+        self.files = 0
+        self.bytes = 0
+        self.error = None
+        self.queue = queue.Queue(depth)
+        self.cache = snapshot.Unit.cache or "normal"
+        self.copy = LocalCopy(cache=self.cache)
+        self.throttle = snapshot.Throttle
+        self.pace = None
+        if self.throttle is not None \
+                and 'bwlimit' in self.throttle.limits:
+            self.pace = Pace(self.throttle.limits['bwlimit'])
+        self.thread = threading.Thread(target=self.__write,
+                                       name=f"fanout-{snapshot.Unit.name}",
+                                       daemon=True)
+
+    def __write(self):
+        _file = None
+        _path = None
+        _state = None
+        _written = 0
+        if self.throttle is not None:
+            _skipped = self.throttle.apply()
+            if _skipped:
+                _log.warning("%s: límites no aplicables en fanout: %s",
+                             self.snapshot.Unit.name, ", ".join(_skipped))
+        while True:
+            _op, _arg = self.queue.get()
+            if _op == 'end':
+                try:
+                    self.copy.flush()
+                except OSError as e:
+                    self.error = self.error or f"{_path}: {e}"
+                return
+            if self.error is not None:
+                continue
+            try:
+                if _op == 'open':
+                    _path, _state = _arg
+                    _file = open(str(self.work / _path), 'wb')
+                    _written = 0
+                elif _op == 'data':
+                    if self.pace is not None:
+                        self.pace.wait(len(_arg))
+                    _file.write(_arg)
+                    _written += len(_arg)
+                    self.bytes += len(_arg)
+                    if self.cache != "normal" \
+                            and _written % LocalCopy.DropChunk < len(_arg):
+                        _file.flush()
+                        LocalCopy.drop(_file.fileno(), _written)
+                elif _op == 'close':
+                    if self.cache != "normal":
+                        _file.flush()
+                        if _written >= LocalCopy.DropChunk:
+                            LocalCopy.drop(_file.fileno())
+                    _file.close()
+                    _file = None
+                    if self.cache != "normal" \
+                            and _written < LocalCopy.DropChunk:
+                        self.copy.defer(self.work / _path, _written)
+                    set_meta(self.work / _path, _state)
+                    self.files += 1
+                elif _op == 'abort':
+                    # desaparecido del origen durante la copia
+                    _file.close()
+                    _file = None
+                    os.unlink(str(self.work / _path))
+            except OSError as e:
+                self.error = f"{_path}: {e}"
+                if _file is not None:
+                    _file.close()
+                    _file = None
+
+
+class FanOut(object):
+    """
+    FanOut
+
+    Copia de un origen en varias unidades con una sola lectura
+    """
+
+    BlockSize = 1 << 20
+    QueueDepth = 16  # bloques en cola por unidad
+
+    def __init__(self, units, name, source=None, journal=False,
+                 limits=None):
+        """
+        __init__ Constructor
+
+        Args:
+            units (list): unidades destino, deben estar conectadas
+            name (str): nombre de la copia, el mismo en todas
+            source (str|Path): origen; por defecto el del índice de copias
+                de la primera unidad
+            journal (bool): detectar los cambios de cada unidad con su
+                diario; si no, comparando con su instantánea anterior
+            limits (dict): límites de recursos para todas las unidades;
+                por defecto los de cada una, como en Snapshot
+
+        Raises:
+            RuntimeError: si alguna unidad no está conectada
+            ValueError: si no hay origen
+        """
+        super().__init__()
+
+        self.__snapshots = []
+        for _unit in units:
+            _snap = Snapshot(_unit, name, source, journal=journal,
+                             limits=limits)
+            if source is None:
+                source = _snap.Source
+            self.__snapshots.append(_snap)
+        if len(self.__snapshots) == 0:
+            raise ValueError("Sin unidades destino")
+        self.__source = self.__snapshots[0].Source
+        self.__name = name
+
+    def __plan(self, target, states):
+        """
+        __plan Lo que necesita una unidad respecto a su instantánea anterior
+        """
+        _snap = target.snapshot
+        _previous = _snap.previous()
+        if _previous is not None and _snap.clone(_previous, target.work):
+            _diff = None
+            if _snap.Journal is not None:
+                _diff = _snap.Journal.diff(states)
+            if _diff is None:
+                # sin diario: comparación rápida con la instantánea
+                _diff = compare(scan(_previous), states)
+            target.changed, target.removed = _diff
+            _snap.prune(target.work, target.changed, target.removed)
+        else:
+            target.work.mkdir()
+            target.changed = sorted(states)
+        target.needs = set(target.changed)
+
+    def run(self):
+        """
+        run Crea una instantánea en cada unidad
+
+        Returns:
+            dict: nombre de la unidad -> resultado de Snapshot.finish, más
+            read_bytes, los bytes leídos del origen
+        """
+        _start = time.monotonic()
+        _states = scan(self.__source)
+        _targets = [_Target(x, self.QueueDepth) for x in self.__snapshots]
+        for _target in _targets:
+            self.__plan(_target, _states)
+            _target.thread.start()
+
+        _read = 0
+        _vanished = set()
+        _dirs = []
+        _paths = sorted(set().union(*(x.needs for x in _targets)))
+        for _path in _paths:
+            _need = [x for x in _targets if _path in x.needs]
+            _src = self.__source / _path
+            try:
+                _stat = os.lstat(str(_src))
+                if stat.S_ISDIR(_stat.st_mode):
+                    self.__each(_need, _path,
+                                lambda x: x.mkdir(exist_ok=True))
+                    _dirs.append((_path, _stat, _need))
+                elif stat.S_ISLNK(_stat.st_mode):
+                    _link = os.readlink(str(_src))
+
+                    def _symlink(dst, link=_link, st=_stat):
+                        os.symlink(link, str(dst))
+                        set_meta(dst, st, False)
+
+                    self.__each(_need, _path, _symlink)
+                elif stat.S_ISREG(_stat.st_mode):
+                    _read += self.__stream(_src, _path, _stat, _need)
+                else:
+                    # ni fichero, ni directorio, ni enlace
+                    _vanished.add(_path)
+            except FileNotFoundError:
+                _vanished.add(_path)
+            except OSError as e:
+                # error de lectura del origen
+                for _target in _need:
+                    _target.error = _target.error or f"{_path}: {e}"
+
+        for _target in _targets:
+            _target.queue.put(('end', None))
+        for _target in _targets:
+            _target.thread.join()
+            # lo no copiado tampoco queda del clon
+            _target.snapshot.prune(_target.work, [], sorted(_vanished))
+        # fechas de los directorios después de su contenido
+        for _path, _stat, _need in reversed(_dirs):
+            self.__each(_need, _path, lambda x, st=_stat: set_meta(x, st))
+
+        _seconds = time.monotonic() - _start
+        _final = {x: y for x, y in _states.items() if x not in _vanished}
+        _results = {}
+        for _target in _targets:
+            _result = {
+                'status': 'ok',
+                'returncode': None,
+                'seconds': _seconds,
+                'error': _target.error,
+                'files': _target.files,
+                'bytes': _target.bytes,
+                'size': None,
+                'mode': 'fanout',
+                'changed': len(_target.changed),
+                'removed': len(_target.removed),
+                'read_bytes': _read
+            }
+            if _target.error is not None:
+                _result['status'] = 'error'
+            elif _vanished & _target.needs:
+                _result['status'] = 'warning'
+            _results[_target.snapshot.Unit.name] = _target.snapshot.finish(
+                _target.when, _target.work, _target.final, _result, _final)
+        return _results
+
+    @staticmethod
+    def __each(targets, path, func):
+        """
+        __each Aplica una operación a la ruta en cada unidad
+
+        Un error solo afecta a la unidad en la que se produce
+
+        Args:
+            targets (list): _Target
+            path (str): ruta relativa
+            func (callable): func(ruta en la instantánea de la unidad)
+        """
+        for _target in targets:
+            if _target.error is not None:
+                continue
+            try:
+                func(_target.work / path)
+            except OSError as e:
+                _target.error = f"{path}: {e}"
+
+    def __stream(self, source, path, st, targets):
+        """
+        __stream Lee un fichero una vez y lo entrega a los escritores
+
+        Returns:
+            int: bytes leídos
+        """
+        _read = 0
+        _targets = [x for x in targets if x.error is None]
+        # el origen no se queda en caché si alguna unidad lo pide
+        _drop = any(x.cache != "normal" for x in _targets)
+        with open(str(source), 'rb') as file:
+            if _drop:
+                os.posix_fadvise(file.fileno(), 0, 0,
+                                 os.POSIX_FADV_SEQUENTIAL)
+            for _target in _targets:
+                _target.queue.put(('open', (path, st)))
+            try:
+                while True:
+                    _block = file.read(self.BlockSize)
+                    if not _block:
+                        break
+                    _read += len(_block)
+                    for _target in _targets:
+                        _target.queue.put(('data', _block))
+                    if _drop and _read % LocalCopy.DropChunk < len(_block):
+                        os.posix_fadvise(file.fileno(), 0, _read,
+                                         os.POSIX_FADV_DONTNEED)
+            except OSError:
+                for _target in _targets:
+                    _target.queue.put(('abort', None))
+                raise
+            if _drop:
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        for _target in _targets:
+            _target.queue.put(('close', None))
+        return _read
+
+    @property
+    def Snapshots(self):
+        return list(self.__snapshots)
+
+    @property
+    def Source(self):
+        return self.__source
+
+    @property
+    def Name(self):
+        return self.__name
+
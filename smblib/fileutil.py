@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                fileutil.py
+===============================================================================
+
+    Utilidades de escritura segura de ficheros
+
+    Se escribe en un temporal del mismo directorio, se sincroniza y se
+    renombra sobre el destino. Un corte de luz deja el fichero anterior
+    o el nuevo, nunca uno a medias.
+
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+
+def fsync_dir(path):
+    """
+    fsync_dir Sincroniza un directorio
+
+    Necesario para que un renombrado sobreviva a un corte de luz
+
+    Args:
+        path (str|Path): directorio
+    """
+    _fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(_fd)
+    finally:
+        os.close(_fd)
+
+
+def write_temp(path, data):
+    """
+    write_temp Escribe y sincroniza el temporal de un fichero
+
+    El temporal conserva los permisos del fichero si ya existía. Su
+    nombre es único (mkstemp): varios hilos pueden escribir a la vez el
+    mismo fichero, gana el último renombrado
+
+    Args:
+        path (str|Path): fichero destino
+        data (str|bytes): contenido
+
+    Returns:
+        Path: el temporal, listo para renombrar sobre path
+    """
+    _path = Path(path)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    _fd, _temp = tempfile.mkstemp(prefix=f".{_path.name}.",
+                                  suffix=".tmp",
+                                  dir=str(_path.parent))
+    _temp = Path(_temp)
+    try:
+        try:
+            _mode = os.stat(str(_path)).st_mode & 0o7777
+        except FileNotFoundError:
+            # mkstemp crea el temporal con 0600
+            _mode = 0o644
+        os.fchmod(_fd, _mode)
+        _view = memoryview(data)
+        while _view:
+            _view = _view[os.write(_fd, _view):]
+        os.fsync(_fd)
+    except BaseException:
+        os.close(_fd)
+        _temp.unlink()
+        raise
+    os.close(_fd)
+    return _temp
+
+
+def atomic_write(path, data):
+    """
+    atomic_write Escritura atómica
+
+    Args:
+        path (str|Path): fichero destino
+        data (str|bytes): contenido
+    """
+    _path = Path(path)
+    _temp = write_temp(_path, data)
+    os.replace(str(_temp), str(_path))
+    fsync_dir(_path.parent)
+
+
+class AtomicBatch(object):
+    """
+    AtomicBatch
+
+    Agrupa varias escrituras atómicas. Cada fichero se escribe y
+    sincroniza en su temporal al añadirlo; commit() los renombra todos
+    y sincroniza una sola vez cada directorio afectado.
+    """
+    def __init__(self):
+        self.__pending = []  # [(temporal, destino, callback, anterior)]
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def add(self, path, data, callback=None, rename=None):
+        """
+        add Añade un fichero al lote
+
+        Args:
+            path (str|Path): fichero destino
+            data (str|bytes): contenido
+            callback (callable): se llama sin argumentos tras el commit
+            rename (str|Path): fichero actual que pasa a llamarse path; en
+                el commit se renombra y después se escribe el contenido,
+                de modo que nunca existen los dos
+        """
+        _path = Path(path)
+        if rename is not None:
+            rename = Path(rename)
+        self.__pending.append((write_temp(_path, data), _path, callback,
+                               rename))
+
+    def commit(self):
+        """
+        commit Renombra los temporales sobre sus destinos
+
+        Si falla un renombrado los anteriores ya están escritos: se
+        sincronizan y se llama a sus callbacks antes de propagar el error,
+        y los temporales restantes se descartan
+
+        Returns:
+            int: número de ficheros escritos
+        """
+        _dirs = set()
+        _done = 0
+        try:
+            for _temp, _path, _callback, _rename in self.__pending:
+                if _rename is not None and _rename != _path:
+                    try:
+                        os.replace(str(_rename), str(_path))
+                    except FileNotFoundError:
+                        pass
+                    _dirs.add(_rename.parent)
+                os.replace(str(_temp), str(_path))
+                _dirs.add(_path.parent)
+                _done += 1
+        finally:
+            _written = self.__pending[:_done]
+            self.__pending = self.__pending[_done:]
+            self.rollback()
+            for _dir in _dirs:
+                fsync_dir(_dir)
+            for _temp, _path, _callback, _rename in _written:
+                if _callback is not None:
+                    _callback()
+        return _done
+
+    def rollback(self):
+        """
+        rollback Descarta los temporales pendientes
+        """
+        for _temp, _path, _callback, _rename in self.__pending:
+            try:
+                _temp.unlink()
+            except FileNotFoundError:
+                pass
+        self.__pending = []
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                inotify.py
+===============================================================================
+
+    Acceso mínimo a inotify de Linux mediante ctypes
+
+    Sin dependencias externas. En sistemas sin inotify available()
+    devuelve False y Inotify() lanza OSError.
+
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                        use_errno=True)
+    _libc.inotify_init1
+except (OSError, AttributeError):
+    _libc = None
+
+
+def available():
+    """
+    available
+
+    Returns:
+        bool: True si el sistema dispone de inotify
+    """
+    return _libc is not None
+
+
+class Inotify(object):
+    """
+    Inotify
+
+    Descriptor inotify no bloqueante. Se espera con select()
+    sobre fileno() y se leen los eventos con read()
+    """
+    def __init__(self):
+        if _libc is None:
+            raise OSError("inotify no disponible")
+
+        self.__fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            _errno = ctypes.get_errno()
+            raise OSError(_errno, os.strerror(_errno))
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        _fd = getattr(self, '_Inotify__fd', -1)
+        if _fd >= 0:
+            os.close(_fd)
+            self.__fd = -1
+
+    def fileno(self):
+        return self.__fd
+
+    def add_watch(self, path, mask):
+        """
+        add_watch Vigila un fichero o directorio
+
+        Args:
+            path (str|Path): ruta a vigilar
+            mask (int): eventos IN_*
+
+        Returns:
+            int: descriptor de la vigilancia
+        """
+        _wd = _libc.inotify_add_watch(self.__fd, os.fsencode(str(path)),
+                                      ctypes.c_uint32(mask))
+        if _wd < 0:
+            _errno = ctypes.get_errno()
+            raise OSError(_errno, os.strerror(_errno), str(path))
+        return _wd
+
+    def rm_watch(self, wd):
+        _libc.inotify_rm_watch(self.__fd, wd)
+
+    def read(self):
+        """
+        read Lee los eventos pendientes sin bloquear
+
+        Returns:
+            list: [(wd, mask, cookie, name), ...] vacía si no hay eventos
+        """
+        try:
+            _buffer = os.read(self.__fd, 65536)
+        except BlockingIOError:
+            return []
+
+        _events = []
+        _offset = 0
+        while _offset < len(_buffer):
+            _wd, _mask, _cookie, _len = _EVENT.unpack_from(_buffer, _offset)
+            _offset += _EVENT.size
+            _name = _buffer[_offset:_offset + _len].rstrip(b'\0')
+            _offset += _len
+            _events.append((_wd, _mask, _cookie, os.fsdecode(_name)))
+        return _events
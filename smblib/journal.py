@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                journal.py
+===============================================================================
+
+    definición de las clases FileState y Journal
+
+    Diario del estado de los ficheros del origen de una copia: por cada
+    ruta su tipo, inodo, tamaño, mtime_ns y ctime_ns tal como estaban en
+    la última instantánea completa.
+
+    Comparar el origen con el diario da la lista exacta de lo nuevo,
+    modificado y borrado sin que rsync tenga que recorrer y comparar el
+    árbol entero. El recorrido se reparte entre varios hilos, uno por
+    directorio pendiente, con os.scandir. Con un registro de cambios
+    (ChangeLog) ni siquiera se recorre: solo se examinan sus rutas.
+
+    El diario se guarda en <Meta>/journal/<copia>.journal: registros
+    separados por NUL con los campos separados por tabuladores y la ruta
+    al final.
+
+"""
+
+import os
+import stat
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from smblib.fileutil import atomic_write
+
+# estado de una ruta: tipo ('f' fichero, 'd' directorio, 'l' enlace,
+# 'o' otro), inodo, tamaño, mtime_ns y ctime_ns
+FileState = namedtuple("FileState", "type ino size mtime ctime")
+
+
+def _state(entry):
+    _stat = entry.stat(follow_symlinks=False)
+    _mode = _stat.st_mode
+    if stat.S_ISREG(_mode):
+        _type = 'f'
+    elif stat.S_ISDIR(_mode):
+        _type = 'd'
+    elif stat.S_ISLNK(_mode):
+        _type = 'l'
+    else:
+        _type = 'o'
+    return FileState(_type, _stat.st_ino, _stat.st_size, _stat.st_mtime_ns,
+                     _stat.st_ctime_ns)
+
+
+def _scan_dir(path, prefix):
+    """
+    _scan_dir Estado de las entradas de un directorio
+
+    Returns:
+        tuple: ({ruta relativa: FileState}, [(subdirectorio, prefijo)])
+    """
+    _states = {}
+    _subdirs = []
+    try:
+        _iter = os.scandir(path)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return _states, _subdirs
+    with _iter:
+        for _entry in _iter:
+            _rel = prefix + _entry.name
+            try:
+                _states[_rel] = _state(_entry)
+            except FileNotFoundError:
+                # borrado durante el recorrido
+                continue
+            if _states[_rel].type == 'd':
+                _subdirs.append((_entry.path, _rel + '/'))
+    return _states, _subdirs
+
+
+class _DirEntry(object):
+    """
+    _DirEntry Entrada con un stat ya hecho, para _state
+    """
+    def __init__(self, path, stat):
+        self.path = path
+        self.__stat = stat
+
+    def stat(self, follow_symlinks=True):
+        return self.__stat
+
+
+def scan(source, workers=8, prefix=''):
+    """
+    scan Estado de todas las rutas bajo un directorio
+
+    Args:
+        source (str|Path): directorio raíz
+        workers (int): hilos de recorrido
+        prefix (str): prefijo de las rutas relativas devueltas
+
+    Returns:
+        dict: {ruta relativa: FileState}
+    """
+    _states = {}
+    with ThreadPoolExecutor(max_workers=workers) as _pool:
+        _pending = {_pool.submit(_scan_dir, str(source), prefix)}
+        while _pending:
+            _done, _pending = wait(_pending, return_when=FIRST_COMPLETED)
+            for _future in _done:
+                _found, _subdirs = _future.result()
+                _states.update(_found)
+                for _path, _prefix in _subdirs:
+                    _pending.add(_pool.submit(_scan_dir, _path, _prefix))
+    return _states
+
+
+class Journal(object):
+    """
+    Journal
+
+    Diario del estado de los ficheros del origen de una copia
+    """
+
+    DirName = "journal"
+    Extension = ".journal"
+
+    def __init__(self, metadir, name):
+        """
+        __init__ Constructor
+
+        Args:
+            metadir (str|Path): directorio Meta de la unidad montada
+            name (str): nombre de la copia
+        """
+        super().__init__()
+
+        self.__pathfile = Path(metadir) / self.DirName / (name +
+                                                          self.Extension)
+        self.__states = None  # se lee en el primer uso
+
+    def load(self):
+        """
+        load Estado guardado
+
+        Returns:
+            dict: {ruta relativa: FileState}, None si no hay diario
+        """
+        if self.__states is not None:
+            return self.__states
+        try:
+            with self.__pathfile.open('rb') as file:
+                _data = file.read()
+        except FileNotFoundError:
+            return None
+
+        _states = {}
+        for _record in _data.split(b'\0'):
+            if not _record:
+                continue
+            _type, _ino, _size, _mtime, _ctime, _path = _record.split(b'\t',
+                                                                       5)
+            _states[os.fsdecode(_path)] = FileState(_type.decode(), int(_ino),
+                                                    int(_size), int(_mtime),
+                                                    int(_ctime))
+        self.__states = _states
+        return _states
+
+    def save(self, states):
+        """
+        save Guarda el estado de forma atómica
+
+        Args:
+            states (dict): {ruta relativa: FileState}
+        """
+        self.__pathfile.parent.mkdir(exist_ok=True)
+        atomic_write(
+            self.__pathfile, b''.join(
+                b'%s\t%d\t%d\t%d\t%d\t%s\0' %
+                (x.type.encode(), x.ino, x.size, x.mtime, x.ctime,
+                 os.fsencode(path)) for path, x in states.items()))
+        self.__states = states
+
+    def remove(self):
+        if self.__pathfile.exists():
+            self.__pathfile.unlink()
+        self.__states = None
+
+    def diff(self, states):
+        """
+        diff Diferencias entre el estado guardado y uno nuevo
+
+        Args:
+            states (dict): estado actual, resultado de scan
+
+        Returns:
+            tuple: (changed, removed) listas ordenadas de rutas nuevas o
+            modificadas y de rutas borradas. Las que han cambiado de tipo
+            están en las dos. None si no hay diario
+        """
+        _old = self.load()
+        if _old is None:
+            return None
+        _changed = []
+        _removed = []
+        for _path, _state in states.items():
+            _prev = _old.get(_path)
+            if _prev is None or _prev != _state:
+                _changed.append(_path)
+                if _prev is not None and _prev.type != _state.type:
+                    _removed.append(_path)
+        _removed += [x for x in _old if x not in states]
+        _changed.sort()
+        _removed.sort()
+        return _changed, _removed
+
+    def apply(self, source, paths):
+        """
+        apply Estado actual a partir del guardado y las rutas modificadas
+
+        Solo se examinan las rutas indicadas, sin recorrer el árbol
+
+        Args:
+            source (str|Path): directorio de origen
+            paths (dict): {ruta relativa: recursiva} tomado de un
+                ChangeLog; si recursiva se examina también el subárbol
+
+        Returns:
+            dict: {ruta relativa: FileState}, None si no hay diario
+        """
+        _old = self.load()
+        if _old is None:
+            return None
+        _states = dict(_old)
+        _prefixes = []  # subárboles a descartar del estado guardado
+        _found = {}
+        for _path, _recursive in paths.items():
+            _file = os.path.join(str(source), _path)
+            try:
+                _stat = os.lstat(_file)
+            except (FileNotFoundError, NotADirectoryError):
+                _states.pop(_path, None)
+                _prefixes.append(_path + '/')
+                continue
+            _prev = _states.get(_path)
+            _new = _state(_DirEntry(_file, _stat))
+            _states[_path] = _new
+            if _new.type == 'd':
+                if _recursive or (_prev is not None and _prev.type != 'd'):
+                    _prefixes.append(_path + '/')
+                    _found.update(scan(_file, prefix=_path + '/'))
+            elif _prev is not None and _prev.type == 'd':
+                _prefixes.append(_path + '/')
+
+        if _prefixes:
+            _prefixes = tuple(_prefixes)
+            _states = {
+                path: x
+                for path, x in _states.items()
+                if not path.startswith(_prefixes)
+            }
+        _states.update(_found)
+        return _states
+
+    @property
+    def exists(self):
+        return self.__pathfile.exists()
+
+    @property
+    def PathFile(self):
+        return self.__pathfile
+
+
+def compare(old, new):
+    """
+    compare Diferencias por tipo, tamaño y fecha de modificación
+
+    Comparación rápida, como la de rsync, para cuando no hay diario:
+    old es el estado de la instantánea anterior
+
+    Returns:
+        tuple: (changed, removed) como Journal.diff
+    """
+    _changed = []
+    _removed = []
+    for _path, _state in new.items():
+        _prev = old.get(_path)
+        if _prev is None or (_prev.type, _prev.size, _prev.mtime) != \
+                (_state.type, _state.size, _state.mtime):
+            _changed.append(_path)
+            if _prev is not None and _prev.type != _state.type:
+                _removed.append(_path)
+    _removed += [x for x in old if x not in new]
+    _changed.sort()
+    _removed.sort()
+    return _changed, _removed
+
+
+def write_files_from(pathfile, paths):
+    """
+    write_files_from Lista de rutas para rsync --files-from --from0
+
+    Args:
+        pathfile (str|Path): fichero de la lista
+        paths (list): rutas relativas al origen
+    """
+    with open(str(pathfile), 'wb') as file:
+        for _path in paths:
+            file.write(os.fsencode(_path) + b'\0')
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               localcopy.py
+===============================================================================
+
+    definición de la clase LocalCopy
+
+    Motor de copia local, alternativa a rsync cuando origen y unidad están
+    en la misma máquina. Cada fichero se copia con el método más barato
+    que admitan los dos sistemas de ficheros:
+
+        clone            reflink FICLONE (btrfs, XFS), sin copiar datos
+        copy_file_range  copia dentro del núcleo
+        sendfile         copia dentro del núcleo
+        copyfileobj      copia por bloques en espacio de usuario
+
+    Un método que falla por no estar soportado no se vuelve a intentar
+    para el mismo par de dispositivos. Se conservan permisos, propietario
+    (si se ejecuta como root) y fechas, como rsync -a, y los enlaces
+    duros entre los ficheros copiados, como rsync -H.
+
+    En servidores en producción la copia puede evitar llenar la caché de
+    páginas (cache="dontneed" o "direct", ver LocalCopy).
+
+"""
+
+import errno
+import fcntl
+import mmap
+import os
+import stat
+from collections import Counter
+
+# _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# errores de método no soportado entre esos ficheros
+_UNSUPPORTED = (errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS,
+                errno.ENOTTY, errno.EBADF, errno.ETXTBSY)
+
+
+def set_meta(path, st, follow=True):
+    """
+    set_meta Copia permisos, propietario y fechas
+
+    Args:
+        path (str|Path): destino
+        st (os.stat_result): estado del origen
+        follow (bool): False para enlaces simbólicos
+    """
+    try:
+        os.chown(str(path), st.st_uid, st.st_gid, follow_symlinks=follow)
+    except PermissionError:
+        pass
+    if follow:
+        os.chmod(str(path), stat.S_IMODE(st.st_mode))
+    os.utime(str(path),
+             ns=(st.st_atime_ns, st.st_mtime_ns),
+             follow_symlinks=follow)
+
+
+class LocalCopy(object):
+    """
+    LocalCopy
+
+    Copia local de ficheros y árboles
+    """
+
+    BlockSize = 1 << 20
+    Methods = ("clone", "copy_file_range", "sendfile", "copyfileobj")
+
+    # uso de la caché de páginas
+    Caches = ("normal", "dontneed", "direct")
+    DropChunk = 32 << 20  # bytes entre descartes de páginas
+    DirectSize = 64 << 20  # tamaño mínimo para O_DIRECT
+    DirectAlign = 4096
+
+    def __init__(self, methods=None, cache="normal", pace=None):
+        """
+        __init__ Constructor
+
+        Args:
+            methods (tuple): métodos a intentar, en orden; por defecto
+                todos los de Methods
+            cache (str): uso de la caché de páginas
+                normal: el del sistema
+                dontneed: lectura secuencial y descarte de las páginas
+                    de origen y destino tras escribirlas, para no
+                    desalojar de la caché los datos del servidor
+                direct: como dontneed, y los ficheros de al menos
+                    DirectSize con O_DIRECT, sin pasar por la caché
+            pace (Pace): límite de caudal; los datos se copian por
+                bloques de BlockSize y se espera tras cada uno
+
+        Raises:
+            ValueError: si cache no es uno de Caches
+        """
+        super().__init__()
+
+        if cache not in self.Caches:
+            raise ValueError(f"Uso de caché desconocido: {cache}")
+        self.__methods = tuple(methods or self.Methods)
+        self.__cache = cache
+        self.__pace = pace
+        self.__failed = set()  # (método, dispositivo origen, destino)
+        self.__pending = []  # ficheros pequeños por descartar
+        self.__pendingBytes = 0
+        self.used = Counter()  # método -> ficheros copiados
+
+    def copy_file(self, src, dst, st=None):
+        """
+        copy_file Copia un fichero regular y sus metadatos
+
+        Args:
+            src (str|Path): origen
+            dst (str|Path): destino, se crea o se trunca
+            st (os.stat_result): estado del origen, si ya se conoce
+
+        Returns:
+            str: método con el que se han copiado los datos
+        """
+        if st is None:
+            st = os.stat(str(src))
+        if self.__cache == "direct" and st.st_size >= self.DirectSize \
+                and ("direct", st.st_dev) not in self.__failed:
+            try:
+                self.__copy_direct(src, dst, st.st_size)
+                set_meta(dst, st)
+                self.used["direct"] += 1
+                return "direct"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                # sistema de ficheros sin O_DIRECT
+                self.__failed.add(("direct", st.st_dev))
+
+        with open(str(src), 'rb') as fsrc, open(str(dst), 'wb') as fdst:
+            _in = fsrc.fileno()
+            if self.__cache != "normal":
+                os.posix_fadvise(_in, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            _devs = (st.st_dev, os.fstat(fdst.fileno()).st_dev)
+            _method = self.__copy_data(fsrc, fdst, st.st_size, _devs)
+            if self.__cache != "normal":
+                fdst.flush()
+                os.posix_fadvise(_in, 0, 0, os.POSIX_FADV_DONTNEED)
+                if st.st_size >= self.DropChunk:
+                    self.drop(fdst.fileno())
+        if self.__cache != "normal" and st.st_size < self.DropChunk:
+            self.defer(dst, st.st_size)
+        set_meta(dst, st)
+        self.used[_method] += 1
+        return _method
+
+    def __copy_data(self, fsrc, fdst, size, devs):
+        _in = fsrc.fileno()
+        _out = fdst.fileno()
+        _offset = 0
+        # con descarte se copia por tramos de DropChunk
+        _chunk = size
+        if self.__cache != "normal":
+            _chunk = self.DropChunk
+        if self.__pace is not None:
+            _chunk = self.BlockSize
+        for _method in self.__methods:
+            if (_method, ) + devs in self.__failed:
+                continue
+            try:
+                if _method == "clone":
+                    fcntl.ioctl(_out, FICLONE, _in)
+                    return _method
+                if _method == "copy_file_range":
+                    if not hasattr(os, "copy_file_range"):
+                        raise OSError(errno.ENOSYS, "copy_file_range")
+                    while _offset < size:
+                        _done = os.copy_file_range(
+                            _in, _out, min(_chunk, size - _offset))
+                        if _done == 0:
+                            break
+                        _offset += _done
+                        self.__progress(_in, _out, _offset, _done)
+                    return _method
+                if _method == "sendfile":
+                    while _offset < size:
+                        _done = os.sendfile(_out, _in, _offset,
+                                            min(_chunk, size - _offset))
+                        if _done == 0:
+                            break
+                        _offset += _done
+                        self.__progress(_in, _out, _offset, _done)
+                    return _method
+                # copia en espacio de usuario desde donde se quedó
+                fsrc.seek(_offset)
+                fdst.seek(_offset)
+                while True:
+                    _block = fsrc.read(self.BlockSize)
+                    if not _block:
+                        break
+                    fdst.write(_block)
+                    _offset += len(_block)
+                    if self.__pace is not None:
+                        self.__pace.wait(len(_block))
+                    if _offset % self.DropChunk < self.BlockSize:
+                        fdst.flush()
+                        self.__progress(_in, _out, _offset)
+                return _method
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                if _offset == 0:
+                    self.__failed.add((_method, ) + devs)
+        raise OSError(errno.ENOSYS, "sin método de copia")
+
+    def __progress(self, fdin, fdout, offset, size=0):
+        """
+        __progress Limita el caudal y descarta las páginas ya copiadas de
+        un fichero grande
+        """
+        if self.__pace is not None and size:
+            self.__pace.wait(size)
+        if self.__cache == "normal" or offset < self.DropChunk:
+            return
+        os.posix_fadvise(fdin, 0, offset, os.POSIX_FADV_DONTNEED)
+        self.drop(fdout, offset)
+
+    @staticmethod
+    def drop(fd, length=0):
+        """
+        drop Escribe y descarta las páginas de un fichero de destino
+
+        Solo se pueden descartar las páginas ya escritas en disco
+
+        Args:
+            fd (int): descriptor del fichero
+            length (int): bytes a descartar desde el principio; 0 todo
+        """
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, length, os.POSIX_FADV_DONTNEED)
+
+    def defer(self, path, size):
+        """
+        defer Aplaza el descarte de un fichero pequeño
+
+        Se descartan juntos cada DropChunk bytes: para entonces casi todos
+        estarán ya escritos y fdatasync apenas espera
+
+        Args:
+            path (str|Path): fichero ya escrito y cerrado
+            size (int): su tamaño
+        """
+        self.__pending.append(path)
+        self.__pendingBytes += size
+        if self.__pendingBytes >= self.DropChunk:
+            self.flush()
+
+    def flush(self):
+        """
+        flush Descarta las páginas de los ficheros pequeños pendientes
+        """
+        for _path in self.__pending:
+            try:
+                _fd = os.open(str(_path), os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                self.drop(_fd)
+            finally:
+                os.close(_fd)
+        self.__pending = []
+        self.__pendingBytes = 0
+
+    def __copy_direct(self, src, dst, size):
+        """
+        __copy_direct Copia con O_DIRECT por bloques alineados
+
+        El último bloque se escribe completo y el fichero se recorta
+        """
+        _in = os.open(str(src), os.O_RDONLY | os.O_DIRECT)
+        try:
+            _out = os.open(str(dst),
+                           os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT,
+                           0o600)
+        except OSError:
+            os.close(_in)
+            raise
+        # mmap da un búfer alineado a página
+        _buffer = mmap.mmap(-1, self.BlockSize)
+        _view = memoryview(_buffer)
+        try:
+            _offset = 0
+            while _offset < size:
+                _read = os.readv(_in, [_buffer])
+                if _read == 0:
+                    break
+                _length = _read
+                if _read % self.DirectAlign:
+                    if _offset + _read < size:
+                        raise OSError(errno.EIO, "lectura O_DIRECT parcial")
+                    _length = _read + self.DirectAlign - \
+                        _read % self.DirectAlign
+                    _buffer[_read:_length] = bytes(_length - _read)
+                os.write(_out, _view[:_length])
+                _offset += _read
+                if self.__pace is not None:
+                    self.__pace.wait(_read)
+            os.ftruncate(_out, _offset)
+        finally:
+            _view.release()
+            _buffer.close()
+            os.close(_in)
+            os.close(_out)
+
+    def copy(self, source, target, paths):
+        """
+        copy Copia rutas de un árbol a otro
+
+        Los directorios de destino ya existentes se conservan; sus fechas
+        se fijan al final, después de su contenido. Un fichero con varios
+        enlaces duros se copia una vez y el resto de sus rutas se enlazan
+        a esa copia
+
+        Args:
+            source (str|Path): directorio de origen
+            target (str|Path): directorio de destino
+            paths (list): rutas relativas ordenadas (un directorio antes
+                que su contenido)
+
+        Returns:
+            dict: files, bytes, links (rutas enlazadas a un fichero ya
+            copiado), vanished (rutas desaparecidas o que no son
+            fichero, directorio ni enlace) y error
+        """
+        _result = {
+            'files': 0,
+            'bytes': 0,
+            'links': 0,
+            'vanished': [],
+            'error': None
+        }
+        _dirs = []
+        _inodes = {}  # (dispositivo, inodo) -> primera copia
+        for _path in paths:
+            _src = os.path.join(str(source), _path)
+            _dst = os.path.join(str(target), _path)
+            try:
+                _stat = os.lstat(_src)
+                if stat.S_ISDIR(_stat.st_mode):
+                    os.makedirs(_dst, exist_ok=True)
+                    _dirs.append((_dst, _stat))
+                elif stat.S_ISLNK(_stat.st_mode):
+                    os.symlink(os.readlink(_src), _dst)
+                    set_meta(_dst, _stat, False)
+                elif stat.S_ISREG(_stat.st_mode):
+                    _inode = None
+                    if _stat.st_nlink > 1:
+                        _inode = (_stat.st_dev, _stat.st_ino)
+                        if _inode in _inodes:
+                            os.link(_inodes[_inode], _dst)
+                            _result['links'] += 1
+                            continue
+                    self.copy_file(_src, _dst, _stat)
+                    if _inode is not None:
+                        _inodes[_inode] = _dst
+                    _result['files'] += 1
+                    _result['bytes'] += _stat.st_size
+                else:
+                    _result['vanished'].append(_path)
+            except FileNotFoundError:
+                _result['vanished'].append(_path)
+                if os.path.lexists(_dst) and not os.path.isdir(_dst):
+                    os.unlink(_dst)
+            except OSError as e:
+                _result['error'] = f"{_path}: {e}"
+                break
+        for _dst, _stat in reversed(_dirs):
+            set_meta(_dst, _stat)
+        self.flush()
+        return _result
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                 metrics.py
+===============================================================================
+
+    definición de la clase Metrics
+
+    Métricas de las unidades en un fichero textfile de node_exporter
+    (<metrics_dir>/smbackup.prom) para alertar de discos lentos o copias
+    antiguas:
+
+        smbackup_unit_connected, smbackup_unit_mounted
+        smbackup_unit_size_bytes, _free_bytes, _used_bytes (statvfs)
+        smbackup_copy_last_duration_seconds, _bytes, _files,
+        _throughput_bytes_per_second, _status, _run_timestamp_seconds
+        smbackup_copy_last_success_timestamp_seconds, _age_seconds
+
+    Los datos de las copias salen del índice de copias de cada unidad.
+    Nunca se conecta ni se monta una unidad para informar: de las que no
+    se han localizado en este proceso se conservan las métricas del
+    fichero anterior, con la antigüedad recalculada.
+
+    El fichero se escribe de forma atómica; Executor lo actualiza al
+    terminar cada trabajo.
+
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from smblib.copyindex import CopyIndex
+from smblib.fileutil import atomic_write
+from smblib.settings import Settings
+
+# nombre -> (tipo, ayuda), en el orden del fichero
+Definitions = {
+    'smbackup_unit_attached':
+    ("gauge", "1 si la unidad se ha localizado en este proceso"),
+    'smbackup_unit_connected': ("gauge", "1 si la unidad está conectada"),
+    'smbackup_unit_mounted': ("gauge", "1 si la unidad está montada"),
+    'smbackup_unit_size_bytes':
+    ("gauge", "Tamaño del sistema de ficheros de la unidad"),
+    'smbackup_unit_free_bytes':
+    ("gauge", "Bytes libres en la unidad para usuarios sin privilegios"),
+    'smbackup_unit_used_bytes': ("gauge", "Bytes usados en la unidad"),
+    'smbackup_copy_last_run_timestamp_seconds':
+    ("gauge", "Fecha de la última ejecución de la copia"),
+    'smbackup_copy_last_status':
+    ("gauge", "Estado de la última ejecución: 0 ok, 1 warning, 2 error"),
+    'smbackup_copy_last_duration_seconds':
+    ("gauge", "Duración de la última ejecución"),
+    'smbackup_copy_last_bytes': ("gauge", "Bytes transferidos"),
+    'smbackup_copy_last_files': ("gauge", "Ficheros copiados"),
+    'smbackup_copy_last_throughput_bytes_per_second':
+    ("gauge", "Caudal de la última ejecución"),
+    'smbackup_copy_last_success_timestamp_seconds':
+    ("gauge", "Fecha de la última instantánea correcta"),
+    'smbackup_copy_last_success_age_seconds':
+    ("gauge", "Antigüedad de la última instantánea correcta"),
+}
+
+_STATUS = {'ok': 0, 'warning': 1, 'error': 2}
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_UNIT = re.compile(r'(?:^|,)unit="((?:[^"\\]|\\.)*)"')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ",".join(f'{x}="{_escape(y)}"' for x, y in labels.items())
+
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class Metrics(object):
+    """
+    Metrics
+
+    Fichero textfile de node_exporter con las métricas de las unidades
+    """
+
+    FileName = "smbackup.prom"
+
+    def __init__(self, units, dirtextfile=None):
+        """
+        __init__ Constructor
+
+        Args:
+            units (Units|list): unidades
+            dirtextfile (str|Path): directorio textfile de node_exporter,
+                por defecto metrics_dir de la configuración
+
+        Raises:
+            ValueError: si no hay directorio
+        """
+        super().__init__()
+
+        if dirtextfile is None:
+            dirtextfile = Settings.shared().metrics_dir
+        if dirtextfile is None:
+            raise ValueError("Sin directorio de métricas (metrics_dir)")
+        self.__units = units
+        self.__pathfile = Path(dirtextfile) / self.FileName
+        self.__lock = threading.Lock()
+
+    def collect(self):
+        """
+        collect Obtiene las métricas
+
+        Returns:
+            dict: nombre -> [(etiquetas, valor), ...]
+        """
+        _now = time.time()
+        _samples = {x: [] for x in Definitions}
+        _units = getattr(self.__units, 'List', self.__units)
+        _kept = set()  # unidades no localizadas en este proceso
+        for _unit in _units:
+            if not _unit.attached:
+                _samples['smbackup_unit_attached'].append(
+                    (_labels(unit=_unit.name), 0))
+                _kept.add(_unit.name)
+                continue
+            self.__unit(_unit, _samples, _now)
+        self.__previous(_kept, _samples, _now)
+        return _samples
+
+    def __unit(self, unit, samples, now):
+        _label = _labels(unit=unit.name)
+        samples['smbackup_unit_attached'].append((_label, 1))
+        _mount = unit.mounted
+        samples['smbackup_unit_connected'].append(
+            (_label, int(_mount is not None)))
+        _mounted = _mount is not None and os.path.ismount(str(_mount))
+        samples['smbackup_unit_mounted'].append((_label, int(_mounted)))
+        if not _mounted:
+            return
+
+        try:
+            _st = os.statvfs(str(_mount))
+        except OSError:
+            pass
+        else:
+            samples['smbackup_unit_size_bytes'].append(
+                (_label, _st.f_blocks * _st.f_frsize))
+            samples['smbackup_unit_free_bytes'].append(
+                (_label, _st.f_bavail * _st.f_frsize))
+            samples['smbackup_unit_used_bytes'].append(
+                (_label, (_st.f_blocks - _st.f_bfree) * _st.f_frsize))
+
+        try:
+            _copies = CopyIndex(Path(_mount) / unit.meta).copies()
+        except OSError:
+            return
+        for _copy in _copies:
+            self.__copy(unit.name, _copy, samples, now)
+
+    @staticmethod
+    def __copy(unit, copy, samples, now):
+        _label = _labels(unit=unit, copy=copy['name'])
+
+        def _add(name, value):
+            if value is not None:
+                samples[name].append((_label, value))
+
+        _add('smbackup_copy_last_run_timestamp_seconds',
+             _timestamp(copy.get('last_run')))
+        _add('smbackup_copy_last_status', _STATUS.get(copy.get('status')))
+        _duration = copy.get('duration')
+        _bytes = copy.get('bytes')
+        _add('smbackup_copy_last_duration_seconds', _duration)
+        _add('smbackup_copy_last_bytes', _bytes)
+        _add('smbackup_copy_last_files', copy.get('files'))
+        if _duration and _bytes is not None:
+            _add('smbackup_copy_last_throughput_bytes_per_second',
+                 _bytes / _duration)
+        _success = _timestamp(copy.get('last_success'))
+        _add('smbackup_copy_last_success_timestamp_seconds', _success)
+        if _success is not None:
+            _add('smbackup_copy_last_success_age_seconds', now - _success)
+
+    def __previous(self, units, samples, now):
+        """
+        __previous Conserva del fichero anterior las métricas de unas
+        unidades
+        """
+        if not units:
+            return
+        try:
+            with self.__pathfile.open('r') as file:
+                _lines = file.readlines()
+        except OSError:
+            return
+        _age = 'smbackup_copy_last_success_age_seconds'
+        for _line in _lines:
+            _match = _SAMPLE.match(_line.strip())
+            if _match is None:
+                continue
+            _name, _label, _value = _match.groups()
+            _unit = _UNIT.search(_label)
+            if _name not in Definitions or _name == _age \
+                    or _name == 'smbackup_unit_attached' \
+                    or _unit is None or _unit.group(1) not in units:
+                continue
+            samples[_name].append((_label, _value))
+            if _name == 'smbackup_copy_last_success_timestamp_seconds':
+                samples[_age].append((_label, now - float(_value)))
+
+    @staticmethod
+    def render(samples):
+        """
+        render Formato de exposición de texto de Prometheus
+
+        Args:
+            samples (dict): de collect()
+
+        Returns:
+            str: contenido del fichero
+        """
+        _text = []
+        for _name, (_type, _help) in Definitions.items():
+            if not samples.get(_name):
+                continue
+            _text.append(f"# HELP {_name} {_help}\n")
+            _text.append(f"# TYPE {_name} {_type}\n")
+            for _label, _value in samples[_name]:
+                _text.append(f"{_name}{{{_label}}} {_value}\n")
+        return "".join(_text)
+
+    def write(self):
+        """
+        write Actualiza el fichero de métricas de forma atómica
+
+        Returns:
+            Path: fichero escrito
+        """
+        with self.__lock:
+            atomic_write(self.__pathfile, self.render(self.collect()))
+        return self.__pathfile
+
+    @property
+    def PathFile(self):
+        return self.__pathfile
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                               mountpool.py
+===============================================================================
+
+    definición de la clase MountPool
+
+    Gestor de montajes de unidades con contador de usos. Mientras una
+    unidad tiene préstamos activos sigue montada (y su volumen abierto);
+    al quedar libre se desmonta tras un tiempo de inactividad. Trabajos
+    seguidos sobre el mismo disco se ahorran así el montaje y el
+    desbloqueo LUKS.
+
+"""
+
+import logging
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from smblib.settings import Settings
+
+_log = logging.getLogger(__name__)
+
+
+class MountPool(object):
+    """
+    MountPool
+
+    Préstamos de unidades montadas con desmontaje por inactividad
+    """
+
+    DefaultIdle = 300  # segundos
+
+    def __init__(self, idle=None):
+        """
+        __init__ Constructor
+
+        Args:
+            idle (int): segundos sin préstamos antes de desmontar. Por
+                defecto units_idle de la configuración o DefaultIdle
+        """
+        super().__init__()
+
+        if idle is None:
+            idle = Settings.shared().units_idle
+        if idle is None:
+            idle = self.DefaultIdle
+        self.__idle = idle
+
+        self.__lock = threading.Lock()
+        # nombre -> {'unit', 'refs', 'timer', 'lock'}
+        self.__entries = {}
+
+    def __entry(self, unit):
+        with self.__lock:
+            _entry = self.__entries.get(unit.name)
+            if _entry is None:
+                _entry = {
+                    'unit': unit,
+                    'refs': 0,
+                    'timer': None,
+                    'lock': threading.Lock()
+                }
+                self.__entries[unit.name] = _entry
+            return _entry
+
+    def acquire(self, unit):
+        """
+        acquire Toma prestada una unidad
+
+        La conecta si no lo estaba y anula su desmontaje pendiente
+
+        Args:
+            unit (Unit): unidad
+
+        Returns:
+            Path: punto de montaje, None si la unidad no está conectada
+        """
+        _entry = self.__entry(unit)
+        with _entry['lock']:
+            if _entry['timer'] is not None:
+                _entry['timer'].cancel()
+                _entry['timer'] = None
+            if not unit.attach():
+                return None
+            _entry['refs'] += 1
+            return unit.mountpoint
+
+    def release(self, unit):
+        """
+        release Devuelve una unidad prestada
+
+        Al quedar sin préstamos se programa su desmontaje
+
+        Args:
+            unit (Unit): unidad
+        """
+        _entry = self.__entry(unit)
+        with _entry['lock']:
+            if _entry['refs'] == 0:
+                return
+            _entry['refs'] -= 1
+            if _entry['refs'] == 0:
+                self.__schedule(unit.name, _entry)
+
+    @contextmanager
+    def lease(self, unit):
+        """
+        lease Préstamo de una unidad durante un bloque
+
+        with pool.lease(unit) as mountpoint:
+
+        Args:
+            unit (Unit): unidad
+
+        Raises:
+            RuntimeError: si la unidad no está conectada
+        """
+        _mountpoint = self.acquire(unit)
+        if _mountpoint is None:
+            raise RuntimeError(f"Unidad {unit.name} no conectada")
+        try:
+            yield _mountpoint
+        finally:
+            self.release(unit)
+
+    def __schedule(self, name, entry):
+        entry['timer'] = threading.Timer(self.__idle, self.__expire,
+                                         (name, entry))
+        entry['timer'].daemon = True
+        entry['timer'].start()
+
+    def __expire(self, name, entry, retry=True):
+        """
+        __expire Desconecta una unidad sin préstamos
+
+        Si falla el desmontaje o el cierre del volumen (un proceso aún
+        usa el sistema de ficheros) la unidad sigue en el gestor y, con
+        retry, se vuelve a intentar pasado otro tiempo de inactividad
+
+        Returns:
+            Exception: el error de la desconexión, None si no lo hay
+        """
+        with entry['lock']:
+            if entry['refs'] > 0 or entry['timer'] is None:
+                # prestada de nuevo mientras expiraba
+                return None
+            entry['timer'] = None
+            try:
+                entry['unit'].detach()
+            except (subprocess.CalledProcessError, OSError) as e:
+                _log.warning("No se ha podido desconectar la unidad %s: %s",
+                             name, e)
+                if retry:
+                    self.__schedule(name, entry)
+                return e
+        with self.__lock:
+            if self.__entries.get(name) is entry and entry['refs'] == 0:
+                del self.__entries[name]
+        return None
+
+    def close(self):
+        """
+        close Desmonta ya las unidades sin préstamos
+
+        Las que siguen prestadas no se tocan. Un fallo al desconectar una
+        unidad no impide intentarlo con las demás
+
+        Returns:
+            dict: nombre -> error de las unidades que no se han podido
+            desconectar, vacío si todo ha ido bien
+        """
+        with self.__lock:
+            _entries = list(self.__entries.items())
+        _errors = {}
+        for _name, _entry in _entries:
+            if _entry['timer'] is not None:
+                _entry['timer'].cancel()
+                _error = self.__expire(_name, _entry, retry=False)
+                if _error is not None:
+                    _errors[_name] = _error
+        return _errors
+
+    def refs(self, unit):
+        """
+        refs Préstamos activos de una unidad
+
+        Args:
+            unit (Unit): unidad
+
+        Returns:
+            int: número de préstamos
+        """
+        with self.__lock:
+            _entry = self.__entries.get(unit.name)
+        if _entry is None:
+            return 0
+        return _entry['refs']
+
+    @property
+    def idle(self):
+        return self.__idle
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                record.py
+===============================================================================
+
+    definición de las clases Field y Record
+
+    Base declarativa para registros de datos como UnitData y ConfigData.
+    Cada clase declara sus campos en Fields; las propiedades, la lista de
+    claves y las máscaras se generan una sola vez al crear la clase.
+
+    Los valores se guardan en una lista con __slots__, los datos
+    modificados en una máscara de bits y los datos establecidos en otra,
+    de modo que modified, dirty y finised no recorren los campos.
+
+"""
+
+
+class Ignore(Exception):
+    """
+    Ignore
+
+    La lanza un validador para descartar un valor no válido
+    conservando el anterior
+    """
+
+
+class Field(object):
+    """
+    Field
+
+    Descripción de un dato de un registro
+    """
+
+    __slots__ = ("name", "check", "null", "empty", "mark_null", "required",
+                 "doc", "index", "bit")
+
+    def __init__(self,
+                 name,
+                 check=None,
+                 null=None,
+                 empty=(None, ),
+                 mark_null=False,
+                 required=True,
+                 doc=None):
+        """
+        __init__ Constructor
+
+        Args:
+            name (str): nombre del dato
+            check (callable): check(record, value) devuelve el valor a
+                guardar, lanza Ignore para descartarlo o ValueError si
+                no es admisible
+            null: valor guardado cuando se asigna uno de empty
+            empty (tuple): valores que se guardan como null sin validar
+            mark_null (bool): si asignar un valor de empty cuenta como
+                modificación
+            required (bool): si el dato es necesario para finised
+            doc (str): documentación de la propiedad
+        """
+        self.name = name
+        self.check = check
+        self.null = null
+        self.empty = empty
+        self.mark_null = mark_null
+        self.required = required
+        self.doc = doc
+        self.index = None
+        self.bit = 0
+
+
+def _make_property(field):
+    _index = field.index
+    _bit = field.bit
+    _name = field.name
+    _check = field.check
+    _null = field.null
+    _empty = field.empty
+    _mark_null = field.mark_null
+
+    def fget(self):
+        return self._values[_index]
+
+    def fset(self, value):
+        if value in _empty:
+            _new = _null
+            _mark = _mark_null
+        else:
+            if _check is not None:
+                try:
+                    _new = _check(self, value)
+                except Ignore:
+                    return
+            else:
+                _new = value
+            _mark = True
+
+        _old = self._values[_index]
+        _oldSet = self._set
+        _oldDirty = self._dirty
+
+        self._values[_index] = _new
+        if _new is None:
+            self._set &= ~_bit
+        else:
+            self._set |= _bit
+        if _mark:
+            self._dirty |= _bit
+
+        if self._watched and _old != _new:
+            try:
+                self._changed(_name, _old, _new)
+            except BaseException:
+                self._values[_index] = _old
+                self._set = _oldSet
+                self._dirty = _oldDirty
+                raise
+
+    return property(fget, fset, None, field.doc)
+
+
+class Record(object):
+    """
+    Record
+
+    Base de los registros. Las subclases declaran Fields
+    """
+
+    __slots__ = ("_values", "_dirty", "_set")
+
+    Fields = ()
+
+    # True en las subclases que redefinen _changed
+    _watched = False
+
+    # generados por __init_subclass__
+    _keys = ()
+    _fields = {}
+    _required = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "_changed" in cls.__dict__:
+            cls._watched = True
+        if "Fields" not in cls.__dict__:
+            return
+
+        _fields = {}
+        _required = 0
+        for _index, _field in enumerate(cls.Fields):
+            _field.index = _index
+            _field.bit = 1 << _index
+            if _field.required:
+                _required |= _field.bit
+            _fields[_field.name] = _field
+            setattr(cls, _field.name, _make_property(_field))
+
+        cls._keys = tuple(_field.name for _field in cls.Fields)
+        cls._fields = _fields
+        cls._required = _required
+
+    def __init__(self):
+        super().__init__()
+        self._values = [_field.null for _field in self.Fields]
+        self._dirty = 0
+        self._set = 0
+        for _field in self.Fields:
+            if _field.null is not None:
+                self._set |= _field.bit
+
+    def _changed(self, key, old, new):
+        """
+        _changed Aviso de cambio de un dato
+
+        Las subclases lo redefinen para reaccionar a los cambios; solo
+        se llama en ellas. Si lanza una excepción el cambio se deshace
+
+        Args:
+            key (str): dato
+            old: valor anterior
+            new: valor nuevo
+        """
+
+    def __getitem__(self, key):
+        return self.__getattribute__(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            self.__setattr__(key, value)
+        else:
+            raise NameError
+
+    def __len__(self):
+        return bin(self._set).count('1')
+
+    def keys(self):
+        return self._keys
+
+    def to_dict(self):
+        """
+        to_dict Datos como diccionario
+
+        Returns:
+            dict: clave -> valor
+        """
+        return dict(zip(self._keys, self._values))
+
+    def load_dict(self, data, trusted=False):
+        """
+        load_dict Carga los datos de un diccionario
+
+        Los datos ausentes en data no se modifican
+
+        Args:
+            data (dict): clave -> valor
+            trusted (bool): si True los valores se guardan sin validar ni
+                marcar como modificados, para datos ya validados como los
+                leídos de un catálogo
+        """
+        if not trusted:
+            for key in self._keys:
+                if key in data:
+                    self.__setattr__(key, data[key])
+            return
+
+        for _field in self.Fields:
+            if _field.name in data:
+                _value = data[_field.name]
+                self._values[_field.index] = _value
+                if _value is None:
+                    self._set &= ~_field.bit
+                else:
+                    self._set |= _field.bit
+
+    def clean(self):
+        """
+        clean Marca los datos como guardados
+        """
+        self._dirty = 0
+
+    @property
+    def modified(self):
+        """
+        modified
+
+        Informa si ya ha sido establecido algún dato
+
+        Returns:
+            bool: True si modificado
+        """
+        return self._dirty != 0
+
+    @property
+    def dirty(self):
+        """
+        dirty
+
+        Datos modificados desde la carga o el último guardado
+
+        Returns:
+            frozenset: nombres de los datos modificados
+        """
+        return frozenset(_field.name for _field in self.Fields
+                         if self._dirty & _field.bit)
+
+    @property
+    def finised(self):
+        """
+        finised Terminado
+
+        Informa si ya han sido establecidos todos los datos necesarios
+
+        Returns:
+            bool: True si terminado
+        """
+        return self._set & self._required == self._required
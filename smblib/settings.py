@@ -12,7 +12,9 @@
 
 """
 
+import atexit
 from pathlib import Path
+from threading import Lock
 from smblib.configdata import ConfigData
 
 
@@ -22,6 +24,10 @@ class Settings(ConfigData):
     ConfigDir = Path(f"/etc/smbackup-{__version}")
     ConfigFile = ConfigDir / "smbconfig.json"
 
+    # instancia compartida por todo el proceso
+    __shared = None
+    __lock = Lock()
+
     def __init__(self):
         self.__DirThisFile = Path(__file__).parent
         self.__CurrentDir = Path.cwd()
@@ -29,4 +35,30 @@ class Settings(ConfigData):
         super().__init__(self.ConfigFile)
 
     def __del__(self):
-        super().save(self.file_conf)
+        if self.changed:
+            super().save(self.file_conf)
+
+    @classmethod
+    def shared(cls):
+        """
+        shared Configuración compartida
+
+        Devuelve la instancia común del proceso. Solo se vuelve a leer
+        el fichero si ha cambiado en disco y no hay modificaciones
+        pendientes de salvar.
+
+        Returns:
+            Settings: configuración
+        """
+        with cls.__lock:
+            if cls.__shared is None:
+                cls.__shared = cls()
+                atexit.register(cls.__save_shared)
+            elif cls.__shared.stale and not cls.__shared.changed:
+                cls.__shared.reload()
+            return cls.__shared
+
+    @classmethod
+    def __save_shared(cls):
+        if cls.__shared is not None and cls.__shared.changed:
+            cls.__shared.save(cls.__shared.file_conf)
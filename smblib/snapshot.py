@@ -0,0 +1,578 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                snapshot.py
+===============================================================================
+
+    definición de la clase Snapshot
+
+    Motor de copias incrementales por instantáneas. Cada ejecución crea un
+    directorio con fecha bajo <unidad>/<dirbackups>/<copia>; rsync enlaza
+    con enlaces duros (--link-dest) los ficheros que no han cambiado desde
+    la instantánea anterior, de modo que cada copia cuesta tiempo y
+    espacio en proporción a lo modificado.
+
+    La instantánea se escribe en <fecha>.partial y solo al terminar bien
+    se renombra y pasa a ser la última (enlace simbólico 'latest'). El
+    resultado se anota en el índice de copias del directorio Meta.
+
+    Con diario (journal=True) el origen se compara con el estado guardado
+    en la instantánea anterior: la nueva se clona con enlaces duros de la
+    anterior, rsync copia solo la lista de rutas cambiadas (--files-from)
+    y se borran las rutas desaparecidas. Con un registro de cambios
+    (ChangeLog) el origen ni se recorre.
+
+    Con engine="local" la copia la hace LocalCopy en lugar de rsync.
+
+    rsync se ejecuta con los límites de recursos de la unidad y la copia
+    (Throttle). LocalCopy los aplica en un hilo propio: nice e ionice a
+    ese hilo y el caudal con Pace.
+
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from smblib import timing
+from smblib.journal import Journal, compare, scan, write_files_from
+from smblib.localcopy import LocalCopy
+from smblib.throttle import Pace, Throttle
+
+_log = logging.getLogger(__name__)
+
+
+class Snapshot(object):
+    """
+    Snapshot
+
+    Copias por instantáneas con enlaces duros de una copia de una unidad
+    """
+
+    TimeFormat = "%Y%m%d-%H%M%S"
+    Latest = "latest"
+    Partial = ".partial"
+
+    # opciones de rsync: archivo, enlaces duros, borrado de lo eliminado
+    Options = ("-aH", "--delete", "--numeric-ids", "--stats")
+
+    # rsync: 24 = ficheros desaparecidos durante la copia
+    __warnings = (24, )
+
+    __stats = {
+        'files': re.compile(r"Number of regular files transferred: ([\d,]+)"),
+        'bytes': re.compile(r"Total transferred file size: ([\d,]+)"),
+        'size': re.compile(r"Total file size: ([\d,]+)"),
+    }
+
+    def __init__(self,
+                 unit,
+                 name,
+                 source=None,
+                 rsync="rsync",
+                 options=None,
+                 journal=False,
+                 changes=None,
+                 engine="rsync",
+                 limits=None):
+        """
+        __init__ Constructor
+
+        Args:
+            unit (Unit): unidad destino, se conecta si no lo está
+            name (str): nombre de la copia
+            source (str|Path): origen; por defecto el del índice de copias
+            rsync (str): ejecutable de rsync
+            options (list): opciones adicionales de rsync
+            journal (bool): detectar los cambios con el diario de estado
+                del origen en lugar de que rsync recorra todo el árbol
+            changes (ChangeLog): registro de cambios del origen; con
+                diario solo se examinan las rutas anotadas
+            engine (str): "rsync" o "local", el motor de copia local
+                (LocalCopy) para orígenes en la misma máquina. Solo este
+                respeta el uso de caché de la unidad (UnitData.cache)
+            limits (dict): límites de recursos de la copia, con rsync o
+                con el motor local; por defecto los
+                de la unidad (UnitData.limits) redefinidos por los de la
+                definición de la copia
+
+        Raises:
+            RuntimeError: si la unidad no está conectada
+            ValueError: si no hay origen o el motor es desconocido
+        """
+        super().__init__()
+
+        if unit.mountpoint is None:
+            raise RuntimeError(f"Unidad {unit.name} no conectada")
+
+        self.__unit = unit
+        self.__name = name
+        self.__index = unit.CopyIndex
+
+        if source is None:
+            _entry = self.__index.get(name)
+            if _entry is not None:
+                source = _entry['source']
+        if source is None:
+            raise ValueError(f"Copia {name} sin origen")
+        self.__source = Path(source)
+
+        self.__root = Path(unit.mountpoint) / unit.dirbackups / name
+        self.__rsync = rsync
+        self.__options = list(options or [])
+        self.__journal = None
+        if journal:
+            self.__journal = Journal(self.__index.MetaDir, name)
+        self.__changes = changes
+        if engine not in ("rsync", "local"):
+            raise ValueError(f"Motor de copia desconocido: {engine}")
+        self.__engine = engine
+
+        if limits is None:
+            limits = dict(unit.limits or {})
+            _def = self.__index.definition(name) or {}
+            limits.update(_def.get('limits') or {})
+        self.__throttle = None
+        if limits:
+            self.__throttle = Throttle(limits, f"{unit.name}-{name}",
+                                       self.__source)
+
+    def snapshots(self):
+        """
+        snapshots Instantáneas completas
+
+        Returns:
+            list: [Path, ...] de la más antigua a la más reciente
+        """
+        if not self.__root.is_dir():
+            return []
+        _snaps = []
+        for _entry in os.scandir(str(self.__root)):
+            if not _entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                datetime.strptime(_entry.name, self.TimeFormat)
+            except ValueError:
+                continue
+            _snaps.append(self.__root / _entry.name)
+        return sorted(_snaps)
+
+    def previous(self):
+        """
+        previous Última instantánea completa
+
+        Returns:
+            Path: la instantánea, None si no hay ninguna
+        """
+        _latest = self.__root / self.Latest
+        if _latest.is_dir():
+            return _latest.resolve()
+        _snaps = self.snapshots()
+        if len(_snaps) == 0:
+            return None
+        return _snaps[-1]
+
+    def command(self, target, previous=None, files_from=None):
+        """
+        command Orden rsync de una instantánea
+
+        Args:
+            target (Path): directorio destino
+            previous (Path): instantánea con la que enlazar
+            files_from (Path): lista de ficheros a copiar (--files-from)
+
+        Returns:
+            list: argumentos de la orden
+        """
+        _options = list(self.Options)
+        if files_from is not None:
+            # sin -r rsync no admite --delete; los borrados van aparte
+            _options.remove("--delete")
+        _cmd = [self.__rsync] + _options + self.__options
+        if previous is not None:
+            _cmd.append(f"--link-dest={previous}")
+        if files_from is not None:
+            _cmd += [f"--files-from={files_from}", "--from0"]
+        # la barra final copia el contenido del origen
+        _cmd += [f"{self.__source}/", f"{target}/"]
+        return _cmd
+
+    def begin(self):
+        """
+        begin Prepara una nueva instantánea
+
+        Returns:
+            tuple: (when, work, final) fecha de la instantánea, directorio
+            de trabajo <fecha>.partial y directorio final
+        """
+        self.__root.mkdir(parents=True, exist_ok=True)
+        _now = datetime.now().replace(microsecond=0)
+        while True:
+            _stamp = _now.strftime(self.TimeFormat)
+            _final = self.__root / _stamp
+            _work = self.__root / (_stamp + self.Partial)
+            if not (_final.exists() or _work.exists()):
+                return _now, _work, _final
+            # dos ejecuciones en el mismo segundo
+            _now += timedelta(seconds=1)
+
+    def run(self):
+        """
+        run Crea una nueva instantánea
+
+        Returns:
+            dict: snapshot, status ('ok', 'warning' o 'error'),
+            returncode, seconds, files, bytes, size y error. Con diario
+            además mode ('full', 'journal' o 'changes'), scan_seconds,
+            changed y removed
+        """
+        with timing.span("snapshot.run", unit=self.__unit.name,
+                         copy=self.__name, disk=self.__unit.wwn,
+                         engine=self.__engine) as _span:
+            _result = self.__run()
+            _span.set(status=_result['status'],
+                      bytes=_result.get('bytes'),
+                      files=_result.get('files'))
+        return _result
+
+    def __run(self):
+        _now, _work, _final = self.begin()
+        _previous = self.previous()
+
+        _start = time.monotonic()
+        _extra = {}
+        _states = self.__source_states(_previous, _extra)
+        if self.__engine == "local":
+            return self.__run_local(_now, _work, _final, _previous, _states,
+                                    _extra, _start)
+        if (self.__unit.cache or "normal") != "normal":
+            _log.warning("%s/%s: uso de caché %s sin efecto con rsync",
+                         self.__unit.name, self.__name, self.__unit.cache)
+        _diff = None
+        if _states is not None and _previous is not None:
+            _diff = self.__journal.diff(_states)
+
+        _list = None
+        if _diff is not None and self.__clone(_previous, _work):
+            _changed, _removed = _diff
+            if _extra['mode'] == 'full':
+                _extra['mode'] = 'journal'
+            _extra.update(changed=len(_changed), removed=len(_removed))
+            _list = self.__root / (_final.name + ".files")
+            write_files_from(_list, _changed)
+            self.prune(_work, _changed, _removed)
+            _cmd = self.command(_work, files_from=_list)
+        else:
+            _cmd = self.command(_work, _previous)
+
+        if self.__throttle is not None:
+            _cmd = self.__throttle.command(_cmd)
+            self.__throttle.running = True
+        try:
+            with timing.span("snapshot.rsync", unit=self.__unit.name,
+                             copy=self.__name, disk=self.__unit.wwn):
+                _proc = subprocess.run(_cmd,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       universal_newlines=True)
+        finally:
+            if self.__throttle is not None:
+                self.__throttle.running = False
+            if _list is not None:
+                _list.unlink()
+
+        _result = {
+            'snapshot': None,
+            'status': 'error',
+            'returncode': _proc.returncode,
+            'seconds': time.monotonic() - _start,
+            'error': _proc.stderr.strip() or None
+        }
+        if _proc.returncode == 0:
+            _result['status'] = 'ok'
+        elif _proc.returncode in self.__warnings:
+            _result['status'] = 'warning'
+        _result.update(self.__parse_stats(_proc.stdout))
+        _result.update(_extra)
+
+        return self.finish(_now, _work, _final, _result, _states)
+
+    def __source_states(self, previous, extra):
+        """
+        __source_states Estado del origen según el diario
+
+        Returns:
+            dict: {ruta relativa: FileState}, None si no hay diario
+        """
+        if self.__journal is None:
+            return None
+        _start = time.monotonic()
+        extra['mode'] = 'full'
+        _states = None
+        _dirty = None
+        with timing.span("snapshot.scan", unit=self.__unit.name,
+                         copy=self.__name) as _span:
+            if self.__changes is not None:
+                _dirty = self.__changes.take()
+            if _dirty is not None and previous is not None:
+                _states = self.__journal.apply(self.__source, _dirty)
+            if _states is None:
+                _states = scan(self.__source)
+            else:
+                extra['mode'] = 'changes'
+            _span.set(mode=extra['mode'], paths=len(_states))
+        extra['scan_seconds'] = time.monotonic() - _start
+        return _states
+
+    def __run_local(self, when, work, final, previous, states, extra, start):
+        """
+        __run_local Instantánea con el motor de copia local
+
+        Sin diario el origen se compara por tamaño y fecha con la
+        instantánea anterior
+        """
+        if states is None:
+            with timing.span("snapshot.scan", unit=self.__unit.name,
+                             copy=self.__name):
+                states = scan(self.__source)
+        _diff = None
+        if previous is not None:
+            if self.__journal is not None:
+                _diff = self.__journal.diff(states)
+            if _diff is None:
+                _diff = compare(scan(previous), states)
+
+        if _diff is not None and self.__clone(previous, work):
+            _changed, _removed = _diff
+            if extra.get('mode') == 'full':
+                extra['mode'] = 'journal'
+            extra.update(changed=len(_changed), removed=len(_removed))
+            self.prune(work, _changed, _removed)
+        else:
+            work.mkdir()
+            _changed = sorted(states)
+
+        _pace = None
+        if self.__throttle is not None \
+                and 'bwlimit' in self.__throttle.limits:
+            _pace = Pace(self.__throttle.limits['bwlimit'])
+        _copy = LocalCopy(cache=self.__unit.cache or "normal", pace=_pace)
+        with timing.span("snapshot.copy", unit=self.__unit.name,
+                         copy=self.__name, disk=self.__unit.wwn) as _span:
+            _copied = self.__local_copy(_copy, work, _changed)
+            _span.set(files=_copied['files'], bytes=_copied['bytes'])
+        _vanished = set(_copied['vanished'])
+        if _vanished:
+            self.prune(work, [], sorted(_vanished))
+            states = {x: y for x, y in states.items() if x not in _vanished}
+
+        _result = {
+            'snapshot': None,
+            'status': 'ok',
+            'returncode': None,
+            'seconds': time.monotonic() - start,
+            'error': _copied['error'],
+            'files': _copied['files'],
+            'bytes': _copied['bytes'],
+            'size': sum(x.size for x in states.values() if x.type == 'f'),
+            'engine': 'local',
+            'methods': dict(_copy.used)
+        }
+        if _copied['error'] is not None:
+            _result['status'] = 'error'
+        elif _vanished:
+            _result['status'] = 'warning'
+        _result.update(extra)
+        return self.finish(when, work, final, _result, states)
+
+    def __local_copy(self, copy, work, paths):
+        """
+        __local_copy Copia con LocalCopy con nice e ionice
+
+        Con límites la copia se hace en un hilo propio, para no cambiar
+        la prioridad del hilo que llama, que puede ser de un grupo
+
+        Returns:
+            dict: resultado de LocalCopy.copy
+        """
+        if self.__throttle is None:
+            return copy.copy(self.__source, work, paths)
+
+        def _copy():
+            _skipped = self.__throttle.apply()
+            if _skipped:
+                _log.warning("%s/%s: límites no aplicables con el motor "
+                             "local: %s", self.__unit.name, self.__name,
+                             ", ".join(_skipped))
+            return copy.copy(self.__source, work, paths)
+
+        with ThreadPoolExecutor(max_workers=1,
+                                thread_name_prefix="localcopy") as _pool:
+            return _pool.submit(_copy).result()
+
+    def __clone(self, previous, work):
+        with timing.span("snapshot.clone", unit=self.__unit.name,
+                         copy=self.__name):
+            return self.clone(previous, work)
+
+    def finish(self, when, work, final, result, states=None):
+        """
+        finish Cierra una instantánea
+
+        Si result['status'] no es 'error' la instantánea de trabajo pasa a
+        ser la final y la última; si no se descarta. El resultado se anota
+        en el índice de copias
+
+        Args:
+            when (datetime): fecha de la instantánea, de begin()
+            work (Path): directorio de trabajo, de begin()
+            final (Path): directorio final, de begin()
+            result (dict): resultado de la copia, con status, seconds,
+                files, bytes y size
+            states (dict): estado del origen copiado, para el diario
+
+        Returns:
+            dict: result con snapshot
+        """
+        result.setdefault('snapshot', None)
+        if result['status'] != 'error':
+            os.rename(str(work), str(final))
+            self.__set_latest(final)
+            result['snapshot'] = str(final)
+            # el diario describe siempre la última instantánea
+            if states is not None and self.__journal is not None:
+                self.__journal.save(states)
+            else:
+                Journal(self.__index.MetaDir, self.__name).remove()
+            if self.__changes is not None:
+                self.__changes.commit()
+        else:
+            shutil.rmtree(str(work), ignore_errors=True)
+            if self.__changes is not None:
+                self.__changes.rollback()
+
+        self.__record(when, result)
+        return result
+
+    @staticmethod
+    def clone(previous, target):
+        """
+        clone Copia la instantánea anterior con enlaces duros
+
+        Args:
+            previous (Path): instantánea anterior
+            target (Path): directorio de trabajo, no debe existir
+
+        Returns:
+            bool: True si se ha clonado
+        """
+        _proc = subprocess.run(["cp", "-al", str(previous),
+                                str(target)],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+        if _proc.returncode != 0:
+            shutil.rmtree(str(target), ignore_errors=True)
+            return False
+        return True
+
+    @staticmethod
+    def prune(target, changed, removed):
+        """
+        prune Prepara un clon para copiar solo lo cambiado
+
+        Borra las rutas desaparecidas y suelta los enlaces duros de lo
+        modificado: si no, se cambiarían permisos y fechas en el mismo
+        inodo que comparte la instantánea anterior
+
+        Args:
+            target (Path): clon de la instantánea anterior
+            changed (list): rutas nuevas o modificadas, ordenadas
+            removed (list): rutas desaparecidas, ordenadas
+        """
+        # en orden inverso el contenido va antes que su directorio
+        for _path in reversed(removed):
+            _file = target / _path
+            try:
+                if _file.is_dir() and not _file.is_symlink():
+                    shutil.rmtree(str(_file))
+                else:
+                    _file.unlink()
+            except FileNotFoundError:
+                pass
+        for _path in changed:
+            _file = target / _path
+            if _file.is_symlink() or _file.is_file():
+                _file.unlink()
+
+    def __parse_stats(self, output):
+        _stats = {}
+        for _key, _regexp in self.__stats.items():
+            _match = _regexp.search(output)
+            if _match is None:
+                _stats[_key] = None
+            else:
+                _stats[_key] = int(_match.group(1).replace(',', ''))
+        return _stats
+
+    def __set_latest(self, snapshot):
+        """
+        __set_latest Apunta 'latest' a la instantánea de forma atómica
+        """
+        _link = self.__root / self.Latest
+        _temp = self.__root / (self.Latest + ".tmp")
+        if _temp.is_symlink():
+            _temp.unlink()
+        os.symlink(snapshot.name, str(_temp))
+        os.replace(str(_temp), str(_link))
+
+    def __record(self, when, result):
+        """
+        __record Anota el resultado en el índice de copias
+        """
+        if self.__index.get(self.__name) is None:
+            self.__index.add(self.__name, self.__source)
+
+        _data = {
+            'last_run': when.isoformat(timespec='seconds'),
+            'status': result['status'],
+            'duration': result['seconds'],
+            'bytes': result['bytes'],
+            'files': result['files'],
+        }
+        if result['size'] is not None:
+            _data['size'] = result['size']
+        if result['snapshot'] is not None:
+            _data['snapshot'] = Path(result['snapshot']).name
+            _data['last_success'] = _data['last_run']
+        self.__index.update(self.__name, **_data)
+
+    @property
+    def Root(self):
+        return self.__root
+
+    @property
+    def Source(self):
+        return self.__source
+
+    @property
+    def Throttle(self):
+        return self.__throttle
+
+    @property
+    def Journal(self):
+        return self.__journal
+
+    @property
+    def Name(self):
+        return self.__name
+
+    @property
+    def Unit(self):
+        return self.__unit
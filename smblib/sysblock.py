@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                sysblock.py
+===============================================================================
+
+    definición de la clase SysBlockDevices
+
+    Capa de dispositivos de bloque leída directamente del núcleo y de udev,
+    sin lanzar lsblk:
+
+        /sys/block                  discos, particiones, tamaños y
+                                    volúmenes (holders) abiertos
+        /run/udev/data/b<M>:<m>     sistema de ficheros, etiqueta, UUID,
+                                    WWN, modelo y bus
+        /dev/disk/by-id, by-uuid    WWN y UUID si no hay base de udev
+        /proc/self/mountinfo        puntos de montaje
+
+    Tiene la interfaz de blkmod.BlockDevices que usan Devices y Unit
+    (ListDisks, get_disk_wwn, partitions, uuid, volume, mountpoint, mount,
+    open_volume...). Todas las rutas se leen bajo un directorio raíz, de
+    modo que se puede usar sobre una copia de prueba (bench/fakesysfs.py).
+
+"""
+
+import os
+import re
+import subprocess
+
+_OCTAL = re.compile(r'\\([0-7]{3})')
+_HEX = re.compile(r'\\x([0-9a-fA-F]{2})')
+
+
+def available(root="/"):
+    """
+    available
+
+    Returns:
+        bool: True si se puede leer /sys/block
+    """
+    return os.path.isdir(os.path.join(root, "sys/block"))
+
+
+def _read(path):
+    """
+    _read Contenido de un fichero pequeño de /sys o /run
+
+    Con os.read, sin objetos de fichero: son cientos de lecturas
+    """
+    try:
+        _fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        _data = b""
+        while True:
+            _block = os.read(_fd, 65536)
+            if not _block:
+                break
+            _data += _block
+    except OSError:
+        return None
+    finally:
+        os.close(_fd)
+    return _data.decode('utf-8', 'replace').strip()
+
+
+def _links(path):
+    """
+    _links Enlaces de un directorio /dev/disk/by-*
+
+    Returns:
+        dict: nombre del enlace -> nombre del dispositivo (sda1, dm-0...)
+    """
+    try:
+        _names = os.listdir(path)
+    except OSError:
+        return {}
+    _links = {}
+    for _name in _names:
+        try:
+            _links[_name] = os.path.basename(
+                os.readlink(os.path.join(path, _name)))
+        except OSError:
+            continue
+    return _links
+
+
+def _human(size):
+    """
+    _human Tamaño como lo muestra lsblk: 512M, 465.8G, 1T
+    """
+    _value = float(size)
+    for _unit in ("B", "K", "M", "G", "T", "P"):
+        if _value < 1024 or _unit == "P":
+            break
+        _value /= 1024
+    _text = f"{_value:.1f}"
+    if _text.endswith(".0"):
+        _text = _text[:-2]
+    return _text + ("" if _unit == "B" else _unit)
+
+
+class SysPart(object):
+    """
+    SysPart
+
+    Partición o volumen abierto (device mapper)
+    """
+    def __init__(self, devices, name, sysdir, type="part"):
+        """
+        __init__ Constructor
+
+        Args:
+            devices (SysBlockDevices): capa a la que pertenece
+            name (str): nombre del núcleo (sda1, dm-0...)
+            sysdir (str): directorio en /sys
+            type (str): part o crypt
+        """
+        super().__init__()
+
+        self.__devices = devices
+        self.name = self.kname = name
+        self.type = type
+        self.path = "/dev/" + name
+        if type == "crypt":
+            _dmname = _read(os.path.join(sysdir, "dm", "name"))
+            if _dmname:
+                self.name = _dmname
+                self.path = "/dev/mapper/" + _dmname
+        _sectors = _read(os.path.join(sysdir, "size"))
+        self.size = _human(int(_sectors) * 512) if _sectors else None
+        self.majmin = _read(os.path.join(sysdir, "dev"))
+
+        _props = devices.udev(self.majmin)
+        self.fstype = _props.get("ID_FS_TYPE") or None
+        self.label = _props.get("ID_FS_LABEL_ENC")
+        if self.label is not None:
+            self.label = _HEX.sub(lambda x: chr(int(x.group(1), 16)),
+                                  self.label)
+        else:
+            self.label = _props.get("ID_FS_LABEL") or \
+                devices.by_label(self.kname)
+        self.uuid = _props.get("ID_FS_UUID") or devices.by_uuid(self.kname)
+        self.mountpoint = devices.mountpoint(self.majmin, self.path)
+
+        # volumen abierto sobre la partición
+        self.volume = None
+        for _holder in sorted(self.__list(os.path.join(sysdir, "holders"))):
+            if _holder.startswith("dm-"):
+                self.volume = SysPart(devices, _holder,
+                                      devices.sysdir(_holder), "crypt")
+                break
+
+    @staticmethod
+    def __list(path):
+        try:
+            return os.listdir(path)
+        except OSError:
+            return []
+
+    def __str__(self):
+        return f"{self.path} {self.fstype} {self.size} " \
+            f"[{self.label}] {self.mountpoint or ''}"
+
+    def mount(self, mountpoint):
+        """
+        mount Monta el sistema de ficheros
+
+        Args:
+            mountpoint (str|Path): punto de montaje, se crea si no existe
+
+        Returns:
+            bool: True si se ha montado
+        """
+        os.makedirs(str(mountpoint), exist_ok=True)
+        _proc = subprocess.run(["mount", self.path, str(mountpoint)])
+        if _proc.returncode != 0:
+            return False
+        self.mountpoint = str(mountpoint)
+        return True
+
+    def umount(self):
+        if self.mountpoint is None:
+            return True
+        _proc = subprocess.run(["umount", self.mountpoint])
+        if _proc.returncode != 0:
+            return False
+        self.mountpoint = None
+        return True
+
+    def open_volume(self, name, key=None):
+        """
+        open_volume Abre el volumen LUKS de la partición
+
+        Sin clave cryptsetup pide la contraseña en el terminal
+
+        Args:
+            name (str): nombre del volumen en /dev/mapper
+            key (bytes): contraseña, se pasa por la entrada estándar
+                (--key-file=-)
+
+        Returns:
+            bool: True si se ha abierto
+        """
+        _cmd = ["cryptsetup", "open", self.path, name]
+        if key is not None:
+            _cmd.append("--key-file=-")
+        _proc = subprocess.run(_cmd, input=key)
+        if _proc.returncode != 0:
+            return False
+        _dm = os.path.basename(
+            os.path.realpath(self.__devices.path("dev/mapper", name)))
+        self.volume = SysPart(self.__devices, _dm, self.__devices.sysdir(_dm),
+                              "crypt")
+        return True
+
+    def close_volume(self):
+        if self.volume is None:
+            return True
+        _proc = subprocess.run(["cryptsetup", "close", self.volume.name])
+        if _proc.returncode != 0:
+            return False
+        self.volume = None
+        return True
+
+
+class SysDisk(object):
+    """
+    SysDisk
+
+    Disco con sus particiones
+    """
+    def __init__(self, devices, name, sysdir):
+        super().__init__()
+
+        self.name = self.kname = name
+        self.path = "/dev/" + name
+        self.type = "disk"
+        _sectors = _read(os.path.join(sysdir, "size"))
+        self.size = _human(int(_sectors) * 512) if _sectors else None
+        self.majmin = _read(os.path.join(sysdir, "dev"))
+
+        _props = devices.udev(self.majmin)
+        self.model = _props.get("ID_MODEL") or \
+            _read(os.path.join(sysdir, "device", "model"))
+        self.wwn = _props.get("ID_WWN_WITH_EXTENSION") or \
+            _props.get("ID_WWN") or devices.by_wwn(name)
+        if self.wwn is None:
+            _wwid = _read(os.path.join(sysdir, "device", "wwid")) or \
+                _read(os.path.join(sysdir, "wwid"))
+            if _wwid and _wwid.startswith("naa."):
+                self.wwn = "0x" + _wwid[4:].lower()
+            elif _wwid and _wwid.startswith("eui."):
+                self.wwn = _wwid.lower()
+        self.tran = self.__tran(_props, sysdir)
+
+        self.partitions = []
+        for _name in sorted(os.listdir(sysdir)):
+            # las particiones se llaman como el disco: sda1, nvme0n1p1
+            if not _name.startswith(name):
+                continue
+            _partdir = os.path.join(sysdir, _name)
+            if os.path.exists(os.path.join(_partdir, "partition")):
+                self.partitions.append(SysPart(devices, _name, _partdir))
+
+    @staticmethod
+    def __tran(props, sysdir):
+        """
+        __tran Bus del disco, como la columna TRAN de lsblk
+        """
+        _bus = props.get("ID_BUS")
+        if _bus == "ata":
+            return "sata" if props.get("ID_ATA_SATA") == "1" else "ata"
+        if _bus in ("usb", "scsi", "nvme"):
+            return _bus
+        _real = os.path.realpath(sysdir)
+        for _key, _tran in (("/usb", "usb"), ("/nvme", "nvme"),
+                            ("/ata", "sata"), ("/virtio", "virtio")):
+            if _key in _real:
+                return _tran
+        return None
+
+    def get_partition_uuid(self, uuid):
+        for _part in self.partitions:
+            if _part.uuid == uuid:
+                return _part
+        return None
+
+    find_part_with_uuid = get_partition_uuid
+
+
+class SysBlockDevices(object):
+    """
+    SysBlockDevices
+
+    Discos y particiones de /sys, udev y mountinfo
+    """
+
+    # dispositivos que no son discos de copia
+    Virtual = ("loop", "ram", "zram", "dm-", "md", "sr", "fd", "nbd")
+
+    def __init__(self, root="/"):
+        """
+        __init__ Constructor
+
+        Lee los dispositivos
+
+        Args:
+            root (str|Path): directorio raíz bajo el que están sys, dev,
+                run y proc; "/" salvo en pruebas
+        """
+        super().__init__()
+
+        self.__root = str(root)
+        self.update()
+
+    def path(self, *parts):
+        return os.path.join(self.__root, *parts)
+
+    def sysdir(self, name):
+        return self.path("sys/block", name)
+
+    def update(self):
+        """
+        update Vuelve a leer los dispositivos
+        """
+        self.__mounts = {}  # mayor:menor o ruta -> punto de montaje
+        self.__readmounts()
+        self.__uuids = self.__invert(_links(self.path("dev/disk/by-uuid")))
+        self.__labels = self.__invert(_links(self.path("dev/disk/by-label")))
+        self.__wwns = {}
+        for _link, _name in _links(self.path("dev/disk/by-id")).items():
+            if "-part" in _link:
+                continue
+            if _link.startswith("wwn-"):
+                self.__wwns.setdefault(_name, _link[4:])
+            elif _link.startswith("nvme-eui."):
+                self.__wwns.setdefault(_name, _link[5:])
+
+        self.ListDisks = []
+        try:
+            _names = sorted(os.listdir(self.path("sys/block")))
+        except OSError:
+            _names = []
+        for _name in _names:
+            if _name.startswith(self.Virtual):
+                continue
+            self.ListDisks.append(SysDisk(self, _name, self.sysdir(_name)))
+
+    @staticmethod
+    def __invert(links):
+        """
+        __invert dispositivo -> valor del enlace; los enlaces de udev
+        escapan los caracteres especiales como \\x20
+        """
+        return {
+            y: _HEX.sub(lambda m: chr(int(m.group(1), 16)), x)
+            for x, y in links.items()
+        }
+
+    def __readmounts(self):
+        try:
+            with open(self.path("proc/self/mountinfo"), 'r') as file:
+                _lines = file.readlines()
+        except OSError:
+            return
+        for _line in _lines:
+            _fields = _line.split()
+            if len(_fields) < 10 or "-" not in _fields:
+                continue
+            _mountpoint = _OCTAL.sub(lambda x: chr(int(x.group(1), 8)),
+                                     _fields[4])
+            _source = _fields[_fields.index("-") + 2]
+            # el primer montaje de cada dispositivo
+            self.__mounts.setdefault(_fields[2], _mountpoint)
+            if _source.startswith("/dev/"):
+                self.__mounts.setdefault(_source, _mountpoint)
+
+    def udev(self, majmin):
+        """
+        udev Propiedades de un dispositivo en la base de datos de udev
+
+        Args:
+            majmin (str): "mayor:menor"
+
+        Returns:
+            dict: clave -> valor de las líneas E:, vacío si no hay datos
+        """
+        if majmin is None:
+            return {}
+        _data = _read(self.path("run/udev/data", "b" + majmin))
+        _props = {}
+        for _line in (_data or "").splitlines():
+            if _line.startswith("E:") and "=" in _line:
+                _key, _value = _line[2:].split("=", 1)
+                _props[_key] = _value
+        return _props
+
+    def mountpoint(self, majmin, path):
+        _mountpoint = self.__mounts.get(majmin)
+        if _mountpoint is None:
+            _mountpoint = self.__mounts.get(path)
+        return _mountpoint
+
+    def by_uuid(self, name):
+        return self.__uuids.get(name)
+
+    def by_label(self, name):
+        return self.__labels.get(name)
+
+    def by_wwn(self, name):
+        return self.__wwns.get(name)
+
+    def get_disk_wwn(self, wwn):
+        for _disk in self.ListDisks:
+            if _disk.wwn == wwn:
+                return _disk
+        return None
+
+    def find_disk_kname(self, kname):
+        for _disk in self.ListDisks:
+            if _disk.kname == kname:
+                return _disk
+        return None
+
+    def find_usb_disks(self):
+        return [x for x in self.ListDisks if x.tran == "usb"]
+
+    @property
+    def Root(self):
+        return self.__root
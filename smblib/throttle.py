@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                throttle.py
+===============================================================================
+
+    definición de la clase Throttle
+
+    Límites de recursos de una copia: caudal de lectura del origen,
+    operaciones por segundo, peso de CPU, clase ionice y nice.
+
+    Con cgroup v2 y systemd la orden se lanza en un ámbito transitorio
+    (systemd-run --scope) con IOReadBandwidthMax, IOReadIOPSMax y
+    CPUWeight sobre el dispositivo del origen; esos límites se pueden
+    cambiar con la copia en marcha (systemctl set-property). Si no, se
+    recurre a ionice y nice y el caudal se limita con rsync --bwlimit.
+
+    Sin ámbitos no hay forma de aplicar iops ni cpu_weight, ni el caudal
+    a órdenes que no sean rsync; esos límites se omiten con un aviso.
+
+    Los límites se guardan en UnitData.limits y en la definición de cada
+    copia (<copia>.json, clave "limits"), que tiene prioridad.
+
+    Las copias dentro del proceso (FanOut) no lanzan ninguna orden: nice e
+    ionice se aplican al hilo que escribe (Throttle.apply) y el caudal se
+    limita con Pace.
+
+"""
+
+import logging
+import os
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+# datos admitidos en los límites -> comprobación del valor
+Keys = {
+    'bwlimit': lambda x: isinstance(x, int) and x > 0,  # KiB/s
+    'iops': lambda x: isinstance(x, int) and x > 0,
+    'cpu_weight': lambda x: isinstance(x, int) and 1 <= x <= 10000,
+    'ionice': lambda x: x in ("idle", "best-effort", "realtime"),
+    'nice': lambda x: isinstance(x, int) and -20 <= x <= 19
+}
+
+_IONICE = {'realtime': "1", 'best-effort': "2", 'idle': "3"}
+
+
+def check_limits(limits):
+    """
+    check_limits Valida unos límites
+
+    Args:
+        limits (dict): límites
+
+    Raises:
+        ValueError: si algún dato es desconocido o no es válido
+
+    Returns:
+        dict: los límites
+    """
+    if not isinstance(limits, dict):
+        raise ValueError
+    for _key, _value in limits.items():
+        if _key not in Keys or not Keys[_key](_value):
+            raise ValueError(f"Límite no válido: {_key}={_value}")
+    return dict(limits)
+
+
+def cgroup_available():
+    """
+    cgroup_available
+
+    Returns:
+        bool: True si se pueden crear ámbitos transitorios con límites
+    """
+    import shutil
+    return os.path.exists("/sys/fs/cgroup/cgroup.controllers") \
+        and os.path.isdir("/run/systemd/system") \
+        and os.geteuid() == 0 \
+        and shutil.which("systemd-run") is not None
+
+
+class Throttle(object):
+    """
+    Throttle
+
+    Aplicación de los límites a la orden de una copia
+    """
+
+    __count = 0
+    __lock = threading.Lock()
+
+    def __init__(self, limits, name, device, cgroup=None):
+        """
+        __init__ Constructor
+
+        Args:
+            limits (dict): límites, ver Keys
+            name (str): nombre de la copia, para el ámbito
+            device (str|Path): fichero en el dispositivo a limitar,
+                normalmente el origen
+            cgroup (bool): usar ámbitos transitorios; por defecto si
+                están disponibles
+        """
+        super().__init__()
+
+        self.__limits = check_limits(limits or {})
+        self.__device = str(device)
+        if cgroup is None:
+            cgroup = cgroup_available()
+        self.__cgroup = cgroup
+        with Throttle.__lock:
+            Throttle.__count += 1
+            _count = Throttle.__count
+        _name = "".join(x if x.isalnum() else "_" for x in name)
+        self.__scope = f"smbackup-{_name}-{os.getpid()}-{_count}.scope"
+        self.__factor = 1.0
+        self.running = False
+
+    def command(self, cmd, rsync=True):
+        """
+        command Orden con los límites aplicados
+
+        Args:
+            cmd (list): orden
+            rsync (bool): si la orden es rsync, para --bwlimit
+
+        Returns:
+            list: orden limitada
+        """
+        _cmd = list(cmd)
+        _bwlimit = self.__limits.get('bwlimit')
+        if _bwlimit is not None and rsync and not self.__cgroup:
+            _cmd.insert(1, f"--bwlimit={_bwlimit}")
+
+        if not self.__cgroup:
+            _skipped = [
+                x for x in ('iops', 'cpu_weight') if x in self.__limits
+            ]
+            if _bwlimit is not None and not rsync:
+                _skipped.insert(0, 'bwlimit')
+            if _skipped:
+                _log.warning("%s: sin ámbitos transitorios, límites omitidos: "
+                             "%s", self.__scope, ", ".join(_skipped))
+
+        if 'nice' in self.__limits:
+            _cmd = ["nice", "-n", str(self.__limits['nice'])] + _cmd
+        if 'ionice' in self.__limits:
+            _cmd = ["ionice", "-c", _IONICE[self.__limits['ionice']]] + _cmd
+
+        if self.__cgroup:
+            _cmd = ["systemd-run", "--scope", "--quiet", "--collect",
+                    f"--unit={self.__scope}"] + \
+                [f"--property={x}" for x in self.properties()] + \
+                ["--"] + _cmd
+        return _cmd
+
+    def properties(self, factor=1.0):
+        """
+        properties Propiedades systemd de los límites
+
+        Args:
+            factor (float): fracción de los límites de caudal y
+                operaciones a aplicar
+
+        Returns:
+            list: ["Propiedad=valor", ...]
+        """
+        _props = []
+        if 'bwlimit' in self.__limits:
+            _bytes = max(1, int(self.__limits['bwlimit'] * 1024 * factor))
+            _props.append(f"IOReadBandwidthMax={self.__device} {_bytes}")
+        if 'iops' in self.__limits:
+            _iops = max(1, int(self.__limits['iops'] * factor))
+            _props.append(f"IOReadIOPSMax={self.__device} {_iops}")
+        if 'cpu_weight' in self.__limits:
+            _props.append(f"CPUWeight={self.__limits['cpu_weight']}")
+        return _props
+
+    def adjust(self, factor):
+        """
+        adjust Cambia los límites de caudal con la copia en marcha
+
+        Solo con ámbitos transitorios; --bwlimit no se puede cambiar
+
+        Args:
+            factor (float): fracción de los límites configurados
+
+        Returns:
+            bool: True si se han cambiado
+        """
+        if not (self.__cgroup and self.running) or factor == self.__factor:
+            return False
+        _props = [
+            x for x in self.properties(factor) if not x.startswith("CPU")
+        ]
+        if not _props:
+            return False
+        import subprocess
+        _proc = subprocess.run(
+            ["systemctl", "set-property", "--runtime", self.__scope] +
+            _props,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        if _proc.returncode != 0:
+            return False
+        self.__factor = factor
+        return True
+
+    def apply(self):
+        """
+        apply Aplica nice e ionice al hilo actual
+
+        Para copias dentro del proceso, sin orden que limitar. El caudal
+        no se aplica aquí, ver Pace
+
+        Returns:
+            list: límites que no se han podido aplicar al hilo
+        """
+        _skipped = [x for x in ('iops', 'cpu_weight') if x in self.__limits]
+        _tid = getattr(threading, "get_native_id", lambda: None)()
+        if 'nice' in self.__limits:
+            try:
+                if _tid is None:
+                    raise OSError
+                os.setpriority(os.PRIO_PROCESS, _tid, self.__limits['nice'])
+            except OSError:
+                _skipped.append('nice')
+        if 'ionice' in self.__limits:
+            import subprocess
+            try:
+                if _tid is None:
+                    raise OSError
+                _proc = subprocess.run(
+                    ["ionice", "-c", _IONICE[self.__limits['ionice']],
+                     "-p", str(_tid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL)
+                if _proc.returncode != 0:
+                    raise OSError
+            except OSError:
+                _skipped.append('ionice')
+        return _skipped
+
+    @property
+    def adjustable(self):
+        return self.__cgroup and ('bwlimit' in self.__limits
+                                  or 'iops' in self.__limits)
+
+    @property
+    def factor(self):
+        return self.__factor
+
+    @property
+    def limits(self):
+        return dict(self.__limits)
+
+    @property
+    def Scope(self):
+        return self.__scope
+
+
+class Pace(object):
+    """
+    Pace
+
+    Limitación de caudal dentro del proceso
+    """
+    def __init__(self, bwlimit):
+        """
+        __init__ Constructor
+
+        Args:
+            bwlimit (int): caudal máximo en KiB/s
+        """
+        super().__init__()
+
+        self.__rate = bwlimit * 1024
+        self.__start = None
+        self.__bytes = 0
+
+    def wait(self, size):
+        """
+        wait Espera lo necesario para no superar el caudal
+
+        Args:
+            size (int): bytes que se van a transferir
+        """
+        _now = time.monotonic()
+        if self.__start is None:
+            self.__start = _now
+        self.__bytes += size
+        _delay = self.__start + self.__bytes / self.__rate - _now
+        if _delay > 0:
+            time.sleep(_delay)
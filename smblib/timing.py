@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                 timing.py
+===============================================================================
+
+    Medida de tiempos por fases (spans)
+
+        with timing.span("unit.mount", unit=name, disk=wwn):
+            ...
+
+    Los spans se anidan por hilo: cada uno anota su padre y su
+    profundidad. Desactivado (por defecto) span() devuelve siempre el
+    mismo objeto vacío y apenas cuesta una llamada.
+
+    Se activa con enable() o con la variable de entorno SMBACKUP_TIMING=
+    fichero; en ese caso al terminar el proceso se vuelcan los spans en
+    el fichero, un objeto JSON por línea.
+
+"""
+
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_stacks = {}  # hilo -> spans abiertos, visibles desde otros hilos
+_records = []  # spans terminados, list.append es atómico
+_ids = itertools.count(1)
+_origin = time.perf_counter()  # origen de los tiempos start
+_epoch = time.time()  # hora de _origin
+
+
+class _NullSpan(object):
+    """
+    _NullSpan Span de la medida desactivada
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class Span(object):
+    """
+    Span
+
+    Fase medida
+    """
+
+    __slots__ = ("name", "attrs", "id", "parent", "depth", "start", "end")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_ids)
+        self.parent = None
+        self.depth = 0
+        self.start = None
+        self.end = None
+
+    def __enter__(self):
+        _stack = _stacks.setdefault(threading.get_ident(), [])
+        if _stack:
+            self.parent = _stack[-1].id
+            self.depth = len(_stack)
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        _ident = threading.get_ident()
+        _stack = _stacks[_ident]
+        _stack.pop()
+        if not _stack:
+            del _stacks[_ident]
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        _thread = threading.current_thread()
+        _record = {
+            'name': self.name,
+            'id': self.id,
+            'parent': self.parent,
+            'depth': self.depth,
+            'thread': _thread.ident,
+            'thread_name': _thread.name,
+            'start': self.start - _origin,
+            'seconds': self.end - self.start
+        }
+        _record.update(self.attrs)
+        _records.append(_record)
+        return False
+
+    def set(self, **attrs):
+        """
+        set Añade datos al span en curso
+        """
+        self.attrs.update(attrs)
+
+
+def span(name, **attrs):
+    """
+    span Mide una fase
+
+    Args:
+        name (str): nombre de la fase, por ejemplo "unit.mount"
+        **attrs: datos del span (unit, disk, copy...)
+
+    Returns:
+        Span: gestor de contexto
+    """
+    if not _enabled:
+        return _NULL
+    return Span(name, attrs)
+
+
+def timed(name):
+    """
+    timed Decorador que mide cada llamada a una función
+
+    Args:
+        name (str): nombre de la fase
+    """
+    def _decorator(func):
+        def _wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, {}):
+                return func(*args, **kwargs)
+
+        _wrapper.__name__ = func.__name__
+        _wrapper.__doc__ = func.__doc__
+        return _wrapper
+
+    return _decorator
+
+
+def enable(pathfile=None):
+    """
+    enable Activa la medida
+
+    Args:
+        pathfile (str|Path): si se indica los spans se vuelcan en él al
+            terminar el proceso
+    """
+    global _enabled
+    _enabled = True
+    if pathfile is not None:
+        atexit.register(dump, pathfile)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def active(ident=None):
+    """
+    active Spans abiertos de un hilo
+
+    Args:
+        ident (int): identificador del hilo, por defecto el actual
+
+    Returns:
+        tuple: nombres de los spans, del exterior al interior
+    """
+    if ident is None:
+        ident = threading.get_ident()
+    return tuple(x.name for x in list(_stacks.get(ident, ())))
+
+
+def records():
+    """
+    records Spans terminados
+
+    Returns:
+        list: [dict, ...] con name, id, parent, depth, thread,
+        thread_name, start (segundos desde la carga del módulo), seconds
+        y los datos del span
+    """
+    return list(_records)
+
+
+def clear():
+    del _records[:]
+
+
+def dump(pathfile):
+    """
+    dump Vuelca los spans, un objeto JSON por línea
+
+    La primera línea lleva la hora de origen de los tiempos start
+
+    Args:
+        pathfile (str|Path): fichero
+    """
+    with open(str(pathfile), 'w') as file:
+        file.write(json.dumps({'epoch': _epoch, 'pid': os.getpid()}) + "\n")
+        for _record in records():
+            file.write(json.dumps(_record, default=str) + "\n")
+
+
+if os.environ.get("SMBACKUP_TIMING"):
+    enable(os.environ["SMBACKUP_TIMING"])
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+===============================================================================
+                                  trace.py
+===============================================================================
+
+    Exportación de los spans de timing
+
+    chrome_trace() escribe un fichero Chrome Trace Event (chrome://tracing,
+    Perfetto) con dos procesos:
+
+        hilos   una pista por hilo, con todos sus spans anidados
+        discos  una pista por disco de destino, con los spans que llevan
+                el dato disk (conexión, montaje, copias, trabajos)
+
+    Sampler es un perfilador por muestreo: cada intervalo anota la pila
+    de cada hilo, precedida de sus spans abiertos, y escribe las pilas
+    agregadas en formato collapsed (flamegraph.pl, speedscope):
+
+        snapshot.run;snapshot.scan;scan (journal.py:90);_scan_dir ... 42
+
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import Counter
+
+from smblib import timing
+from smblib.fileutil import atomic_write
+
+_THREADS = 1  # pid de las pistas por hilo
+_DISKS = 2  # pid de las pistas por disco
+
+
+def read_spans(pathfile):
+    """
+    read_spans Lee un volcado de timing.dump()
+
+    Args:
+        pathfile (str|Path): fichero
+
+    Returns:
+        list: spans, como timing.records()
+    """
+    with open(str(pathfile)) as file:
+        _lines = [json.loads(x) for x in file if x.strip()]
+    return [x for x in _lines if 'name' in x]
+
+
+def _meta(pid, tid, kind, name):
+    return {
+        'ph': "M",
+        'pid': pid,
+        'tid': tid,
+        'name': kind,
+        'args': {
+            'name': name
+        }
+    }
+
+
+def chrome_trace(pathfile, records=None):
+    """
+    chrome_trace Escribe los spans en formato Chrome Trace Event
+
+    Args:
+        pathfile (str|Path): fichero JSON
+        records (list): spans, por defecto timing.records()
+
+    Returns:
+        int: número de eventos escritos
+    """
+    if records is None:
+        records = timing.records()
+
+    _events = [
+        _meta(_THREADS, 0, "process_name", "hilos"),
+        _meta(_DISKS, 0, "process_name", "discos")
+    ]
+    _threads = {}  # ident -> tid
+    _disks = {}  # disco -> tid
+    _fixed = ('name', 'id', 'parent', 'depth', 'thread', 'thread_name',
+              'start', 'seconds')
+    for _record in sorted(records, key=lambda x: x['start']):
+        _tid = _threads.get(_record['thread'])
+        if _tid is None:
+            _tid = _threads[_record['thread']] = len(_threads) + 1
+            _events.append(
+                _meta(_THREADS, _tid, "thread_name", _record['thread_name']))
+        _args = {x: y for x, y in _record.items() if x not in _fixed}
+        _event = {
+            'name': _record['name'],
+            'cat': _record['name'].split('.')[0],
+            'ph': "X",
+            'ts': _record['start'] * 1e6,
+            'dur': _record['seconds'] * 1e6,
+            'pid': _THREADS,
+            'tid': _tid,
+            'args': _args
+        }
+        _events.append(_event)
+
+        _disk = _record.get('disk')
+        if _disk is None:
+            continue
+        _dtid = _disks.get(_disk)
+        if _dtid is None:
+            _dtid = _disks[_disk] = len(_disks) + 1
+            _events.append(_meta(_DISKS, _dtid, "thread_name", str(_disk)))
+        _events.append(dict(_event, pid=_DISKS, tid=_dtid))
+
+    _trace = {
+        'traceEvents': _events,
+        'displayTimeUnit': "ms",
+        'otherData': {
+            'epoch': timing._epoch,
+            'pid': os.getpid()
+        }
+    }
+    atomic_write(pathfile, json.dumps(_trace, default=str))
+    return len(_events)
+
+
+class Sampler(object):
+    """
+    Sampler
+
+    Perfilador por muestreo de pilas de todos los hilos
+    """
+
+    def __init__(self, interval=0.005, phases=None):
+        """
+        __init__ Constructor
+
+        Args:
+            interval (float): segundos entre muestras
+            phases (list): si se indica solo se muestrean los hilos con
+                alguno de estos spans abierto, p. ej. ["snapshot.scan"]
+        """
+        super().__init__()
+
+        self.__interval = interval
+        self.__phases = set(phases) if phases else None
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.stacks = Counter()  # pila collapsed -> muestras
+        self.samples = 0
+
+    def start(self):
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="sampler",
+                                         daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def __run(self):
+        _own = threading.get_ident()
+        while not self.__stop.wait(self.__interval):
+            _names = {x.ident: x.name for x in threading.enumerate()}
+            for _ident, _frame in sys._current_frames().items():
+                if _ident == _own:
+                    continue
+                _spans = timing.active(_ident)
+                if self.__phases is not None \
+                        and not self.__phases.intersection(_spans):
+                    continue
+                _stack = []
+                while _frame is not None:
+                    _code = _frame.f_code
+                    _stack.append(f"{_code.co_name} "
+                                  f"({os.path.basename(_code.co_filename)}"
+                                  f":{_code.co_firstlineno})")
+                    _frame = _frame.f_back
+                _stack.reverse()
+                _key = [_names.get(_ident, str(_ident))]
+                _key.extend(_spans)
+                _key.extend(_stack)
+                self.stacks[";".join(_key)] += 1
+            self.samples += 1
+
+    def write(self, pathfile):
+        """
+        write Escribe las pilas en formato collapsed
+
+        Args:
+            pathfile (str|Path): fichero de texto, "pila muestras" por línea
+        """
+        atomic_write(
+            pathfile, "".join(f"{x} {y}\n"
+                              for x, y in sorted(self.stacks.items())))
@@ -24,11 +24,32 @@ puede estar duplicada o no existir
 """
 
 from pathlib import Path
+import getpass
+import inspect
 import json
+import threading
+from smblib import timing
 from smblib.unitdata import UnitData
-from utiles.strutil import h2
-from blkmod.blockdevices import BlockDevices
-from blkmod.readdevice import is_volume_open
+from smblib.copyindex import CopyIndex
+from smblib.fileutil import AtomicBatch
+from smblib.devices import Devices
+
+
+# las contraseñas se piden en el terminal de una en una
+_prompt_lock = threading.Lock()
+
+
+def ask_passphrase(name):
+    """
+    ask_passphrase Pide en el terminal la contraseña de un volumen
+
+    Args:
+        name (str): nombre de la unidad
+
+    Returns:
+        bytes: contraseña
+    """
+    return getpass.getpass(f"Contraseña de la unidad {name}: ").encode()
 
 
 class Unit(UnitData):
@@ -39,11 +60,48 @@ class Unit(UnitData):
      Mantiene los datos y los procedimientos relativos a
      las unidades de copia de seguridad
     """
-    def __init__(self, name, pathUnits, defaultmount):
+
+    # datos por los que se indexan las unidades en Units
+    Indexed = ("name", "uuid", "uuidp", "wwn", "label")
+
+    def __init__(self, name, pathUnits, defaultmount, lazy=False,
+                 devices=None, catalog=None):
+        """
+        __init__ Constructor
+
+        Carga los datos de la unidad. Salvo en modo perezoso (lazy)
+        localiza además el dispositivo, abre el volumen cifrado si
+        procede y monta el sistema de ficheros.
+
+        Args:
+            name (str|UnitData): nombre de la unidad o datos
+                de una unidad nueva
+            pathUnits (str): directorio de configuración de unidades
+            defaultmount (str): punto de montaje por defecto
+            lazy (bool): si True el acceso a dispositivos se demora
+                hasta el primer uso de Disk, Part, FS o mountpoint
+            devices (Devices): instantánea de dispositivos compartida,
+                si no se indica la unidad crea la suya
+            catalog (Catalog): si se indica los datos se guardan en el
+                catálogo en lugar de en <nombre_unidad>.json
+        """
 
         super().__init__()
 
         self.__isConnected = False
+        # True cuando ya se ha intentado localizar el dispositivo
+        self.__probed = False
+        self.__disk = None
+        self.__part = None
+        self.__FS = None
+        # montado o abierto por esta unidad
+        self.__mounted = False
+        self.__opened = False
+        self.__defaultMount = None
+        self.__Devices = devices
+        self.__observer = None
+        self.__catalog = catalog
+        self.__copyIndex = None
 
         if not isinstance(pathUnits, str):
             raise ValueError
@@ -53,7 +111,13 @@ class Unit(UnitData):
             if not self.__pathUnits.is_dir():
                 raise ValueError
 
-        if isinstance(name, str):
+        if isinstance(name, UnitData):
+            # unidad nueva a partir de sus datos
+            for key in self.keys():
+                self[key] = name[key]
+            self.__pathFileUnit = self.__pathUnits / (self.name + '.json')
+
+        elif isinstance(name, str):
             # Nombre de la unidad
             self.name = name
             self.__pathFileUnit = self.__pathUnits / (name + '.json')
@@ -61,34 +125,158 @@ class Unit(UnitData):
             if self.__load_data():
                 self.__exists = True
             else:
+                # sin datos no hay dispositivo que buscar
+                self.__probed = True
                 return
 
-        self.__mountpoint = Path(defaultmount) / name
+        else:
+            raise ValueError
+
+        # nombre con el que están guardados los datos
+        self.__savedName = self.name
 
-        if self.wwn is not None:
+        self.__defaultMount = Path(defaultmount) / self.name
+        self.__mountpoint = self.__defaultMount
 
-            self.__Devices = BlockDevices()
+        if not lazy:
+            self.attach()
 
-            self.__disk = self.__Devices.get_disk_wwn(self.wwn)
-            if self.__disk is None:
-                return
+    def _changed(self, key, old, new):
+        """
+        _changed
 
-            self.__isConnected = True
+        Notifica al observador los cambios en los datos indexados.
+        Si el observador rechaza el cambio se restablece el valor anterior
+        """
+        _observer = self.__dict__.get('_Unit__observer')
+        if _observer is not None and key in self.Indexed:
+            _observer(self, key, old, new)
 
-            if not self.crypt:
-                self.__part = self.__disk.get_partition_uuid(self.uuid)
-                self.__FS = self.__part
-            else:
-                self.__part = self.__disk.get_partition_uuid(self.uuidp)
+    def watch(self, observer):
+        """
+        watch Observa los cambios
 
-                if not is_volume_open(self.name):
-                    self.__part.open_volume(self.name)
-                self.__FS = self.__part.volume
+        Args:
+            observer (callable): observer(unit, key, old, new) llamado
+                tras cambiar un dato de Indexed. None para dejar de observar
+        """
+        self.__observer = observer
 
-            if self.__FS.mountpoint is None:
-                self.__FS.mount(self.mountpoint)
-            else:
-                self.__mountpoint = self.__FS.mountpoint
+    def attach(self):
+        """
+        attach Conecta la unidad
+
+        Localiza el disco por su WWN, abre el volumen si está cifrado
+        y monta el sistema de ficheros. Solo se realiza la primera vez,
+        las siguientes devuelve el resultado memorizado.
+
+        Returns:
+            bool: True si la unidad está conectada
+        """
+        if self.__probed:
+            return self.__isConnected
+        self.__probed = True
+
+        with timing.span("unit.attach", unit=self.name,
+                         disk=self.wwn) as _span:
+            _span.set(connected=self.__attach())
+        return self.__isConnected
+
+    def __attach(self):
+        if self.wwn is None:
+            return False
+
+        if self.__Devices is None:
+            self.__Devices = Devices()
+
+        self.__disk = self.__Devices.get_disk_wwn(self.wwn)
+        if self.__disk is None:
+            return False
+
+        if not self.crypt:
+            self.__part = self.__Devices.get_partition_uuid(self.uuid)
+        else:
+            self.__part = self.__Devices.get_partition_uuid(self.uuidp)
+        if self.__part is None:
+            # disco presente pero sin la partición de la unidad
+            return False
+
+        if not self.crypt:
+            self.__FS = self.__part
+        else:
+            # la capa de dispositivos ya informa del volumen abierto
+            if self.__part.volume is None:
+                _opened = self.__open_volume()
+                if _opened is False or self.__part.volume is None:
+                    return False
+                self.__opened = True
+            self.__FS = self.__part.volume
+
+        if self.__FS.mountpoint is None:
+            with timing.span("unit.mount", unit=self.name, disk=self.wwn):
+                _mounted = self.__FS.mount(self.__mountpoint)
+            if _mounted is False:
+                return False
+            self.__mounted = True
+        else:
+            self.__mountpoint = self.__FS.mountpoint
+
+        # solo conectada si todo lo anterior ha ido bien
+        self.__isConnected = True
+        return True
+
+    def __open_volume(self):
+        """
+        __open_volume Abre el volumen cifrado
+
+        Solo se pide la contraseña con el cerrojo: la apertura, que es lo
+        lento (derivación de la clave de LUKS), se hace fuera y varias
+        unidades se abren a la vez. Si la capa de dispositivos no admite
+        la contraseña (open_volume sin key) la pide cryptsetup y toda la
+        apertura va con el cerrojo
+
+        Returns:
+            bool: resultado de open_volume
+        """
+        _key = None
+        if 'key' in inspect.signature(self.__part.open_volume).parameters:
+            with _prompt_lock:
+                _key = ask_passphrase(self.name)
+        with timing.span("unit.open_volume", unit=self.name, disk=self.wwn):
+            if _key is not None:
+                return self.__part.open_volume(self.name, key=_key)
+            with _prompt_lock:
+                return self.__part.open_volume(self.name)
+
+    def detach(self):
+        """
+        detach Desconecta la unidad
+
+        Desmonta el sistema de ficheros y cierra el volumen cifrado, solo
+        si los montó o abrió esta unidad. La siguiente consulta vuelve a
+        localizar el dispositivo.
+
+        Raises:
+            subprocess.CalledProcessError: si falla umount o cryptsetup
+        """
+        import subprocess
+        if self.__mounted:
+            subprocess.run(['umount', str(self.__mountpoint)], check=True)
+            self.__mounted = False
+        if self.__opened:
+            subprocess.run(['cryptsetup', 'close', self.name], check=True)
+            self.__opened = False
+
+        if self.__probed and self.__Devices is not None:
+            # la instantánea ya no refleja montajes ni volúmenes
+            self.__Devices.update()
+
+        self.__probed = False
+        self.__isConnected = False
+        self.__disk = None
+        self.__part = None
+        self.__FS = None
+        self.__mountpoint = self.__defaultMount
 
     def __str__(self):
         """
@@ -99,6 +287,7 @@ class Unit(UnitData):
         Returns:
             str: string formateado
         """
+        from utiles.strutil import h2
         _str = h2(f"Unidad {self.name}")
         _str += super().__str__()
 
@@ -109,35 +298,109 @@ class Unit(UnitData):
             return False
 
         try:
-            with self.__pathFileUnit.open('r') as funidad:
+            with timing.span("unit.parse", unit=self.__pathFileUnit.stem), \
+                    self.__pathFileUnit.open('r') as funidad:
                 # leo el fichero
                 data_unit = json.load(funidad)
 
         except IOError:
             return False
 
-        for key in self.keys():
-            self[key] = data_unit[key]
+        for _field in self.Fields:
+            # los datos opcionales pueden faltar
+            if _field.required or _field.name in data_unit:
+                try:
+                    self[_field.name] = data_unit[_field.name]
+                except KeyError as e:
+                    raise ValueError(f"Falta el dato {e}")
+        # recién leída, nada pendiente de guardar
+        self.clean()
         return True
 
+    def reload(self, data=None):
+        """
+        reload Vuelve a leer los datos guardados
+
+        Conserva el objeto y su conexión: la unidad sigue conectada y los
+        préstamos de MountPool siguen siendo válidos. Los índices de Units
+        se actualizan con los datos que cambien
+
+        Args:
+            data (UnitData): datos ya leídos, del catálogo; por defecto
+                se lee <nombre_unidad>.json
+
+        Raises:
+            RuntimeError: si hay datos sin guardar
+            ValueError: si el fichero está incompleto o no es válido; los
+                datos de la unidad no cambian
+        """
+        if self.dirty:
+            raise RuntimeError(f"Unidad {self.name} con datos sin guardar")
+        if data is None:
+            with timing.span("unit.parse", unit=self.__pathFileUnit.stem), \
+                    self.__pathFileUnit.open('r') as funidad:
+                _data = json.load(funidad)
+            try:
+                data = UnitData(_data)
+            except KeyError as e:
+                raise ValueError(f"Falta el dato {e}")
+            if not data.finised:
+                raise ValueError(f"Unidad {self.name} incompleta")
+
+        _values = data.to_dict()
+        for key in self.keys():
+            self[key] = _values[key]
+        self.__savedName = self.name
+        self.clean()
+
     def have_copies(self):
-        _copies = self.find_copies()
-        if _copies is None:
+        _index = self.CopyIndex
+        if _index is None:
             return None
-        if len(_copies) == 0:
-            return False
-        return True
+        return len(_index) > 0
 
     def find_copies(self):
-        if self.mountpoint is None:
+        """
+        find_copies Definiciones de copias de la unidad
+
+        Se obtienen del índice de copias, sin recorrer el directorio Meta
+
+        Returns:
+            list: [Path, ...] ficheros <copia>.json, None si no montada
+        """
+        _index = self.CopyIndex
+        if _index is None:
             return None
+        return [_index.MetaDir / (name + '.json') for name in _index.names()]
+
+    def copies(self):
+        """
+        copies Datos de las copias de la unidad
+
+        Returns:
+            list: [dict, ...] nombre, origen, última ejecución, tamaño
+            y estado de cada copia, None si no montada
+        """
+        _index = self.CopyIndex
+        if _index is None:
+            return None
+        return _index.copies()
+
+    @property
+    def CopyIndex(self):
+        """
+        CopyIndex Índice de copias
 
-        _fullMeta = Path(self.__mountpoint) / self.Meta
-        _copies = []
-        with _fullMeta.glob('*.json') as _filesMeta:
-            for _fileMeta in _filesMeta:
-                _copies.append(_fileMeta)
-        return _copies
+        Returns:
+            CopyIndex: índice de copias, None si la unidad no está montada
+        """
+        if self.mountpoint is None:
+            return None
+        _metadir = Path(self.mountpoint) / self.meta
+        if self.__copyIndex is None \
+                or self.__copyIndex.MetaDir != _metadir:
+            self.__copyIndex = CopyIndex(_metadir)
+        return self.__copyIndex
 
     @property
     def exists(self):
@@ -150,19 +413,62 @@ class Unit(UnitData):
         Returns:
             Bool: True si el fichero existe
         """
+        if self.__catalog is not None:
+            return self.__catalog.unit_exists(self.__savedName)
 
         return self.__pathFileUnit.exists()
 
-    def save(self):
+    def save(self, batch=None):
         """Salva los datos en fichero <nombre_unidad>.json
+        o en el catálogo si la unidad pertenece a uno
+
+        Solo escribe si hay datos modificados. La escritura es atómica;
+        si la unidad se ha renombrado el fichero anterior se renombra al
+        nuevo nombre en la misma operación (AtomicBatch.add), sin que
+        lleguen a existir los dos.
+
+        Args:
+            batch (AtomicBatch): si se indica la escritura, y el renombrado
+                del fichero anterior, se añaden al lote y se completan con
+                batch.commit(); si el lote se descarta no cambia nada
+
+        Returns:
+            bool: True si había algo que salvar
+
+        Raises:
+            FileExistsError: si ya hay un fichero con el nuevo nombre
         """
-        if self.modified and self.finised:
-            data = {}
-            for key in self.keys():
-                data[key] = self[key]
+        if not (self.dirty and self.finised):
+            return False
 
-            with open(self.__pathFileUnit, 'w') as file:
-                json.dump(data, file, indent=4)
+        if self.__catalog is not None:
+            self.__catalog.save_unit(self, self.__savedName)
+            self.__saved(self.__pathFileUnit)
+            return True
+
+        _pathFile = self.__pathUnits / (self.name + '.json')
+        if _pathFile != self.__pathFileUnit and _pathFile.exists():
+            raise FileExistsError(str(_pathFile))
+
+        _json = json.dumps(self.to_dict(), indent=4)
+
+        _batch = batch
+        if _batch is None:
+            _batch = AtomicBatch()
+        _batch.add(_pathFile, _json, lambda: self.__saved(_pathFile),
+                   self.__pathFileUnit)
+        if batch is None:
+            _batch.commit()
+        return True
+
+    def __saved(self, pathFile):
+        """
+        __saved Datos guardados en pathFile
+        """
+        if pathFile != self.__pathFileUnit:
+            self.__pathFileUnit = pathFile
+        self.__savedName = self.name
+        self.clean()
 
     @property
     def FileName(self):
@@ -177,37 +483,84 @@ class Unit(UnitData):
     def PathFile(self):
         return self.__pathFileUnit
 
+    @property
+    def SavedName(self):
+        """
+        SavedName Nombre con el que están guardados los datos
+
+        Returns:
+            str: nombre, distinto de name si se ha renombrado sin guardar
+        """
+        return self.__dict__.get('_Unit__savedName', self.name)
+
+    @property
+    def Catalog(self):
+        """Catálogo al que pertenece la unidad
+
+        Returns:
+            Catalog: catálogo, None si se guarda en JSON
+        """
+        return self.__catalog
+
+    @property
+    def attached(self):
+        """
+        attached
+
+        Informa si ya se ha localizado el dispositivo de la unidad,
+        sin provocar su localización
+
+        Returns:
+            bool: True si ya se ha intentado conectar
+        """
+        return self.__probed
+
     @property
     def connected(self):
-        return self.__isConnected
+        return self.attach()
+
+    @property
+    def mounted(self):
+        """
+        mounted
+
+        Punto de montaje de la unidad si ya está conectada, sin provocar
+        su localización ni su montaje
+
+        Returns:
+            Path: punto de montaje, None si no está conectada
+        """
+        if not (self.__probed and self.__isConnected):
+            return None
+        return self.__mountpoint
 
     @property
     def mountpoint(self):
-        if not self.__isConnected:
+        if not self.attach():
             return None
         return self.__mountpoint
 
     @property
     def DevPath(self):
-        if not self.__isConnected:
+        if not self.attach():
             return None
         return self.__FS.path
 
     @property
     def Disk(self):
-        if not self.__isConnected:
+        if not self.attach():
             return None
         return self.__disk
 
     @property
     def Part(self):
-        if not self.__isConnected:
+        if not self.attach():
             return None
         return self.__part
 
     @property
     def FS(self):
-        if not self.__isConnected:
+        if not self.attach():
             return None
         if self.__mountpoint is None:
             return None
@@ -3,252 +3,184 @@
 #
 
 import re
+from smblib.record import Field, Ignore, Record
+from smblib.throttle import check_limits
 from utiles.strutil import clean_str, data_line
 
+# expresiones compiladas una sola vez
+_WWN = re.compile(r"^0x[a-f0-9]{16}$")
+_UUID = re.compile(r"^[a-f0-9]{8}-[a-f0-9]{4}-4[a-f0-9]{3}-" +
+                   r"[89aAbB][a-f0-9]{3}-[a-f0-9]{12}$")
+_LABEL = re.compile(r"^([A-Za-z])\w+$", re.VERBOSE)
 
-class UnitData(object):
-    def __init__(self, data=None):
-        super().__init__()
-        if data is None:
-            for key in self.keys():
-                self[key] = None
-            self.__modified = False
-        elif isinstance(data, dict) or isinstance(data, UnitData):
-            for key in self.keys():
-                self[key] = data[key]
-            self.__modified = True
-        else:
-            raise ValueError
 
-    def __getitem__(self, key):
-        return self.__getattribute__(key)
+def _check_name(record, value):
+    return clean_str(value)
 
-    def __setitem__(self, key, value):
-        if key in self.keys():
-            self.__setattr__(key, value)
-        else:
-            raise NameError
 
-    def __len__(self):
-        lenOfData = 0
-        for key in self.keys():
-            if self[key] is not None:
-                lenOfData += 1
+def _check_wwn(record, value):
+    value = value.lower()
+    if _WWN.match(value) is None:
+        raise Ignore
+    return value
 
-        return lenOfData
 
-    def __str__(self):
-        _str = ""
-        for key in self.keys():
-            _str += data_line({'key': key, 'value': str(self[key])})
+def _check_uuid(record, value):
+    value = value.lower()
+    if _UUID.match(value) is None:
+        raise Ignore
+    return value
 
-        return _str
 
-    def keys(self):
-        return [
-            "name", "description", "wwn", "uuid", "uuidp", "label", "crypt",
-            "dirbackups", "meta"
-        ]
+def _check_label(record, value):
+    if len(value) > 16:
+        value = value[0:15]
+    if _LABEL.match(value) is None:
+        raise Ignore
+    return value
 
-    @property
-    def name(self):
-        """
+
+def _check_crypt(record, value):
+    if not isinstance(value, bool):
+        raise ValueError
+    return value
+
+
+def _check_dirbackups(record, value):
+    if value[0] == '/':
+        value = value[1:]
+    return clean_str(value)
+
+
+def _check_meta(record, value):
+    return clean_str(value)
+
+
+def _check_limits(record, value):
+    return check_limits(value)
+
+
+def _check_cache(record, value):
+    if value not in ("normal", "dontneed", "direct"):
+        raise ValueError
+    return value
+
+
+class UnitData(Record):
+
+    __slots__ = ()
+
+    Fields = (
+        Field("name",
+              _check_name,
+              mark_null=True,
+              doc="""
         Name
 
         Nombre de la unidad
 
         Returns:
             str: Nombre
-        """
-        return self.__name
-
-    @name.setter
-    def name(self, value):
-        if value is None:
-            self.__name = None
-        else:
-            self.__name = clean_str(value)
-        self.__modified = True
-
-    @property
-    def description(self):
-        return self.__description
-
-    @description.setter
-    def description(self, value):
-        self.__description = value
-        self.__modified = True
-
-    @property
-    def wwn(self):
-        return self.__wwn
-
-    @wwn.setter
-    def wwn(self, value):
-        if value is None:
-            self.__wwn = None
-            return
-        value = value.lower()
-        wwn_regexp = re.compile(r"^0x[a-f0-9]{16}$")
-        if wwn_regexp.match(value) is not None:
-            self.__wwn = value
-            self.__modified = True
-
-    @property
-    def uuid(self):
-        return self.__uuid
-
-    @uuid.setter
-    def uuid(self, value):
-        if value is None:
-            self.__uuid = None
-            return
-        value = value.lower()
-        uuid_regexp = re.compile(r"^[a-f0-9]{8}-[a-f0-9]{4}-4[a-f0-9]{3}-" +
-                                 r"[89aAbB][a-f0-9]{3}-[a-f0-9]{12}$")
-        if uuid_regexp.match(value) is not None:
-            self.__uuid = value
-            self.__modified = True
-
-    @property
-    def uuidp(self):
-        return self.__uuidp
-
-    @uuidp.setter
-    def uuidp(self, value):
-        """
+        """),
+        Field("description", mark_null=True),
+        Field("wwn", _check_wwn),
+        Field("uuid", _check_uuid),
+        Field("uuidp",
+              _check_uuid,
+              null='',
+              empty=(None, ''),
+              doc="""
         Uuidp UUID Padre
 
         UUID de la unidad padre del sistema de ficheros
         mismas caracteristicvas que el Uuid.
         corresponde al UUID accesible antes del montado
         del sistema de ficheros
-
-        Args:
-            value (str): UUID
-        """
-        if value is None or value == '':
-            self.__uuidp = ''
-            return
-
-        value = value.lower()
-        uuidp_regexp = re.compile(r"^[a-f0-9]{8}-[a-f0-9]{4}-4[a-f0-9]{3}-" +
-                                  r"[89aAbB][a-f0-9]{3}-[a-f0-9]{12}$")
-        if uuidp_regexp.match(value) is not None:
-            self.__uuidp = value
-            self.__modified = True
-
-    @property
-    def label(self):
-        return self.__label
-
-    @label.setter
-    def label(self, value):
-        if value is None:
-            self.__label = None
-            return
-
-        if len(value) > 16:
-            value = value[0:15]
-        label_regexp = re.compile(r"^([A-Za-z])\w+$", re.VERBOSE)
-        if label_regexp.match(value) is not None:
-            self.__label = value
-            self.__modified = True
-
-    @property
-    def crypt(self):
-        """
+        """),
+        Field("label", _check_label),
+        Field("crypt",
+              _check_crypt,
+              doc="""
         Crypt
 
         Determina si el sistema de ficheros está cifrado o no
 
         Returns:
             bool: True si cifrado
-        """
-        return self.__crypt
-
-    @crypt.setter
-    def crypt(self, value):
-        if value is None:
-            self.__crypt = None
-            return
-        if not isinstance(value, bool):
-            raise ValueError
-        self.__crypt = value
-        self.__modified = True
-
-    @property
-    def dirbackups(self):
-        return self.__dir_backups
-
-    @dirbackups.setter
-    def dirbackups(self, value):
-        """
+        """),
+        Field("dirbackups",
+              _check_dirbackups,
+              doc="""
         DirBackups Directorio de backups
 
         Directorio relativo al punto de montado de la unidad
         donde se almacenarán las copias
-
-        Args:
-            value (str): path relativo
-        """
-        if value is None:
-            self.__dir_backups = None
-            return
-
-        if value[0] == '/':
-            value = value[1:]
-        value = clean_str(value)
-
-        self.__dir_backups = value
-        self.__modified = True
-
-    @property
-    def meta(self):
-        return self.__meta
-
-    @meta.setter
-    def meta(self, value):
-        """
+        """),
+        Field("meta",
+              _check_meta,
+              doc="""
         Meta Directorio
 
         Directorio relativo al punto de montado de la unidad
         donde se guardaran las configuraciones de las copias
+        """),
+        Field("cache",
+              _check_cache,
+              required=False,
+              doc="""
+        Cache Uso de la caché de páginas en las copias
+
+        normal, dontneed (descartar lo copiado) o direct (además
+        O_DIRECT para ficheros grandes). Opcional, por defecto normal.
+        Solo lo aplican el motor local y FanOut; rsync lo ignora
+        """),
+        Field("limits",
+              _check_limits,
+              empty=(None, {}),
+              required=False,
+              doc="""
+        Limits Límites de recursos de las copias a la unidad
+
+        bwlimit (KiB/s), iops, cpu_weight, ionice y nice, ver Throttle.
+        La definición de cada copia puede redefinirlos. Opcional
+        """),
+    )
 
-        Args:
-            value (str): path relativo
-        """
-        if value is None:
-            self.__meta = None
-            return
-        self.__meta = clean_str(value)
-        if value[0] == '/':
-            value = value[1:]
-        self.__modified = True
-
-    @property
-    def modified(self):
-        """
-        modified
-
-        Informa si ya ha sido establecido algún dato
+    def __init__(self, data=None):
+        super().__init__()
+        if data is None:
+            self.clean()
+        elif isinstance(data, UnitData):
+            self.load_dict(data.to_dict())
+        elif isinstance(data, dict):
+            for _field in self.Fields:
+                # los datos opcionales pueden faltar
+                if _field.required or _field.name in data:
+                    self[_field.name] = data[_field.name]
+        else:
+            raise ValueError
 
-        Returns:
-            bool: True si modificado
-            None: Si aún no se ha modificado ningún dato
+    @classmethod
+    def from_dict(cls, data):
         """
-        return self.__modified
+        from_dict Registro a partir de datos ya validados
 
-    @property
-    def finised(self):
-        """
-        finised Terminado
+        Construcción rápida sin validar, para datos leídos
+        de un almacén propio como el catálogo
 
-        Informa si ya han sido establecidos todos los datos
+        Args:
+            data (dict): clave -> valor
 
         Returns:
-            bool: True si terminado
+            UnitData: registro sin datos modificados
         """
-        if len(self) == len(self.keys()):
-            return True
-        return False
+        _record = cls()
+        _record.load_dict(data, trusted=True)
+        return _record
+
+    def __str__(self):
+        _str = ""
+        for key in self.keys():
+            _str += data_line({'key': key, 'value': str(self[key])})
+
+        return _str
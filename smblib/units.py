@@ -12,11 +12,21 @@ Clase Unidades para el mantenimiento de la colección
 de unidades configuradas
 
 """
+import logging
+import os
+import select
+import threading
+import time
 from pathlib import Path
 
+from smblib import timing
+from smblib.fileutil import AtomicBatch
 from smblib.settings import Settings
+from smblib.devices import Devices
 from smblib.unit import Unit
 
+_log = logging.getLogger(__name__)
+
 
 class Units(object):
     """
@@ -25,31 +35,75 @@ class Units(object):
     Representa la colección de unidades
 
     """
-    def __init__(self):
+    def __init__(self, config=None, devices=None, catalog=None):
         """
         __init__ Constructor
 
         Obtiene la colección de Unidades
 
+        Args:
+            config (ConfigData): configuración, por defecto la compartida
+                Settings.shared()
+            devices (Devices): instantánea de dispositivos, por defecto
+                una nueva compartida por todas las unidades
+            catalog (Catalog): si se indica las unidades se leen y
+                guardan en el catálogo en lugar de en ficheros JSON; por
+                defecto el de la configuración (ConfigData.catalog), si
+                lo hay
         """
         super().__init__()
 
         # Obtiene los datos de configuración
-        self.__Config = Settings()
+        if config is None:
+            config = Settings.shared()
+        self.__Config = config
+
+        # una sola lectura de dispositivos para todas las unidades
+        if devices is None:
+            devices = Devices(backend=self.__Config.devices)
+        self.__Devices = devices
+
+        if catalog is None and self.__Config.catalog is not None:
+            from smblib.catalog import Catalog
+            catalog = Catalog(self.__Config.catalog)
+        self.__Catalog = catalog
 
         # el punto de montaje por defecto
         self.__DefaultMountPoint = self.__Config.units_mount
 
         self.__List = []  # Lista de unidades
 
-        # lee el directorio de ficheros de configuración de unidades
+        # índices de unidades
+        self.__byName = {}  # nombre -> unidad
+        self.__byUuid = {}  # uuid -> unidad
+        self.__byUuidp = {}  # uuid padre -> unidad
+        self.__byWwn = {}  # wwn -> [unidad, ...]
+        self.__byLabel = {}  # label -> [unidad, ...]
+
         self.__dirconfunits = Path(self.__Config.units_conf)
-        _filesunit = self.__dirconfunits.glob("*.json")
-        for fichero in _filesunit:
 
-            self.__List.append(
-                Unit(fichero.stem, str(self.__dirconfunits),
-                     str(self.__DefaultMountPoint)))
+        self.__lock = threading.RLock()
+        self.__files = {}  # fichero -> (unidad, (mtime_ns, size))
+        self.__invalid = {}  # fichero no válido -> (mtime_ns, size)
+        self.__version = None  # versión de datos del catálogo
+        self.__watcher = None  # hilo de vigilancia inotify
+        self.__stop = None  # tubería para detener la vigilancia
+
+        # las unidades se crean en modo perezoso: no se accede a los
+        # dispositivos hasta que se usan
+        with timing.span("units.load") as _span:
+            if self.__Catalog is not None:
+                # una sola consulta al catálogo
+                self.__version = self.__Catalog.data_version
+                for data in self.__Catalog.units():
+                    self.__append(self.__stored_unit(data))
+            else:
+                # lee el directorio de ficheros de configuración de unidades
+                for _name, _stamp in self.__scan_files().items():
+                    _unit = self.__new_unit(_name[:-len('.json')])
+                    self.__files[_name] = (_unit, _stamp)
+                    self.__append(_unit)
+            _span.set(units=len(self.__List))
 
     def __del__(self):
         """
@@ -57,8 +111,435 @@ class Units(object):
 
         Slava las unidades que se hubieran modificado
         """
-        for unit in self.List:
-            unit.save()
+        if getattr(self, '_Units__watcher', None) is not None:
+            self.unwatch()
+        # __init__ puede haber fallado antes de leer las unidades
+        if getattr(self, '_Units__List', None):
+            self.commit()
+
+    def commit(self):
+        """
+        commit Guarda las unidades modificadas
+
+        Solo escribe las unidades con datos modificados. Con ficheros JSON
+        cada una se escribe de forma atómica y todas se confirman juntas
+        con una única sincronización del directorio; con catálogo en una
+        sola transacción.
+
+        Returns:
+            int: número de unidades guardadas
+        """
+        with self.__lock:
+            _dirty = [x for x in self.__List if x.dirty and x.finised]
+            if len(_dirty) == 0:
+                return 0
+
+            if self.__Catalog is not None:
+                with self.__Catalog.transaction():
+                    for unit in _dirty:
+                        unit.save()
+                return len(_dirty)
+
+            _batch = AtomicBatch()
+            try:
+                for unit in _dirty:
+                    unit.save(_batch)
+            except BaseException:
+                _batch.rollback()
+                raise
+            _batch.commit()
+
+            for unit in _dirty:
+                self.__track(unit)
+            return len(_dirty)
+
+    def __scan_files(self):
+        """
+        __scan_files Lee el directorio de configuración de unidades
+
+        Returns:
+            dict: fichero -> (mtime_ns, size) de cada <unidad>.json
+        """
+        _stamps = {}
+        with os.scandir(str(self.__dirconfunits)) as _entries:
+            for _entry in _entries:
+                if not _entry.name.endswith('.json'):
+                    continue
+                if not _entry.is_file():
+                    continue
+                _stat = _entry.stat()
+                _stamps[_entry.name] = (_stat.st_mtime_ns, _stat.st_size)
+        return _stamps
+
+    def __track(self, unit):
+        """
+        __track Anota el estado del fichero de una unidad
+
+        Evita que refresh() vuelva a leer lo que esta colección ha escrito
+
+        Args:
+            unit (Unit): unidad recién salvada
+        """
+        for _name, _known in list(self.__files.items()):
+            if _known[0] is unit:
+                del self.__files[_name]
+
+        _path = Path(unit.PathFile)
+        try:
+            _stat = _path.stat()
+        except FileNotFoundError:
+            return
+        self.__files[_path.name] = (unit, (_stat.st_mtime_ns, _stat.st_size))
+
+    def refresh(self):
+        """
+        refresh Actualiza la colección
+
+        Vuelve a leer solo los ficheros de unidad cuyo mtime o tamaño ha
+        cambiado, añade los nuevos y retira los borrados. Con catálogo
+        se recarga solo si otro proceso lo ha modificado.
+        No vuelve a leer los dispositivos.
+
+        Las unidades ya cargadas se actualizan sobre el mismo objeto
+        (Unit.reload), sin perder su conexión. Las que tienen datos sin
+        guardar no se tocan: sus cambios prevalecen y se escribirán con
+        el siguiente commit()
+
+        Returns:
+            bool: True si ha cambiado alguna unidad
+        """
+        with self.__lock:
+            if self.__Catalog is not None:
+                return self.__refresh_catalog()
+
+            _changed = False
+            _stamps = self.__scan_files()
+
+            # borrados
+            for _name in list(self.__files):
+                if _name not in _stamps:
+                    _unit = self.__files[_name][0]
+                    if self.__pending(_unit):
+                        continue
+                    del self.__files[_name]
+                    self.__remove(_unit)
+                    _changed = True
+
+            for _name in list(self.__invalid):
+                if _name not in _stamps:
+                    del self.__invalid[_name]
+
+            # nuevos y modificados
+            for _name, _stamp in _stamps.items():
+                _known = self.__files.get(_name)
+                if _known is not None and _known[1] == _stamp:
+                    continue
+                if self.__invalid.get(_name) == _stamp:
+                    continue
+                try:
+                    if _known is None:
+                        _unit = self.__new_unit(_name[:-len('.json')])
+                        self.__append(_unit)
+                    else:
+                        _unit = _known[0]
+                        if self.__pending(_unit):
+                            continue
+                        _unit.reload()
+                except ValueError as e:
+                    # fichero a medio escribir o no válido, se vuelve a
+                    # leer cuando cambie
+                    _log.warning("Fichero de unidad %s no válido: %s", _name,
+                                 e)
+                    self.__invalid[_name] = _stamp
+                    _changed = True
+                    continue
+                self.__invalid.pop(_name, None)
+                self.__files[_name] = (_unit, _stamp)
+                _changed = True
+
+            return _changed
+
+    @staticmethod
+    def __pending(unit):
+        """
+        __pending Informa si la unidad tiene cambios sin guardar
+
+        Se avisa de que el fichero o el catálogo ha cambiado por otro lado
+        """
+        if not unit.dirty:
+            return False
+        _log.warning(
+            "Unidad %s modificada por otro proceso con cambios sin "
+            "guardar: prevalecen los cambios", unit.name)
+        return True
+
+    def __refresh_catalog(self):
+        _version = self.__Catalog.data_version
+        if _version == self.__version:
+            return False
+        self.__version = _version
+
+        _stored = {data.name: data for data in self.__Catalog.units()}
+        for _unit in list(self.__List):
+            _data = _stored.pop(_unit.SavedName, None)
+            if self.__pending(_unit):
+                continue
+            if _data is None:
+                self.__remove(_unit)
+            elif _data.to_dict() != _unit.to_dict():
+                _unit.reload(_data)
+        for _data in _stored.values():
+            self.__append(self.__stored_unit(_data))
+        return True
+
+    def watch(self):
+        """
+        watch Vigila el directorio de unidades
+
+        Arranca un hilo que espera eventos inotify sobre el directorio de
+        configuración de unidades y llama a refresh() cuando hay cambios,
+        sin sondeos periódicos.
+
+        Returns:
+            bool: True si la vigilancia está activa, False si el sistema
+            no dispone de inotify o las unidades están en un catálogo
+        """
+        if self.__watcher is not None:
+            return True
+        from smblib import inotify
+        if self.__Catalog is not None or not inotify.available():
+            return False
+
+        _inotify = inotify.Inotify()
+        _inotify.add_watch(
+            self.__dirconfunits, inotify.IN_CLOSE_WRITE
+            | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM
+            | inotify.IN_DELETE | inotify.IN_ONLYDIR)
+        self.__stop = os.pipe()
+
+        self.__watcher = threading.Thread(target=self.__watch_loop,
+                                          args=(_inotify, self.__stop[0]),
+                                          name="units-watch",
+                                          daemon=True)
+        self.__watcher.start()
+        return True
+
+    def unwatch(self):
+        """
+        unwatch Detiene la vigilancia iniciada con watch()
+        """
+        if self.__watcher is None:
+            return
+        os.write(self.__stop[1], b'x')
+        self.__watcher.join()
+        os.close(self.__stop[1])
+        self.__watcher = None
+        self.__stop = None
+
+    def __watch_loop(self, watcher, stop):
+        try:
+            while True:
+                _ready = select.select([watcher, stop], [], [])[0]
+                if stop in _ready:
+                    return
+                _events = watcher.read()
+                if not any(_event[3].endswith('.json') for _event in _events):
+                    continue
+                try:
+                    self.refresh()
+                except Exception:
+                    # la vigilancia sigue con el próximo cambio
+                    _log.exception("Error al actualizar las unidades")
+        finally:
+            watcher.close()
+            os.close(stop)
+
+    def attach_all(self, max_workers=4, timeout=None):
+        """
+        attach_all Conecta todas las unidades presentes
+
+        Abre los volúmenes cifrados y monta las unidades cuyo disco está
+        conectado, en paralelo en un grupo acotado de hilos. Un disco
+        lento o con errores no retrasa al resto.
+
+        Las contraseñas de los volúmenes cifrados se piden de una en una
+        (Unit.attach), pero las aperturas, que son lo lento, se hacen en
+        paralelo. Si la capa de dispositivos no admite la contraseña, la
+        pide cryptsetup y los volúmenes se abren de uno en uno.
+
+        Args:
+            max_workers (int): máximo de unidades conectándose a la vez
+            timeout (float): segundos de espera; las unidades que no han
+                terminado se informan con error 'timeout' y siguen en
+                segundo plano
+
+        Returns:
+            list: [{'name', 'connected', 'seconds', 'error'}, ...] una
+            entrada por unidad con disco presente
+        """
+        # lectura de dispositivos antes de repartir el trabajo
+        _present = [
+            unit for unit in self.__List
+            if self.__Devices.get_disk_wwn(unit.wwn) is not None
+        ]
+        if len(_present) == 0:
+            return []
+
+        from concurrent.futures import ThreadPoolExecutor, wait
+        _pool = ThreadPoolExecutor(max_workers=max_workers,
+                                   thread_name_prefix="attach")
+        try:
+            _futures = {
+                _pool.submit(self.__timed_attach, unit): unit
+                for unit in _present
+            }
+            _done = wait(_futures, timeout=timeout)[0]
+        finally:
+            # las pendientes siguen en segundo plano
+            _pool.shutdown(wait=False)
+
+        _results = []
+        for _future, _unit in _futures.items():
+            if _future in _done:
+                _results.append(_future.result())
+            else:
+                _results.append({
+                    'name': _unit.name,
+                    'connected': False,
+                    'seconds': timeout,
+                    'error': 'timeout'
+                })
+
+        return _results
+
+    @staticmethod
+    def __timed_attach(unit):
+        _start = time.monotonic()
+        _error = None
+        try:
+            _connected = unit.attach()
+        except Exception as e:
+            _connected = False
+            _error = f"{type(e).__name__}: {e}"
+        return {
+            'name': unit.name,
+            'connected': _connected,
+            'seconds': time.monotonic() - _start,
+            'error': _error
+        }
+
+    def __new_unit(self, source):
+        """
+        __new_unit Crea una unidad perezosa de la colección
+
+        Args:
+            source (str|UnitData): nombre o datos de la unidad
+
+        Returns:
+            Unit: la unidad
+        """
+        return Unit(source,
+                    str(self.__dirconfunits),
+                    str(self.__DefaultMountPoint),
+                    lazy=True,
+                    devices=self.__Devices,
+                    catalog=self.__Catalog)
+
+    def __stored_unit(self, data):
+        """
+        __stored_unit Crea una unidad ya guardada en el catálogo
+
+        Args:
+            data (UnitData): datos leídos del catálogo
+
+        Returns:
+            Unit: la unidad, sin datos pendientes de guardar
+        """
+        _unit = self.__new_unit(data)
+        _unit.clean()
+        return _unit
+
+    def __append(self, unit):
+        """
+        __append Añade una unidad a la lista y a los índices
+
+        Args:
+            unit (Unit): unidad
+        """
+        self.__List.append(unit)
+        for key in Unit.Indexed:
+            self.__index(unit, key, unit[key])
+        unit.watch(self.__reindex)
+
+    def __remove(self, unit):
+        """
+        __remove Retira una unidad de la lista y de los índices
+
+        Args:
+            unit (Unit): unidad
+        """
+        unit.watch(None)
+        for key in Unit.Indexed:
+            self.__unindex(unit, key, unit[key])
+        self.__List.remove(unit)
+
+    def __index(self, unit, key, value):
+        if value is None or value == '':
+            return
+        if key == 'name':
+            self.__byName[value] = unit
+        elif key == 'uuid':
+            self.__byUuid[value] = unit
+        elif key == 'uuidp':
+            self.__byUuidp[value] = unit
+        elif key == 'wwn':
+            self.__byWwn.setdefault(value, []).append(unit)
+        elif key == 'label':
+            self.__byLabel.setdefault(value, []).append(unit)
+
+    def __unindex(self, unit, key, value):
+        if value is None or value == '':
+            return
+        if key == 'name':
+            _index = self.__byName
+        elif key == 'uuid':
+            _index = self.__byUuid
+        elif key == 'uuidp':
+            _index = self.__byUuidp
+        elif key == 'wwn':
+            _index = self.__byWwn
+        elif key == 'label':
+            _index = self.__byLabel
+        else:
+            return
+
+        _entry = _index.get(value)
+        if _entry is unit:
+            del _index[value]
+        elif isinstance(_entry, list) and unit in _entry:
+            _entry.remove(unit)
+            if len(_entry) == 0:
+                del _index[value]
+
+    def __reindex(self, unit, key, old, new):
+        """
+        __reindex Mantiene los índices al cambiar un dato de una unidad
+
+        Llamado por la unidad tras modificar un dato indexado
+
+        Args:
+            unit (Unit): unidad modificada
+            key (str): dato modificado
+            old: valor anterior
+            new: valor nuevo
+
+        Raises:
+            ValueError: si el nuevo nombre ya existe
+        """
+        if key == 'name' and new in self.__byName:
+            raise ValueError(f"Ya existe una unidad con nombre {new}")
+        self.__unindex(unit, key, old)
+        self.__index(unit, key, new)
 
     def get_list_names(self):
         """Obtiene los nombres de la colección de unidades
@@ -66,10 +547,7 @@ class Units(object):
         Returns:
             list: nombres
         """
-        names = []
-        for uni in self.__List:
-            names.append(uni.name)
-        return names
+        return [uni.name for uni in self.__List]
 
     def unit_exists(self, name):  # OK
         """Comprueba si existe una unidad con nombre argumento
@@ -80,10 +558,7 @@ class Units(object):
         Returns:
             bool: True si existe, False si no
         """
-        for uni in self.__List:
-            if uni.name == name:
-                return True
-        return False
+        return name in self.__byName
 
     def get_unit(self, name):  # OK
         """Obtiene el objeto de clase Unidad con nombre argumento
@@ -94,25 +569,72 @@ class Units(object):
         Returns:
             Unidad: Objeto Unidad si existe, si no None
         """
-        for uni in self.__List:
-            if uni.name == name:
-                return uni
-        return None
+        return self.__byName.get(name)
 
-    def add_unit(self, data):  # TODO
+    def get_unit_uuid(self, uuid):
+        """Obtiene la unidad con el UUID argumento, sea el del sistema
+        de ficheros o el de la partición padre
+
+        Args:
+            uuid (string): UUID
+
+        Returns:
+            Unidad: Objeto Unidad si existe, si no None
+        """
+        if uuid is None:
+            return None
+        uuid = uuid.lower()
+        _unit = self.__byUuid.get(uuid)
+        if _unit is None:
+            _unit = self.__byUuidp.get(uuid)
+        return _unit
+
+    def get_units_wwn(self, wwn):
+        """Obtiene las unidades alojadas en el disco con el WWN argumento
+
+        Args:
+            wwn (string): WWN del disco
+
+        Returns:
+            list: [unidad, ...], vacía si ninguna
+        """
+        if wwn is None:
+            return []
+        return list(self.__byWwn.get(wwn.lower(), []))
+
+    def get_units_label(self, label):
+        """Obtiene las unidades con la etiqueta argumento
+
+        El LABEL puede estar repetido
+
+        Args:
+            label (string): etiqueta de la partición
+
+        Returns:
+            list: [unidad, ...], vacía si ninguna
+        """
+        return list(self.__byLabel.get(label, []))
+
+    def add_unit(self, data):
         """Añade una nueva unidad
 
         Args:
             data (object UnitData): Datos de la clase unidad
 
-        Raises:
-            NameError: Temporalmente sin implementar
+        Returns:
+            bool: True si añadida, False si datos incompletos
+            o nombre existente
         """
-        if data.finised:
-            _newUnit = Unit(data, self.__Config.DirUnits)
+        if not data.finised or self.unit_exists(data.name):
+            return False
+
+        _newUnit = self.__new_unit(data)
+        with self.__lock:
             _newUnit.save()
-            return True
-        return False
+            self.__append(_newUnit)
+            if self.__Catalog is None:
+                self.__track(_newUnit)
+        return True
 
     def del_unit(self, name):  # OK
         """Borra la configuración de una unidad
@@ -123,20 +645,43 @@ class Units(object):
         Returns:
             bool: True sin errores, False si no
         """
-        if not self.unit_exists(name):
+        unitToDel = self.get_unit(name)
+        if unitToDel is None:
             return False
 
-        unitToDel = self.get_unit(name)
-        fileConfUnit = Path(unitToDel.PathFile)
-        if fileConfUnit.exists():
-            fileConfUnit.unlink()
+        if self.__Catalog is not None:
+            if not self.__Catalog.del_unit(name):
+                return False
         else:
-            return False
-        for indice in range(0, len(self.__List)):
-            if self.__List[indice].Name == name:
-                del (self.__List[indice])
-                return True
-        return False
+            fileConfUnit = Path(unitToDel.PathFile)
+            if fileConfUnit.exists():
+                fileConfUnit.unlink()
+            else:
+                return False
+        with self.__lock:
+            self.__remove(unitToDel)
+            for _name, _known in list(self.__files.items()):
+                if _known[0] is unitToDel:
+                    del self.__files[_name]
+        return True
+
+    @property
+    def Devices(self):
+        """Devuelve la instantánea de dispositivos compartida
+
+        Returns:
+            Devices: dispositivos
+        """
+        return self.__Devices
+
+    @property
+    def Catalog(self):
+        """Devuelve el catálogo de unidades
+
+        Returns:
+            Catalog: catálogo, None si las unidades están en JSON
+        """
+        return self.__Catalog
 
     @property
     def List(self):  # OK
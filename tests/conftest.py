@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de smblib
+
+    uso: python3 -m pytest tests
+
+    Las pruebas de los módulos que necesitan utiles o blkmod se omiten si
+    no están instalados
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
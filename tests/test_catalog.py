@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de Catalog
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+pytest.importorskip("utiles.strutil")
+
+from smblib.catalog import Catalog  # noqa: E402
+from smblib.unitdata import UnitData  # noqa: E402
+
+
+def _unit(index, **data):
+    _data = {
+        "name": "u%d" % index,
+        "description": "unidad de pruebas",
+        "wwn": "0x%016x" % (0x5000000000000000 + index),
+        "uuid": "%08x-0000-4000-8000-%012x" % (index, index),
+        "uuidp": "",
+        "label": "UNIT%d" % index,
+        "crypt": False,
+        "dirbackups": "backups",
+        "meta": "meta"
+    }
+    _data.update(data)
+    return _data
+
+
+def _write_units(dirunits, units):
+    dirunits.mkdir()
+    for _data in units:
+        with (dirunits / (_data['name'] + ".json")).open('w') as file:
+            json.dump(_data, file)
+
+
+def test_round_trip(tmp_path):
+    _units = [_unit(0), _unit(1, limits={'bwlimit': 1024}, cache="dontneed")]
+    _write_units(tmp_path / "in", _units)
+    (tmp_path / "conf.json").write_text(json.dumps({'units_idle': 60}))
+
+    _catalog = Catalog(tmp_path / "cat.db")
+    assert _catalog.import_json(tmp_path / "in", tmp_path / "conf.json") == 2
+    assert _catalog.get_unit("u1")['limits'] == {'bwlimit': 1024}
+    assert [x.name for x in _catalog.find_units("label", "UNIT0")] == ["u0"]
+
+    assert _catalog.export_json(tmp_path / "out", tmp_path / "out.json") == 2
+    for _data in _units:
+        with (tmp_path / "out" / (_data['name'] + ".json")).open() as file:
+            _exported = json.load(file)
+        assert UnitData(_exported).to_dict() == UnitData(_data).to_dict()
+    with (tmp_path / "out.json").open() as file:
+        assert json.load(file) == {'units_idle': "60"}
+    _catalog.close()
+
+
+def test_import_skips_incomplete(tmp_path):
+    _write_units(tmp_path / "in", [_unit(0), _unit(1, name="half", wwn="")])
+    _catalog = Catalog(tmp_path / "cat.db")
+    assert _catalog.import_json(tmp_path / "in") == 1
+    assert not _catalog.unit_exists("half")
+    _catalog.close()
+
+
+def test_import_skips_invalid(tmp_path, caplog):
+    _write_units(tmp_path / "in", [_unit(0)])
+    (tmp_path / "in" / "a.json").write_text(
+        '{"name": "a", "description": "x"}')
+    (tmp_path / "in" / "b.json").write_text('{"name": "b"')
+    _catalog = Catalog(tmp_path / "cat.db")
+    with caplog.at_level("WARNING", logger="smblib.catalog"):
+        assert _catalog.import_json(tmp_path / "in") == 1
+    assert "a.json" in caplog.text and "b.json" in caplog.text
+    assert [x.name for x in _catalog.units()] == ["u0"]
+    _catalog.close()
+
+
+def test_units_from_config(tmp_path):
+    from smblib.configdata import ConfigData
+    from smblib.devices import Devices
+    from smblib.units import Units
+
+    _write_units(tmp_path / "in", [_unit(0), _unit(1)])
+    Catalog(tmp_path / "cat.db").import_json(tmp_path / "in")
+    _config = ConfigData({
+        'units_conf': str(tmp_path / "in"),
+        'units_mount': str(tmp_path / "mnt"),
+        'catalog': str(tmp_path / "cat.db")
+    })
+    _units = Units(_config, Devices(lambda: None))
+    assert _units.Catalog is not None
+    assert sorted(x.name for x in _units.List) == ["u0", "u1"]
+
+
+def test_export_failure_keeps_files(tmp_path):
+    _catalog = Catalog(tmp_path / "cat.db")
+    _catalog.save_unit(UnitData(_unit(0)))
+    _out = tmp_path / "out"
+    _out.mkdir()
+    (_out / "u0.json").write_text("anterior")
+    # el fichero de configuración no se puede escribir
+    with pytest.raises(OSError):
+        _catalog.export_json(_out, tmp_path / "missing" / "conf.json")
+    assert (_out / "u0.json").read_text() == "anterior"
+    assert sorted(x.name for x in _out.iterdir()) == ["u0.json"]
+    _catalog.close()
+
+
+def test_add_columns(tmp_path):
+    # catálogo de una versión anterior, sin los datos opcionales
+    _db = sqlite3.connect(str(tmp_path / "cat.db"))
+    _db.executescript("""
+        CREATE TABLE units (
+            name TEXT PRIMARY KEY, description TEXT, wwn TEXT, uuid TEXT,
+            uuidp TEXT, label TEXT, crypt INTEGER, dirbackups TEXT,
+            meta TEXT);
+        INSERT INTO units VALUES ('u0', 'antigua', '0x5000000000000000',
+            '00000000-0000-4000-8000-000000000000', '', 'UNIT0', 0,
+            'backups', 'meta');
+    """)
+    _db.commit()
+    _db.close()
+
+    _catalog = Catalog(tmp_path / "cat.db")
+    _old = _catalog.get_unit("u0")
+    assert _old['description'] == "antigua"
+    assert _old['limits'] is None
+    _catalog.save_unit(UnitData(_unit(1, limits={'bwlimit': 1})))
+    assert _catalog.get_unit("u1")['limits'] == {'bwlimit': 1}
+    _catalog.close()
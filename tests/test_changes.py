@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de ChangeLog y de su uso por Snapshot
+"""
+
+from smblib.changes import ChangeLog
+from smblib.copyindex import CopyIndex
+from smblib.snapshot import Snapshot
+
+
+class _Unit(object):
+    """
+    _Unit Unidad ya montada en un directorio, lo que usa Snapshot
+    """
+    dirbackups = "Backups"
+    limits = None
+    cache = None
+
+    def __init__(self, name, mountpoint):
+        self.name = name
+        self.wwn = "0x" + name
+        self.mountpoint = mountpoint
+        (mountpoint / "Meta").mkdir(parents=True)
+        self.CopyIndex = CopyIndex(mountpoint / "Meta")
+
+
+def _tracker(source, dirchanges):
+    _log = ChangeLog(source, dirchanges)
+    _log.hold()
+    return _log
+
+
+def test_take_requires_consumer(tmp_path):
+    _log = ChangeLog(tmp_path, tmp_path / "changes")
+    try:
+        _log.take()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("take sin consumidor")
+
+
+def test_first_take_is_full(tmp_path):
+    _tracker(tmp_path, tmp_path / "changes")
+    _log = ChangeLog(tmp_path, tmp_path / "changes", consumer="u0/data")
+    assert _log.take() is None
+    _log.commit()
+    assert _log.take() == {}
+
+
+def test_untracked_is_full(tmp_path):
+    _log = ChangeLog(tmp_path, tmp_path / "changes", consumer="u0/data")
+    _log.take()
+    _log.commit()
+    ChangeLog(tmp_path, tmp_path / "changes").add([("a", False)])
+    assert _log.take() is None
+
+
+def test_consumers_have_own_cursor(tmp_path):
+    _changes = tmp_path / "changes"
+    _writer = _tracker(tmp_path, _changes)
+    _logs = [ChangeLog(tmp_path, _changes, consumer=x)
+             for x in ("u0/data", "u1/data")]
+    for _log in _logs:
+        _log.take()
+        _log.commit()
+
+    _writer.add([("a", False), ("dir", True)])
+    assert _logs[0].take() == {"a": False, "dir": True}
+    _logs[0].commit()
+    assert _logs[1].take() == {"a": False, "dir": True}
+    _logs[1].commit()
+    assert _logs[0].take() == {}
+
+
+def test_rollback_returns_paths(tmp_path):
+    _changes = tmp_path / "changes"
+    _writer = _tracker(tmp_path, _changes)
+    _log = ChangeLog(tmp_path, _changes, consumer="u0/data")
+    _log.take()
+    _log.commit()
+    _writer.add([("a", False)])
+    assert _log.take() == {"a": False}
+    _writer.add([("b", False)])
+    _log.rollback()
+    assert _log.take() == {"a": False, "b": False}
+
+
+def test_rollback_of_full_keeps_full(tmp_path):
+    _changes = tmp_path / "changes"
+    _tracker(tmp_path, _changes)
+    _log = ChangeLog(tmp_path, _changes, consumer="u0/data")
+    assert _log.take() is None
+    _log.rollback()
+    assert _log.take() is None
+
+
+def test_mark_full(tmp_path):
+    _changes = tmp_path / "changes"
+    _writer = _tracker(tmp_path, _changes)
+    _log = ChangeLog(tmp_path, _changes, consumer="u0/data")
+    _log.take()
+    _log.commit()
+    _writer.mark_full()
+    assert _log.take() is None
+
+
+def test_two_units_same_source(tmp_path):
+    _source = tmp_path / "source"
+    _source.mkdir()
+    (_source / "a").write_text("v1")
+    _changes = tmp_path / "changes"
+    _writer = _tracker(_source, _changes)
+    _units = [_Unit(f"unit{x}", tmp_path / f"unit{x}") for x in range(2)]
+    for _unit in _units:
+        _unit.CopyIndex.add("data", str(_source))
+
+    def _run(unit):
+        return Snapshot(unit,
+                        "data",
+                        journal=True,
+                        engine="local",
+                        changes=ChangeLog(_source,
+                                          _changes,
+                                          consumer=f"{unit.name}/data")).run()
+
+    for _unit in _units:
+        assert _run(_unit)['status'] == 'ok'
+
+    (_source / "a").write_text("v2-changed")
+    _writer.add([("a", False)])
+    for _unit in _units:
+        _result = _run(_unit)
+        assert _result['status'] == 'ok'
+        assert _result['mode'] == 'changes'
+        assert _result['changed'] == 1
+        _latest = _unit.mountpoint / "Backups" / "data" / Snapshot.Latest
+        assert (_latest / "a").read_text() == "v2-changed"
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de CopyIndex
+"""
+
+import json
+import os
+
+from smblib.copyindex import CopyIndex
+
+
+def test_missing_metadir(tmp_path):
+    _index = CopyIndex(tmp_path / "Meta")
+    assert _index.names() == []
+    assert _index.copies() == []
+    assert len(_index) == 0
+    assert _index.get("data") is None
+    assert not (tmp_path / "Meta").exists()
+
+
+def test_add_creates_metadir(tmp_path):
+    _index = CopyIndex(tmp_path / "Meta")
+    _index.add("data", "/srv/data")
+    assert _index.names() == ["data"]
+    assert CopyIndex(tmp_path / "Meta").get("data")['source'] == "/srv/data"
+
+
+def test_update_and_remove(tmp_path):
+    _index = CopyIndex(tmp_path)
+    _index.add("data", "/srv/data")
+    _index.update("data", status="ok", size=10)
+    _reread = CopyIndex(tmp_path).get("data")
+    assert (_reread['status'], _reread['size']) == ("ok", 10)
+    assert _index.remove("data")
+    assert not _index.remove("data")
+    assert CopyIndex(tmp_path).names() == []
+
+
+def test_external_definition_read_only(tmp_path):
+    _index = CopyIndex(tmp_path)
+    _index.add("data", "/srv/data")
+    _index.update("data", status="ok")
+    _saved = (tmp_path / CopyIndex.FileName).read_bytes()
+
+    # definición añadida por su cuenta: el índice se reconstruye en
+    # memoria, sin escribir en el directorio Meta
+    with (tmp_path / "etc.json").open('w') as file:
+        json.dump({'source': "/etc"}, file)
+    _mtime = os.stat(str(tmp_path)).st_mtime_ns
+    _reader = CopyIndex(tmp_path)
+    assert sorted(_reader.names()) == ["data", "etc"]
+    assert _reader.get("data")['status'] == "ok"
+    assert _reader.get("etc")['source'] == "/etc"
+    assert (tmp_path / CopyIndex.FileName).read_bytes() == _saved
+    assert os.stat(str(tmp_path)).st_mtime_ns == _mtime
+
+    # la siguiente escritura guarda el índice reconstruido
+    _reader.update("etc", status="ok")
+    with (tmp_path / CopyIndex.FileName).open() as file:
+        assert sorted(json.load(file)['copies']) == ["data", "etc"]
+
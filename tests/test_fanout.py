@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de FanOut
+"""
+
+import errno
+import logging
+import os
+from types import SimpleNamespace
+
+from smblib.copyindex import CopyIndex
+from smblib.fanout import FanOut
+from smblib.localcopy import LocalCopy
+
+
+def _unit(root, name, cache="normal", limits=None):
+    _mount = root / name
+    (_mount / "Meta").mkdir(parents=True)
+    return SimpleNamespace(name=name,
+                           wwn=name,
+                           mountpoint=str(_mount),
+                           dirbackups="Backups",
+                           CopyIndex=CopyIndex(_mount / "Meta"),
+                           cache=cache,
+                           limits=limits)
+
+
+def _source(root):
+    _src = root / "src"
+    (_src / "sub").mkdir(parents=True)
+    (_src / "a.txt").write_bytes(b"a" * 1000)
+    (_src / "sub" / "b.bin").write_bytes(b"b" * 64 * 1024)
+    return _src
+
+
+def test_copies_to_every_unit(tmp_path):
+    _src = _source(tmp_path)
+    _units = [_unit(tmp_path, "u1"), _unit(tmp_path, "u2")]
+    _fan = FanOut(_units, "data", _src)
+    assert all(x.Journal is None for x in _fan.Snapshots)
+    _results = _fan.run()
+    for _name in ("u1", "u2"):
+        assert _results[_name]['status'] == 'ok'
+        _snap = tmp_path / _results[_name]['snapshot']
+        assert (_snap / "sub" / "b.bin").read_bytes() == b"b" * 64 * 1024
+
+    # con diario si se pide
+    _fan = FanOut(_units, "data", _src, journal=True)
+    assert all(x.Journal is not None for x in _fan.Snapshots)
+    assert all(x['status'] == 'ok' for x in _fan.run().values())
+
+
+def test_unit_cache(tmp_path, monkeypatch):
+    _dropped = []
+    monkeypatch.setattr(LocalCopy, "drop",
+                        staticmethod(lambda fd, length=0: _dropped.append(fd)))
+    _src = _source(tmp_path)
+    _results = FanOut([_unit(tmp_path, "u1", cache="dontneed")], "data",
+                      _src).run()
+    assert _results['u1']['status'] == 'ok'
+    assert len(_dropped) == 2
+
+    # sin descartes con el uso de caché normal
+    _dropped.clear()
+    FanOut([_unit(tmp_path, "u2")], "data", _src).run()
+    assert _dropped == []
+
+
+def test_unit_limits(tmp_path, caplog):
+    _src = _source(tmp_path)
+    _units = [
+        _unit(tmp_path, "u1", limits={'bwlimit': 256, 'iops': 10}),
+        _unit(tmp_path, "u2")
+    ]
+    with caplog.at_level(logging.WARNING, logger="smblib.fanout"):
+        _results = FanOut(_units, "data", _src).run()
+    assert all(x['status'] == 'ok' for x in _results.values())
+    # 65 KiB a 256 KiB/s
+    assert _results['u1']['seconds'] >= 0.2
+    assert "u1" in caplog.text and "iops" in caplog.text
+    assert "u2" not in caplog.text
+
+
+def test_unit_error_isolated(tmp_path, monkeypatch):
+    _src = _source(tmp_path)
+    os.symlink("a.txt", str(_src / "link"))
+    _units = [_unit(tmp_path, "u1"), _unit(tmp_path, "u2")]
+    _symlink = os.symlink
+
+    # la escritura en u1 falla, la de u2 no
+    def _full(src, dst):
+        if "/u1/" in dst:
+            raise OSError(errno.ENOSPC, "sin espacio")
+        _symlink(src, dst)
+
+    monkeypatch.setattr(os, "symlink", _full)
+    _results = FanOut(_units, "data", _src).run()
+    assert _results['u1']['status'] == 'error'
+    assert "link" in _results['u1']['error']
+    assert _results['u2']['status'] == 'ok'
+    assert os.readlink(str(tmp_path / _results['u2']['snapshot'] /
+                           "link")) == "a.txt"
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de fileutil
+"""
+
+import os
+import threading
+
+import pytest
+
+from smblib.fileutil import AtomicBatch, atomic_write
+
+
+def test_atomic_write_keeps_mode(tmp_path):
+    _file = tmp_path / "data"
+    atomic_write(_file, "uno")
+    assert os.stat(str(_file)).st_mode & 0o777 == 0o644
+    os.chmod(str(_file), 0o600)
+    atomic_write(_file, b"dos")
+    assert _file.read_text() == "dos"
+    assert os.stat(str(_file)).st_mode & 0o777 == 0o600
+    assert os.listdir(str(tmp_path)) == ["data"]
+
+
+def test_concurrent_writers(tmp_path):
+    _file = tmp_path / "data"
+    _errors = []
+
+    def _write(index):
+        try:
+            for _ in range(50):
+                atomic_write(_file, ("%d" % index) * 4096)
+        except Exception as e:
+            _errors.append(e)
+
+    _threads = [threading.Thread(target=_write, args=(x, )) for x in range(8)]
+    for _thread in _threads:
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+    assert _errors == []
+    _data = _file.read_text()
+    assert _data == _data[0] * 4096
+    assert os.listdir(str(tmp_path)) == ["data"]
+
+
+def test_batch_rollback(tmp_path):
+    _batch = AtomicBatch()
+    _batch.add(tmp_path / "a", "a")
+    assert len(_batch) == 1
+    _batch.rollback()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_batch_commit_callbacks(tmp_path):
+    _called = []
+    _batch = AtomicBatch()
+    _batch.add(tmp_path / "a", "a", lambda: _called.append("a"))
+    _batch.add(tmp_path / "b", "b")
+    assert _batch.commit() == 2
+    assert _called == ["a"]
+    assert sorted(os.listdir(str(tmp_path))) == ["a", "b"]
+
+
+def test_batch_rename(tmp_path, monkeypatch):
+    (tmp_path / "old").write_text("old")
+    (tmp_path / "other").write_text("other")
+    _batch = AtomicBatch()
+    _batch.add(tmp_path / "new", "new", rename=tmp_path / "old")
+    assert _batch.commit() == 1
+    assert sorted(os.listdir(str(tmp_path))) == ["new", "other"]
+    assert (tmp_path / "new").read_text() == "new"
+
+    # un fallo tras el renombrado nunca deja los dos ficheros
+    _replace = os.replace
+
+    def _fail(src, dst):
+        if src.endswith(".tmp"):
+            raise OSError("corte")
+        _replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", _fail)
+    _batch = AtomicBatch()
+    _batch.add(tmp_path / "last", "last", rename=tmp_path / "new")
+    with pytest.raises(OSError):
+        _batch.commit()
+    assert sorted(os.listdir(str(tmp_path))) == ["last", "other"]
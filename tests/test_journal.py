@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de Journal, scan y compare
+"""
+
+import os
+
+from smblib.journal import FileState, Journal, compare, scan
+
+
+def _tree(root):
+    (root / "dir" / "sub").mkdir(parents=True)
+    (root / "a.txt").write_text("a")
+    (root / "dir" / "b.txt").write_text("bb")
+    (root / "dir" / "sub" / "c.txt").write_text("ccc")
+    os.symlink("a.txt", str(root / "link"))
+    return root
+
+
+def test_scan(tmp_path):
+    _states = scan(_tree(tmp_path / "src"))
+    assert sorted(_states) == [
+        "a.txt", "dir", "dir/b.txt", "dir/sub", "dir/sub/c.txt", "link"
+    ]
+    assert _states["dir"].type == 'd'
+    assert _states["link"].type == 'l'
+    assert (_states["dir/b.txt"].type, _states["dir/b.txt"].size) == ('f', 2)
+    assert "x/a.txt" in scan(tmp_path / "src", prefix="x/")
+    assert scan(tmp_path / "missing") == {}
+
+
+def test_save_load(tmp_path):
+    _states = scan(_tree(tmp_path / "src"))
+    _states["nombre con\ttab"] = FileState('f', 1, 2, 3, 4)
+    _journal = Journal(tmp_path, "data")
+    assert _journal.load() is None and not _journal.exists
+    _journal.save(_states)
+    assert _journal.exists
+    assert Journal(tmp_path, "data").load() == _states
+    _journal.remove()
+    assert not _journal.exists
+    assert Journal(tmp_path, "data").load() is None
+
+
+def test_diff(tmp_path):
+    _src = _tree(tmp_path / "src")
+    _journal = Journal(tmp_path, "data")
+    assert _journal.diff(scan(_src)) is None
+    _journal.save(scan(_src))
+    assert _journal.diff(scan(_src)) == ([], [])
+
+    (_src / "a.txt").write_text("changed")
+    (_src / "dir" / "sub" / "c.txt").unlink()
+    (_src / "new.txt").write_text("n")
+    # cambio de tipo: en las dos listas
+    os.unlink(str(_src / "link"))
+    (_src / "link").mkdir()
+    _changed, _removed = _journal.diff(scan(_src))
+    assert "a.txt" in _changed and "new.txt" in _changed
+    assert "link" in _changed and "link" in _removed
+    assert "dir/sub/c.txt" in _removed
+    assert _changed == sorted(_changed) and _removed == sorted(_removed)
+
+
+def test_apply(tmp_path):
+    _src = _tree(tmp_path / "src")
+    _journal = Journal(tmp_path, "data")
+    assert _journal.apply(_src, {"a.txt": False}) is None
+    _journal.save(scan(_src))
+
+    (_src / "a.txt").write_text("changed")
+    (_src / "dir" / "sub" / "c.txt").unlink()
+    (_src / "dir" / "sub" / "d.txt").write_text("d")
+    os.rename(str(_src / "dir" / "b.txt"), str(_src / "dir" / "e.txt"))
+    # como las anotaría ChangeTracker: también el directorio del renombre
+    _states = _journal.apply(_src, {
+        "a.txt": False,
+        "dir": False,
+        "dir/sub": True,
+        "dir/b.txt": False,
+        "dir/e.txt": False
+    })
+    assert _states == scan(_src)
+
+    # un directorio borrado se lleva su contenido
+    (_src / "dir" / "sub" / "d.txt").unlink()
+    (_src / "dir" / "sub").rmdir()
+    _states = _journal.apply(_src, {"dir/sub": False})
+    assert "dir/sub/c.txt" not in _states and "dir/sub" not in _states
+
+
+def test_compare(tmp_path):
+    _src = _tree(tmp_path / "src")
+    _old = scan(_src)
+    # mismo tamaño y fecha: sin cambios aunque cambie el inodo
+    _new = dict(_old)
+    _new["a.txt"] = _old["a.txt"]._replace(ino=0, ctime=0)
+    assert compare(_old, _new) == ([], [])
+
+    _new["a.txt"] = _old["a.txt"]._replace(size=10)
+    _new["link"] = _old["link"]._replace(type='d')
+    del _new["dir/b.txt"]
+    assert compare(_old, _new) == (["a.txt", "link"], ["dir/b.txt", "link"])
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de LocalCopy
+"""
+
+import os
+
+from smblib.localcopy import LocalCopy
+
+
+def _tree(source):
+    (source / "dir").mkdir(parents=True)
+    (source / "a").write_text("uno")
+    (source / "dir" / "b").write_text("dos" * 1000)
+    os.link(str(source / "dir" / "b"), str(source / "b2"))
+    os.link(str(source / "dir" / "b"), str(source / "dir" / "b3"))
+    os.symlink("a", str(source / "l"))
+    return ["a", "b2", "dir", "dir/b", "dir/b3", "l"]
+
+
+def test_copy_tree(tmp_path):
+    _paths = _tree(tmp_path / "src")
+    (tmp_path / "dst").mkdir()
+    _result = LocalCopy().copy(tmp_path / "src", tmp_path / "dst", _paths)
+    assert _result['error'] is None
+    assert _result['vanished'] == []
+    assert (tmp_path / "dst" / "a").read_text() == "uno"
+    assert os.readlink(str(tmp_path / "dst" / "l")) == "a"
+    assert (tmp_path / "dst" / "dir" / "b3").read_text() == "dos" * 1000
+
+
+def test_copy_keeps_hard_links(tmp_path):
+    _paths = _tree(tmp_path / "src")
+    (tmp_path / "dst").mkdir()
+    _result = LocalCopy().copy(tmp_path / "src", tmp_path / "dst", _paths)
+    assert (_result['files'], _result['links']) == (2, 2)
+    assert _result['bytes'] == 3 + 3000
+    _inodes = {
+        os.stat(str(tmp_path / "dst" / x)).st_ino
+        for x in ("b2", "dir/b", "dir/b3")
+    }
+    assert len(_inodes) == 1
+    assert os.stat(str(tmp_path / "dst" / "b2")).st_nlink == 3
+
+
+def test_vanished(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "dst").mkdir()
+    _result = LocalCopy().copy(tmp_path / "src", tmp_path / "dst",
+                               ["missing"])
+    assert _result['vanished'] == ["missing"]
+    assert _result['error'] is None
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de MountPool
+"""
+
+import subprocess
+import time
+
+from smblib.mountpool import MountPool
+
+
+class _Unit(object):
+    """
+    _Unit Unidad cuyo desmontaje falla las primeras veces
+    """
+    def __init__(self, name, failures=0):
+        self.name = name
+        self.mountpoint = "/mnt/" + name
+        self.attached = False
+        self.failures = failures
+        self.detached = 0
+
+    def attach(self):
+        self.attached = True
+        return True
+
+    def detach(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise subprocess.CalledProcessError(32, ["umount", self.mountpoint])
+        self.attached = False
+        self.detached += 1
+
+
+def test_lease_and_expire():
+    _pool = MountPool(0.01)
+    _unit = _Unit("u0")
+    with _pool.lease(_unit) as _mountpoint:
+        assert _mountpoint == "/mnt/u0"
+        assert _pool.refs(_unit) == 1
+    assert _pool.refs(_unit) == 0
+    time.sleep(0.1)
+    assert _unit.detached == 1
+
+
+def test_expire_retries_failed_detach():
+    _pool = MountPool(0.02)
+    _unit = _Unit("u0", failures=2)
+    _pool.acquire(_unit)
+    _pool.release(_unit)
+    _deadline = time.monotonic() + 2
+    while _unit.detached == 0 and time.monotonic() < _deadline:
+        time.sleep(0.01)
+    assert _unit.detached == 1
+    assert _unit.failures == 0
+
+
+def test_close_tries_every_unit():
+    _pool = MountPool(60)
+    _units = [_Unit("u0", failures=1), _Unit("u1"), _Unit("u2", failures=1)]
+    for _unit in _units:
+        _pool.acquire(_unit)
+        _pool.release(_unit)
+    _errors = _pool.close()
+    assert sorted(_errors) == ["u0", "u2"]
+    assert isinstance(_errors["u0"], subprocess.CalledProcessError)
+    assert [x.detached for x in _units] == [0, 1, 0]
+    assert [x.attached for x in _units] == [True, False, True]
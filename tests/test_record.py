@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de Record y Field
+"""
+
+import pytest
+
+from smblib.record import Field, Ignore, Record
+
+
+def _positive(record, value):
+    if not isinstance(value, int):
+        raise ValueError
+    if value <= 0:
+        raise Ignore
+    return value
+
+
+class _Data(Record):
+    __slots__ = ()
+    Fields = (
+        Field("name"),
+        Field("size", _positive),
+        Field("tags", null=[], empty=(None, []), required=False),
+        Field("note", required=False, mark_null=True),
+    )
+
+
+class _Watched(_Data):
+    __slots__ = ("seen", )
+
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+
+    def _changed(self, key, old, new):
+        if new == "veto":
+            raise RuntimeError
+        self.seen.append((key, old, new))
+
+
+def test_fields():
+    assert _Data().keys() == ("name", "size", "tags", "note")
+    _data = _Data()
+    assert _data.to_dict() == {
+        'name': None,
+        'size': None,
+        'tags': [],
+        'note': None
+    }
+    # tags tiene valor nulo distinto de None
+    assert len(_data) == 1
+    assert not _data.modified and not _data.finised
+
+
+def test_dirty_tracking():
+    _data = _Data()
+    _data.name = "u1"
+    assert _data.dirty == frozenset(["name"]) and _data.modified
+    assert not _data.finised
+    _data["size"] = 10
+    assert _data.dirty == frozenset(["name", "size"])
+    assert _data.finised and len(_data) == 3
+
+    _data.clean()
+    assert _data.dirty == frozenset() and not _data.modified
+    assert _data.finised
+
+
+def test_empty_values():
+    _data = _Data()
+    # vacío sin mark_null: nulo y sin modificar
+    _data.tags = None
+    assert _data.tags == [] and not _data.modified
+    # vacío con mark_null: modificado
+    _data.note = None
+    assert _data.dirty == frozenset(["note"])
+    _data.clean()
+    _data.name = "u1"
+    _data.size = 1
+    assert _data.finised
+    # vaciar un dato necesario deja el registro sin terminar
+    _data.name = None
+    assert _data.name is None and not _data.finised
+    assert _data.dirty == frozenset(["name", "size"])
+
+
+def test_check():
+    _data = _Data()
+    _data.size = 5
+    _data.clean()
+    # Ignore conserva el valor anterior sin modificar
+    _data.size = -1
+    assert _data.size == 5 and not _data.modified
+    with pytest.raises(ValueError):
+        _data.size = "big"
+    assert _data.size == 5
+    with pytest.raises(NameError):
+        _data["unknown"] = 1
+
+
+def test_load_dict():
+    _data = _Data()
+    _data.load_dict({'name': "u1", 'size': 3, 'other': 1})
+    assert _data.dirty == frozenset(["name", "size"]) and _data.finised
+
+    # datos de confianza: sin validar ni marcar
+    _trusted = _Data()
+    _trusted.load_dict({'name': "u2", 'size': -4}, trusted=True)
+    assert _trusted.size == -4 and _trusted.finised
+    assert not _trusted.modified
+    _trusted.load_dict({'name': None}, trusted=True)
+    assert not _trusted.finised
+
+
+def test_changed():
+    _data = _Watched()
+    _data.name = "u1"
+    _data.name = "u1"
+    _data.size = 2
+    assert _data.seen == [("name", None, "u1"), ("size", None, 2)]
+    _data.clean()
+
+    # si _changed falla el cambio se deshace
+    with pytest.raises(RuntimeError):
+        _data.name = "veto"
+    assert _data.name == "u1" and not _data.modified
+    assert not _Data._watched and _Watched._watched
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de Snapshot sin rsync real
+"""
+
+import logging
+import threading
+from types import SimpleNamespace
+
+from smblib.copyindex import CopyIndex
+from smblib.localcopy import LocalCopy
+from smblib.snapshot import Snapshot
+
+
+def _unit(root, name="u1", cache="normal", limits=None):
+    _mount = root / name
+    (_mount / "Meta").mkdir(parents=True)
+    return SimpleNamespace(name=name,
+                           wwn=name,
+                           mountpoint=str(_mount),
+                           dirbackups="Backups",
+                           CopyIndex=CopyIndex(_mount / "Meta"),
+                           cache=cache,
+                           limits=limits)
+
+
+def _source(root):
+    _src = root / "src"
+    _src.mkdir()
+    (_src / "a.bin").write_bytes(b"a" * 64 * 1024)
+    return _src
+
+
+def test_local(tmp_path):
+    _result = Snapshot(_unit(tmp_path), "data", _source(tmp_path),
+                       engine="local").run()
+    assert _result['status'] == 'ok'
+    assert (tmp_path / _result['snapshot'] / "a.bin").stat().st_size == \
+        64 * 1024
+
+
+def test_local_limits(tmp_path, caplog, monkeypatch):
+    _threads = []
+    _copy = LocalCopy.copy
+
+    def _record(self, *args):
+        _threads.append(threading.current_thread())
+        return _copy(self, *args)
+
+    monkeypatch.setattr(LocalCopy, "copy", _record)
+    _unit1 = _unit(tmp_path, limits={'bwlimit': 256, 'iops': 10})
+    with caplog.at_level(logging.WARNING, logger="smblib.snapshot"):
+        _result = Snapshot(_unit1, "data", _source(tmp_path),
+                           engine="local").run()
+    assert _result['status'] == 'ok'
+    # 64 KiB a 256 KiB/s
+    assert _result['seconds'] >= 0.2
+    assert "iops" in caplog.text
+    # en un hilo propio, no en el que llama
+    assert _threads and _threads[0] is not threading.current_thread()
+
+
+def test_rsync_warns_cache(tmp_path, caplog):
+    _snap = Snapshot(_unit(tmp_path, cache="dontneed"), "data",
+                     _source(tmp_path), rsync="false")
+    with caplog.at_level(logging.WARNING, logger="smblib.snapshot"):
+        assert _snap.run()['status'] == 'error'
+    assert "dontneed" in caplog.text and "rsync" in caplog.text
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de SysBlockDevices y Devices sobre un árbol /sys de prueba
+"""
+
+import sys
+import types
+
+import pytest
+
+from bench.fakelsblk import FakeBlockDevices, FakeDisk, make_lsblk
+from bench.fakelsblk import make_uuid, make_wwn
+from bench.fakesysfs import make_sysfs
+from smblib import sysblock
+from smblib.devices import Devices
+from smblib.sysblock import SysBlockDevices
+
+
+@pytest.mark.parametrize("udev", [True, False])
+def test_disks(tmp_path, udev):
+    make_sysfs(tmp_path, 3, udev=udev)
+    _devices = SysBlockDevices(tmp_path)
+    assert [x.name for x in _devices.ListDisks] == ["sda", "sdb", "sdc"]
+    for index, _disk in enumerate(_devices.ListDisks):
+        assert _disk.wwn == make_wwn(index)
+        assert len(_disk.partitions) == 1
+        _part = _disk.partitions[0]
+        assert (_part.name, _part.uuid) == (_disk.name + "1", make_uuid(index))
+        assert _part.label == "UNIT%d" % index
+        assert _part.volume is None and _part.mountpoint is None
+    assert _devices.get_disk_wwn(make_wwn(1)).name == "sdb"
+    assert _devices.ListDisks[0].get_partition_uuid(make_uuid(0)) \
+        is _devices.ListDisks[0].partitions[0]
+
+
+def test_usb(tmp_path):
+    make_sysfs(tmp_path, 2)
+    assert len(SysBlockDevices(tmp_path).find_usb_disks()) == 2
+
+
+@pytest.mark.parametrize("udev", [True, False])
+def test_crypt(tmp_path, udev):
+    make_sysfs(tmp_path, 2, udev=udev, crypt=(1, ))
+    _part = SysBlockDevices(tmp_path).ListDisks[1].partitions[0]
+    # UUID de la partición LUKS; el volumen abierto tiene el suyo
+    assert _part.uuid == make_uuid(1)
+    assert _part.volume is not None
+    assert (_part.volume.type, _part.volume.name) == ("crypt", "unit1")
+    assert _part.volume.path == "/dev/mapper/unit1"
+    assert _part.volume.uuid == make_uuid(1 + (1 << 32))
+    # los volúmenes dm-* no se listan como discos
+    assert len(SysBlockDevices(tmp_path).ListDisks) == 2
+
+
+def test_mounted(tmp_path):
+    _mounted = {0: "/mnt/unit 0", 2: "/mnt/unit2"}
+    make_sysfs(tmp_path, 3, crypt=(2, ), mounted=_mounted)
+    _disks = SysBlockDevices(tmp_path).ListDisks
+    assert _disks[0].partitions[0].mountpoint == "/mnt/unit 0"
+    assert _disks[1].partitions[0].mountpoint is None
+    # montado el volumen abierto, no la partición
+    assert _disks[2].partitions[0].mountpoint is None
+    assert _disks[2].partitions[0].volume.mountpoint == "/mnt/unit2"
+
+
+def test_update(tmp_path):
+    make_sysfs(tmp_path, 2)
+    _devices = SysBlockDevices(tmp_path)
+    # disco desconectado
+    (tmp_path / "sys/block/sdb").rename(tmp_path / "sdb")
+    assert len(_devices.ListDisks) == 2
+    _devices.update()
+    assert [x.name for x in _devices.ListDisks] == ["sda"]
+
+
+def test_devices_sysfs(tmp_path):
+    make_sysfs(tmp_path, 2)
+    _calls = []
+
+    def _source():
+        _calls.append(1)
+        return SysBlockDevices(tmp_path)
+
+    _devices = Devices(_source)
+    assert not _devices.scanned and _calls == []
+    assert _devices.get_disk_wwn(make_wwn(1).upper()).name == "sdb"
+    assert _devices.get_partition_uuid(make_uuid(0)).name == "sda1"
+    assert _devices.get_disk_wwn(make_wwn(5)) is None
+    assert _devices.get_partition_uuid(None) is None
+    assert _calls == [1]
+
+    _devices.update()
+    assert not _devices.scanned
+    assert len(_devices.ListDisks) == 2
+    assert _calls == [1, 1]
+
+
+def test_devices_unknown_backend():
+    with pytest.raises(ValueError):
+        Devices(backend="udisks")
+
+
+def test_devices_default_sysfs(tmp_path, monkeypatch):
+    make_sysfs(tmp_path, 1)
+    monkeypatch.setattr(sysblock, "available", lambda root="/": True)
+    monkeypatch.setattr(sysblock, "SysBlockDevices",
+                        lambda: SysBlockDevices(tmp_path))
+    assert Devices().get_disk_wwn(make_wwn(0)).name == "sda"
+
+
+@pytest.fixture
+def lsblk(tmp_path, monkeypatch):
+    """
+    lsblk blkmod.blockdevices.BlockDevices leyendo un fichero de
+    make_lsblk, para comprobar qué capa elige Devices
+    """
+    _pathfile = tmp_path / "lsblk.json"
+    make_lsblk(_pathfile, 2)
+    _module = types.ModuleType("blkmod.blockdevices")
+    _module.BlockDevices = lambda: FakeBlockDevices(_pathfile)
+    monkeypatch.setitem(sys.modules, "blkmod", types.ModuleType("blkmod"))
+    monkeypatch.setitem(sys.modules, "blkmod.blockdevices", _module)
+    return _pathfile
+
+
+def test_devices_lsblk_fallback(lsblk, monkeypatch):
+    monkeypatch.setattr(sysblock, "available", lambda root="/": False)
+    _devices = Devices()
+    assert _devices.get_disk_wwn(make_wwn(1)).name == "sd1"
+    assert _devices.get_partition_uuid(make_uuid(0)).name == "sd01"
+
+
+def test_devices_lsblk_backend(lsblk, monkeypatch):
+    # la capa pedida aunque /sys/block sea legible
+    monkeypatch.setattr(sysblock, "available", lambda root="/": True)
+    _devices = Devices(backend="lsblk")
+    assert isinstance(_devices.ListDisks[0], FakeDisk)
+    assert _devices.get_disk_wwn(make_wwn(0)).name == "sd0"
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de Throttle
+"""
+
+import logging
+
+import pytest
+
+from smblib.throttle import Throttle, check_limits
+
+
+def test_check_limits():
+    assert check_limits({'bwlimit': 100}) == {'bwlimit': 100}
+    with pytest.raises(ValueError):
+        check_limits({'bwlimit': 0})
+    with pytest.raises(ValueError):
+        check_limits({'unknown': 1})
+
+
+def test_fallback_command():
+    _limits = {'bwlimit': 100, 'nice': 10, 'ionice': "idle"}
+    _throttle = Throttle(_limits, "x", "/", cgroup=False)
+    assert _throttle.command(["rsync", "-a"]) == [
+        "ionice", "-c", "3", "nice", "-n", "10", "rsync", "--bwlimit=100",
+        "-a"
+    ]
+
+
+def test_fallback_warns_skipped(caplog):
+    _throttle = Throttle({'iops': 10, 'cpu_weight': 50}, "x", "/",
+                         cgroup=False)
+    with caplog.at_level(logging.WARNING, logger="smblib.throttle"):
+        assert _throttle.command(["rsync"]) == ["rsync"]
+    assert "iops" in caplog.text and "cpu_weight" in caplog.text
+
+    caplog.clear()
+    _throttle = Throttle({'bwlimit': 100}, "x", "/", cgroup=False)
+    with caplog.at_level(logging.WARNING, logger="smblib.throttle"):
+        assert _throttle.command(["cp"], rsync=False) == ["cp"]
+        assert "bwlimit" in caplog.text
+        caplog.clear()
+        _throttle.command(["rsync"])
+    assert caplog.text == ""
+
+
+def test_cgroup_no_warning(caplog):
+    _throttle = Throttle({'iops': 10, 'bwlimit': 100}, "x", "/dev/sda",
+                         cgroup=True)
+    with caplog.at_level(logging.WARNING, logger="smblib.throttle"):
+        _cmd = _throttle.command(["rsync"])
+    assert caplog.text == ""
+    assert "--property=IOReadIOPSMax=/dev/sda 10" in _cmd
+    assert "--bwlimit=100" not in _cmd
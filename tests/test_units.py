@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+# ·
+"""
+    Pruebas de Unit y Units sobre ficheros JSON, sin dispositivos
+"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("utiles.strutil")
+
+from smblib.configdata import ConfigData  # noqa: E402
+from smblib.devices import Devices  # noqa: E402
+from smblib.fileutil import AtomicBatch  # noqa: E402
+from smblib.units import Units  # noqa: E402
+from smblib import unit as unit_module  # noqa: E402
+
+
+def _uuid(index):
+    return "%08x-0000-4000-8000-%012x" % (index, index)
+
+
+def _wwn(index):
+    return "0x%016x" % (0x5000000000000000 + index)
+
+
+def _make_units(dirunits, nunits, crypt=()):
+    for index in range(nunits):
+        _data = {
+            "name": "u%d" % index,
+            "description": "unidad de pruebas",
+            "wwn": _wwn(index),
+            "uuid": _uuid(index),
+            "uuidp": _uuid(index + 1000) if index in crypt else "",
+            "label": "UNIT%d" % index,
+            "crypt": index in crypt,
+            "dirbackups": "backups",
+            "meta": "meta"
+        }
+        with (dirunits / ("u%d.json" % index)).open('w') as file:
+            json.dump(_data, file)
+
+
+class _NoDevices(object):
+    """
+    _NoDevices Capa de dispositivos sin discos
+    """
+    ListDisks = []
+
+
+class _Part(object):
+    """
+    _Part Partición que anota las aperturas y montajes simultáneos
+    """
+    def __init__(self, uuid, log, volume=None):
+        self.uuid = uuid
+        self.volume = volume
+        self.mountpoint = None
+        self.__log = log
+
+    def open_volume(self, name, key=None):
+        self.__log.enter('open')
+        time.sleep(0.05)
+        self.key = key
+        self.volume = _Part(None, self.__log)
+        self.__log.leave('open')
+        return True
+
+    def mount(self, mountpoint):
+        self.__log.enter('mount')
+        time.sleep(0.05)
+        self.mountpoint = str(mountpoint)
+        self.__log.leave('mount')
+        return True
+
+
+class _PromptPart(_Part):
+    """
+    _PromptPart Capa que no admite la contraseña: la pide cryptsetup
+    """
+    def open_volume(self, name):
+        return super().open_volume(name)
+
+
+class _Disk(object):
+    def __init__(self, wwn, partitions):
+        self.wwn = wwn
+        self.partitions = partitions
+
+
+class _Log(object):
+    """
+    _Log Máximo de operaciones simultáneas de cada tipo
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__running = {}
+        self.peak = {}
+
+    def enter(self, kind):
+        with self.__lock:
+            self.__running[kind] = self.__running.get(kind, 0) + 1
+            self.peak[kind] = max(self.peak.get(kind, 0),
+                                  self.__running[kind])
+
+    def leave(self, kind):
+        with self.__lock:
+            self.__running[kind] -= 1
+
+
+@pytest.fixture
+def units(tmp_path):
+    _dirunits = tmp_path / "units"
+    _dirunits.mkdir()
+    _make_units(_dirunits, 3)
+    _config = ConfigData({
+        'units_conf': str(_dirunits),
+        'units_mount': str(tmp_path / "mnt")
+    })
+    return Units(_config, Devices(_NoDevices))
+
+
+def _stored(units, name):
+    with (units.List[0].PathFile.parent / (name + ".json")).open() as file:
+        return json.load(file)
+
+
+def test_rename_in_rolled_back_batch(units):
+    _unit = units.get_unit("u0")
+    _dir = _unit.PathFile.parent
+    _unit.name = "a0"
+    _batch = AtomicBatch()
+    _unit.save(_batch)
+    _batch.rollback()
+    # nada ha cambiado en disco
+    assert (_dir / "u0.json").exists()
+    assert not (_dir / "a0.json").exists()
+    assert _unit.dirty
+
+    assert units.commit() == 1
+    assert not (_dir / "u0.json").exists()
+    assert _stored(units, "a0")["name"] == "a0"
+    assert _unit.PathFile == _dir / "a0.json"
+    assert units.commit() == 0
+
+
+def test_rename_to_existing_file(units):
+    _unit = units.get_unit("u0")
+    (_unit.PathFile.parent / "a0.json").write_text("{}")
+    _unit.name = "a0"
+    with pytest.raises(FileExistsError):
+        units.commit()
+    assert (_unit.PathFile.parent / "u0.json").exists()
+    _unit.name = "u0"
+
+
+def _attach_crypt(tmp_path, part):
+    _dirunits = tmp_path / "units"
+    _dirunits.mkdir()
+    _crypt = (0, 1, 2, 3)
+    _make_units(_dirunits, 8, crypt=_crypt)
+    _log = _Log()
+    _parts = [
+        (part if x in _crypt else _Part)(
+            _uuid(x + 1000) if x in _crypt else _uuid(x), _log)
+        for x in range(8)
+    ]
+    _disks = [_Disk(_wwn(x), [_parts[x]]) for x in range(8)]
+
+    class _Devices(object):
+        ListDisks = _disks
+
+    _units = Units(
+        ConfigData({
+            'units_conf': str(_dirunits),
+            'units_mount': str(tmp_path / "mnt")
+        }), Devices(_Devices))
+    _results = _units.attach_all(max_workers=4)
+    assert len(_results) == 8
+    assert all(x['connected'] for x in _results), _results
+    return _log, _parts[:4]
+
+
+def test_attach_all_prompts_one_at_a_time(tmp_path, monkeypatch):
+    _prompts = _Log()
+
+    def _ask(name):
+        _prompts.enter('prompt')
+        time.sleep(0.01)
+        _prompts.leave('prompt')
+        return b"clave-" + name.encode()
+
+    monkeypatch.setattr(unit_module, "ask_passphrase", _ask)
+    _log, _crypt = _attach_crypt(tmp_path, _Part)
+    assert _prompts.peak['prompt'] == 1
+    # las aperturas con la contraseña ya pedida van en paralelo
+    assert _log.peak['open'] > 1
+    assert _log.peak['mount'] > 1
+    assert sorted(x.key for x in _crypt) == [
+        b"clave-u%d" % x for x in range(4)
+    ]
+
+
+def test_attach_all_cryptsetup_prompt(tmp_path, monkeypatch):
+    monkeypatch.setattr(unit_module, "ask_passphrase", None)
+    _log, _crypt = _attach_crypt(tmp_path, _PromptPart)
+    # cryptsetup pide la contraseña: aperturas de una en una
+    assert _log.peak['open'] == 1
+    assert _log.peak['mount'] > 1
+
+
+def _rewrite(units, name, **data):
+    _path = units.get_unit(name).PathFile
+    with _path.open() as file:
+        _data = json.load(file)
+    _data.update(data)
+    with _path.open('w') as file:
+        json.dump(_data, file)
+    # otra fecha aunque la escritura caiga en el mismo instante
+    _stat = _path.stat()
+    os.utime(str(_path), ns=(_stat.st_atime_ns, _stat.st_mtime_ns + 10**9))
+
+
+def test_indexes(units):
+    _unit = units.get_unit("u1")
+    assert units.get_unit_uuid(_uuid(1).upper()) is _unit
+    assert units.get_units_wwn(_wwn(1)) == [_unit]
+    assert units.get_units_label("UNIT1") == [_unit]
+
+    _unit.label = "OTHER"
+    assert units.get_units_label("UNIT1") == []
+    assert units.get_units_label("OTHER") == [_unit]
+    with pytest.raises(ValueError):
+        _unit.name = "u2"
+    assert _unit.name == "u1"
+    assert units.get_unit("u1") is _unit
+
+
+def test_commit_only_dirty(units):
+    assert units.commit() == 0
+    units.get_unit("u1").description = "cambiada"
+    assert units.commit() == 1
+    assert _stored(units, "u1")["description"] == "cambiada"
+    assert units.commit() == 0
+    assert not units.refresh()
+
+
+def test_refresh(units):
+    _dir = units.List[0].PathFile.parent
+    _make_units(_dir, 4)
+    (_dir / "u0.json").unlink()
+    assert units.refresh()
+    assert sorted(units.get_list_names()) == ["u1", "u2", "u3"]
+    assert units.get_unit_uuid(_uuid(3)) is units.get_unit("u3")
+    assert not units.refresh()
+
+
+def test_refresh_keeps_object(units):
+    _unit = units.get_unit("u1")
+    _rewrite(units, "u1", label="NEWLABEL")
+    assert units.refresh()
+    assert units.get_unit("u1") is _unit
+    assert _unit.label == "NEWLABEL"
+    assert not _unit.dirty
+    assert units.get_units_label("NEWLABEL") == [_unit]
+    assert units.get_units_label("UNIT1") == []
+
+
+def test_refresh_keeps_dirty(units):
+    _unit = units.get_unit("u1")
+    _unit.description = "sin guardar"
+    _rewrite(units, "u1", label="NEWLABEL")
+    units.refresh()
+    assert units.get_unit("u1") is _unit
+    assert _unit.description == "sin guardar"
+    assert _unit.label == "UNIT1"
+    assert units.commit() == 1
+    assert _stored(units, "u1")["description"] == "sin guardar"
+
+
+def test_refresh_partial_file(units):
+    _unit = units.get_unit("u1")
+    _unit.PathFile.write_text('{"name": "u1"')
+    units.refresh()
+    assert units.get_unit("u1") is _unit
+    assert _unit.label == "UNIT1"
+
+
+def test_refresh_new_invalid_file(units, caplog):
+    _dir = units.List[0].PathFile.parent
+    (_dir / "a.json").write_text('{"name": "a", "description": "x"}')
+    with caplog.at_level("WARNING", logger="smblib.units"):
+        units.refresh()
+        assert "a.json" in caplog.text and "wwn" in caplog.text
+        # no se vuelve a leer ni a avisar hasta que cambie
+        caplog.clear()
+        assert not units.refresh()
+        assert caplog.text == ""
+    assert units.get_unit("a") is None
+
+    # completo, se carga
+    _data = _stored(units, "u0")
+    _data.update(name="a", wwn=_wwn(9), uuid=_uuid(9))
+    (_dir / "a.json").write_text(json.dumps(_data))
+    assert units.refresh()
+    assert units.get_unit("a").wwn == _wwn(9)
+
+
+def test_watch_survives_invalid_file(units, monkeypatch):
+    if not units.watch():
+        pytest.skip("sin inotify")
+    _dir = units.List[0].PathFile.parent
+
+    # un error inesperado no detiene la vigilancia
+    def _fail():
+        raise KeyError("wwn")
+
+    monkeypatch.setattr(units, "refresh", _fail)
+    (_dir / "a.json").write_text("{}")
+    time.sleep(0.2)
+    monkeypatch.undo()
+
+    _data = _stored(units, "u0")
+    _data.update(name="a", wwn=_wwn(9), uuid=_uuid(9))
+    (_dir / "a.json").write_text(json.dumps(_data))
+    for _ in range(50):
+        if units.get_unit("a") is not None:
+            break
+        time.sleep(0.05)
+    units.unwatch()
+    assert units.get_unit("a") is not None
+
+
+@pytest.mark.filterwarnings(
+    "error::pytest.PytestUnraisableExceptionWarning")
+def test_del_after_failed_init(tmp_path):
+    with pytest.raises(Exception):
+        Units(ConfigData({'units_mount': str(tmp_path)}), Devices(_NoDevices))
+
+
+def test_refresh_catalog(tmp_path):
+    from smblib.catalog import Catalog
+    from smblib.unitdata import UnitData
+
+    _dirunits = tmp_path / "units"
+    _dirunits.mkdir()
+    _make_units(_dirunits, 2)
+    Catalog(tmp_path / "cat.db").import_json(_dirunits)
+    _config = ConfigData({
+        'units_conf': str(_dirunits),
+        'units_mount': str(tmp_path / "mnt")
+    })
+    _units = Units(_config, Devices(_NoDevices),
+                   Catalog(tmp_path / "cat.db"))
+    _u0 = _units.get_unit("u0")
+    _u1 = _units.get_unit("u1")
+    _u1.description = "sin guardar"
+
+    # otro proceso modifica el catálogo
+    _other = Catalog(tmp_path / "cat.db")
+    _data = _other.get_unit("u0")
+    _data.label = "NEWLABEL"
+    _other.save_unit(_data)
+    _data = _other.get_unit("u1")
+    _data.label = "NEWLABEL1"
+    _other.save_unit(_data)
+    _data = UnitData(_other.get_unit("u0").to_dict())
+    _data.name = "u2"
+    _data.uuid = _uuid(2)
+    _other.save_unit(_data)
+    _other.close()
+
+    assert _units.refresh()
+    assert _units.get_unit("u0") is _u0
+    assert _u0.label == "NEWLABEL"
+    assert _units.get_unit("u1") is _u1
+    assert _u1.description == "sin guardar"
+    assert sorted(_units.get_list_names()) == ["u0", "u1", "u2"]
+    assert _units.commit() == 1